@@ -10,17 +10,36 @@ alpha_adapter.py — Online Alpha Reliability Tracker
 手法: Exponential Weighted Moving Average (EWMA) による
       各αの「発火時の的中率」追跡。
       的中率が高いαほど重みを増やし、低いαは減衰させる。
+
+入力: analyze() の alpha_matrix（艇 × αソースの加法寄与。正 = ブースト、負 = ペナルティ）を直接読む。
+      alpha_matrix のない古い結果だけ reasons の文字列から判定する。
+
+保存: update() ごとの全書き換えを避けるため、まとめて適用して1回だけ書く
+      batch() / update_many() と、flush_every / flush_interval による定期書き出しを用意。
+      書き込みは一時ファイル → os.replace（途中で落ちても壊れたJSONを残さない）。
+
+再構築: 結果付きアーカイブ全体から state を作り直す（1レースずつ update() しない）。
+      日ごとの αソース寄与を alpha_matrices() で一括計算（--workers でプロセス並列）し、
+      発火/的中の集計と EWMA の系列をソースごとの配列演算で求める。
+      python alpha_adapter.py rebuild --archive race_data_archive [--from YYYYMMDD] [--to YYYYMMDD]
+          [--workers 4] [--by-venue] [--ewma 0.05] [--min-samples 10] [--dry-run]
 """
 import json
 import os
+import re
 import math
+import time
+from contextlib import contextmanager
 from datetime import datetime, date
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
 from collections import defaultdict
 
+import numpy as np
+
 STATE_FILE = "alpha_reliability.json"
+BY_VENUE_FILE = "alpha_reliability_by_venue.json"
 
-# αソースの識別子リスト（rtpt_engine.pyのreasonsから抽出）
+# αソースの識別子リスト（rtpt_engine.ALPHA_SOURCES と同順 = alpha_matrix の列順）
 ALPHA_SOURCES = [
     "VoidExploit",    # Wall Decay (ΔST) — 外側有利
     "WallDecay",      # Wall Decay — 内側不利（大）
@@ -40,6 +59,10 @@ EWMA_ALPHA = 0.05  # 直近20レース相当の半減期
 MIN_SAMPLES = 10    # 最低サンプル数（これ未満は信頼度1.0固定）
 DEFAULT_RELIABILITY = 1.0
 
+# _is_boost 用のα表記パターン（加法ベース / 乗法ベース）
+_ADD_PATTERN = re.compile(r'→(?:C\d+)?([+-][\d.]+)')
+_MULT_PATTERN = re.compile(r'×([\d.]+)')
+
 
 class AlphaReliabilityTracker:
     """
@@ -62,9 +85,20 @@ class AlphaReliabilityTracker:
     }
     """
 
-    def __init__(self, state_file: str = STATE_FILE):
+    def __init__(self, state_file: str = STATE_FILE, flush_every: int = 1,
+                 flush_interval: Optional[float] = None):
+        """
+        flush_every: 未保存の update がこの件数に達したら保存（1 = 従来どおり毎回）
+        flush_interval: 前回保存からこの秒数が経っていたら件数に関係なく保存（ライブ運用向け）
+        batch() の中ではどちらも保留し、抜けた時に1回だけ保存する。
+        """
         self.state_file = state_file
         self.state = self._load_state()
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = flush_interval
+        self._dirty = 0
+        self._batch_depth = 0
+        self._last_flush = time.monotonic()
 
     def _load_state(self) -> dict:
         if os.path.exists(self.state_file):
@@ -85,8 +119,47 @@ class AlphaReliabilityTracker:
         }
 
     def _save_state(self):
-        with open(self.state_file, 'w', encoding='utf-8') as f:
+        tmp = self.state_file + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
             json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.state_file)
+        self._dirty = 0
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        """未保存の更新があれば保存"""
+        if self._dirty:
+            self._save_state()
+
+    def _maybe_flush(self):
+        if self._batch_depth:
+            return
+        if self._dirty >= self.flush_every or (
+                self.flush_interval is not None
+                and time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    @contextmanager
+    def batch(self):
+        """
+        with tracker.batch():  中の update() はメモリ上だけで適用し、抜けた時に1回保存する。
+        例外で抜けた場合も、それまでに適用したレース分は保存する（入れ子可）。
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush()
+
+    def update_many(self, pairs: Iterable[Tuple[dict, dict]]) -> int:
+        """(analysis_result, actual_result) の列をまとめて適用して1回だけ保存。適用したレース数を返す"""
+        n = 0
+        with self.batch():
+            for analysis_result, actual_result in pairs:
+                n += self._apply(analysis_result, actual_result)
+        return n
 
     def get_reliability(self, alpha_source: str) -> float:
         """αソースの現在の信頼度を取得"""
@@ -108,63 +181,77 @@ class AlphaReliabilityTracker:
 
         analysis_result: rtpt_engine.analyze() の戻り値
         actual_result: {"1st": int, "2nd": int, "3rd": int}
+        保存は flush_every / flush_interval に従う（batch() 内では保留）
         """
+        if self._apply(analysis_result, actual_result):
+            self._maybe_flush()
+
+    def _apply(self, analysis_result: dict, actual_result: dict) -> int:
+        """1レース分の結果をメモリ上の state に反映（保存はしない）。反映したら 1"""
         if not analysis_result or not actual_result:
-            return
+            return 0
 
-        boats = analysis_result.get("boats", [])
-        winner = actual_result.get("1st", 0)
         top3 = {actual_result.get("1st", 0),
                 actual_result.get("2nd", 0),
                 actual_result.get("3rd", 0)}
-
-        for boat_info in boats:
-            bn = boat_info["boat"]
-            reasons = boat_info.get("reasons", [])
-
-            for reason in reasons:
+        now = datetime.now().isoformat()
+
+        for bn, alpha_src, is_boost in self._fires(analysis_result):
+            if alpha_src not in self.state:
+                self.state[alpha_src] = self._default_entry()
+
+            entry = self.state[alpha_src]
+
+            # 的中判定
+            if is_boost:
+                # ブーストα → この艇が3着以内なら的中
+                hit = bn in top3
+            else:
+                # ペナルティα → この艇が3着以外なら的中
+                hit = bn not in top3
+
+            # EWMA更新
+            entry["total_fires"] += 1
+            if hit:
+                entry["hits"] += 1
+
+            old_rate = entry["ewma_hit_rate"]
+            new_obs = 1.0 if hit else 0.0
+            entry["ewma_hit_rate"] = (1 - EWMA_ALPHA) * old_rate + EWMA_ALPHA * new_obs
+
+            # 信頼度更新
+            if entry["total_fires"] >= MIN_SAMPLES:
+                # EWMA的中率が0.5（ランダム）より高ければ信頼度UP
+                # 0.5より低ければ信頼度DOWN
+                rate = entry["ewma_hit_rate"]
+                # 0.5をベースラインとして、乖離を信頼度に変換
+                # rate=0.7 → reliability=1.4, rate=0.3 → reliability=0.6
+                entry["reliability"] = max(0.5, min(1.5, rate * 2.0))
+
+            entry["last_updated"] = now
+
+        self._dirty += 1
+        return 1
+
+    def _fires(self, analysis_result: dict) -> List[Tuple[int, str, bool]]:
+        """
+        発火したαの [(艇番, αソース, ブーストか)]（艇番順 → ALPHA_SOURCES 順）。
+        alpha_matrix があれば寄与の符号で判定し、なければ reasons の文字列から判定する。
+        """
+        matrix = analysis_result.get("alpha_matrix")
+        if matrix:
+            m = np.asarray(matrix, dtype=float)
+            rows, cols = np.nonzero(m)
+            return [(r + 1, ALPHA_SOURCES[c], m[r, c] > 0) for r, c in zip(rows.tolist(), cols.tolist())]
+        fires = []
+        for boat_info in analysis_result.get("boats", []):
+            for reason in boat_info.get("reasons", []):
                 # reasonからαソース名を抽出
                 alpha_src = self._extract_source(reason)
-                if not alpha_src:
-                    continue
-
-                if alpha_src not in self.state:
-                    self.state[alpha_src] = self._default_entry()
-
-                entry = self.state[alpha_src]
-
-                # αが「この艇は有利」と言っていたか「不利」と言っていたか
-                is_boost = self._is_boost(reason)
-
-                # 的中判定
-                if is_boost:
-                    # ブーストα → この艇が3着以内なら的中
-                    hit = bn in top3
-                else:
-                    # ペナルティα → この艇が3着以外なら的中
-                    hit = bn not in top3
-
-                # EWMA更新
-                entry["total_fires"] += 1
-                if hit:
-                    entry["hits"] += 1
-
-                old_rate = entry["ewma_hit_rate"]
-                new_obs = 1.0 if hit else 0.0
-                entry["ewma_hit_rate"] = (1 - EWMA_ALPHA) * old_rate + EWMA_ALPHA * new_obs
-
-                # 信頼度更新
-                if entry["total_fires"] >= MIN_SAMPLES:
-                    # EWMA的中率が0.5（ランダム）より高ければ信頼度UP
-                    # 0.5より低ければ信頼度DOWN
-                    rate = entry["ewma_hit_rate"]
-                    # 0.5をベースラインとして、乖離を信頼度に変換
-                    # rate=0.7 → reliability=1.4, rate=0.3 → reliability=0.6
-                    entry["reliability"] = max(0.5, min(1.5, rate * 2.0))
-
-                entry["last_updated"] = datetime.now().isoformat()
-
-        self._save_state()
+                if alpha_src:
+                    # αが「この艇は有利」と言っていたか「不利」と言っていたか
+                    fires.append((boat_info["boat"], alpha_src, self._is_boost(reason)))
+        return fires
 
     def _extract_source(self, reason: str) -> Optional[str]:
         """reason文字列からαソース名を抽出"""
@@ -175,15 +262,14 @@ class AlphaReliabilityTracker:
 
     def _is_boost(self, reason: str) -> bool:
         """このαが「有利」を示しているか（ブースト）を判定"""
-        import re
         # v7.5: 加法ベースのα表記
         # 通常形式: "→+0.120" or "→-0.035"
         # Wind×Tide形式: "→C1-0.30" or "→C1+0.25"（コース番号が挟まる）
-        add_match = re.search(r'→(?:C\d+)?([+-][\d.]+)', reason)
+        add_match = _ADD_PATTERN.search(reason)
         if add_match:
             return float(add_match.group(1)) > 0
         # v7.4以前: 乗法ベースの表記 "×1.30"
-        mult_match = re.search(r'×([\d.]+)', reason)
+        mult_match = _MULT_PATTERN.search(reason)
         if mult_match:
             return float(mult_match.group(1)) > 1.0
         return True  # デフォルトはブースト
@@ -209,41 +295,149 @@ class AlphaReliabilityTracker:
         return report
 
     def apply_to_alpha(self, alpha_dict: Dict[int, float],
-                       reasons: Dict[int, List[str]]) -> Dict[int, float]:
+                       alpha_matrix: Union[Sequence[Sequence[float]], Dict[int, List[str]]]) -> Dict[int, float]:
         """
         信頼度をα値に適用する。
-        rtpt_engine.py から呼ばれる。
+        alpha_matrix: analyze() の alpha_matrix（6 × ALPHA_SOURCES）。旧形式の reasons（艇番 → reason のリスト）も可。
 
-        αの各成分に対応する信頼度を乗算することで、
-        効いていないαを自動的に減衰させる。
+        艇ごとに発火したαの平均信頼度（発火行列 · 信頼度ベクトル / 発火数）を1回だけ
+        「1.0からの乖離」に乗算し、効いていないαを自動的に減衰させる。
+        （連鎖乗算＝複数αで repeated scaling はしない）
         """
+        fired = self._fire_matrix(alpha_matrix)
+        n_fired = fired.sum(axis=1)
+        reliability = np.array([self.get_reliability(src) for src in ALPHA_SOURCES])
+        avg_reliability = np.divide(fired @ reliability, n_fired, out=np.ones(6), where=n_fired > 0)
+
         adjusted = dict(alpha_dict)
+        # avg_reliability=1.5なら乖離を50%増幅、0.5なら50%縮小
+        for k in np.flatnonzero(np.abs(avg_reliability - 1.0) > 0.01).tolist():
+            adjusted[k + 1] = 1.0 + (adjusted[k + 1] - 1.0) * float(avg_reliability[k])
+        return adjusted
 
-        for bn in range(1, 7):
-            reasons_bn = reasons.get(bn, [])
-            if not reasons_bn:
-                continue
-
-            # 各reasonの信頼度を収集し、平均信頼度を1回だけ適用する。
-            # 連鎖乗算（複数reasonで repeated scaling）を防ぐ。
-            reliabilities = []
-            for reason in reasons_bn:
-                src = self._extract_source(reason)
-                if src:
-                    reliabilities.append(self.get_reliability(src))
-
-            if not reliabilities:
-                continue
-
-            avg_reliability = sum(reliabilities) / len(reliabilities)
-            if abs(avg_reliability - 1.0) > 0.01:
-                # αの「1.0からの乖離」に平均信頼度を適用
-                # avg_reliability=1.5なら乖離を50%増幅
-                # avg_reliability=0.5なら乖離を50%縮小
-                deviation = adjusted[bn] - 1.0
-                adjusted[bn] = 1.0 + deviation * avg_reliability
+    def _fire_matrix(self, alpha_matrix) -> np.ndarray:
+        """艇 × αソースの発火回数 (6, len(ALPHA_SOURCES))"""
+        if isinstance(alpha_matrix, dict):
+            fired = np.zeros((6, len(ALPHA_SOURCES)))
+            for bn, reasons_bn in alpha_matrix.items():
+                for reason in reasons_bn:
+                    src = self._extract_source(reason)
+                    if src:
+                        fired[bn - 1, ALPHA_SOURCES.index(src)] += 1
+            return fired
+        if not len(alpha_matrix):
+            return np.zeros((6, len(ALPHA_SOURCES)))
+        return (np.asarray(alpha_matrix, dtype=float) != 0).astype(float)
 
-        return adjusted
+
+# ============================================================
+# アーカイブからの一括再構築
+# ============================================================
+def ewma_trajectory(obs, alpha: float = EWMA_ALPHA, start: float = 0.5) -> np.ndarray:
+    """
+    r_k = (1-α) r_{k-1} + α x_k の全系列（r_0 = start）。
+    ブロック内は閉形式 r_k = d^k (r_0 + α Σ_{j≤k} x_j d^{-j})（d = 1-α）を cumsum で、
+    ブロック間は末尾の値を繰り越す（d^{-j} が桁あふれしない長さでブロックを切る）。
+    """
+    x = np.asarray(obs, dtype=float)
+    out = np.empty(len(x))
+    d = 1.0 - alpha
+    if not len(x):
+        return out
+    if d <= 0.0:
+        out[:] = x
+        return out
+    block = max(1, min(4096, int(500 / -math.log(d)))) if d < 1.0 else len(x)
+    j = np.arange(1, min(block, len(x)) + 1)
+    grow, decay = d ** -j, d ** j
+    r = start
+    for lo in range(0, len(x), block):
+        chunk = x[lo:lo + block]
+        n = len(chunk)
+        out[lo:lo + n] = decay[:n] * (r + alpha * np.cumsum(chunk * grow[:n]))
+        r = out[lo + n - 1]
+    return out
+
+
+def _day_fires(args):
+    """
+    1日分の結果付きレース → (発火 (R,6,S), 的中 (R,6,S), 場名リスト)。
+    並び（レース順 → 艇番順）は update() に1レースずつ渡した場合と同じ。
+    """
+    archive_dir, date_str, params_override = args
+    from race_archive import load_day
+    from rtpt_engine import alpha_matrices, pack_races
+
+    races = [rd for rd in load_day(archive_dir, date_str) if rd.get("actual_result")]
+    if not races:
+        empty = np.zeros((0, 6, len(ALPHA_SOURCES)), dtype=bool)
+        return empty, empty, []
+    m = alpha_matrices(pack_races(races), params_override)
+    top3 = np.array([[bn in {rd["actual_result"].get("1st", 0), rd["actual_result"].get("2nd", 0),
+                             rd["actual_result"].get("3rd", 0)} for bn in range(1, 7)] for rd in races])
+    fired = m != 0
+    # ブーストα → 3着以内なら的中、ペナルティα → 3着以外なら的中
+    hit = fired & np.where(m > 0, top3[:, :, None], ~top3[:, :, None])
+    venues = [(rd.get("metadata") or {}).get("stadium", "") for rd in races]
+    return fired, hit, venues
+
+
+def _state_from_fires(fired: np.ndarray, hit: np.ndarray, ewma_alpha: float, min_samples: int,
+                      trajectories: Optional[dict] = None) -> dict:
+    """発火/的中の配列（時系列順）→ AlphaReliabilityTracker の state"""
+    now = datetime.now().isoformat()
+    state = {}
+    for k, src in enumerate(ALPHA_SOURCES):
+        entry = {"total_fires": 0, "hits": 0, "ewma_hit_rate": 0.5,
+                 "reliability": DEFAULT_RELIABILITY, "last_updated": ""}
+        obs = hit[:, :, k][fired[:, :, k]]
+        if len(obs):
+            traj = ewma_trajectory(obs, ewma_alpha)
+            rate = float(traj[-1])
+            entry.update(total_fires=len(obs), hits=int(obs.sum()), ewma_hit_rate=rate, last_updated=now)
+            if len(obs) >= min_samples:
+                entry["reliability"] = max(0.5, min(1.5, rate * 2.0))
+            if trajectories is not None:
+                trajectories[src] = traj
+        state[src] = entry
+    return state
+
+
+def rebuild_reliability(archive_dir: str, start: Optional[str] = None, end: Optional[str] = None,
+                        workers: int = 1, by_venue: bool = False, ewma_alpha: float = EWMA_ALPHA,
+                        min_samples: int = MIN_SAMPLES, params_override: Optional[dict] = None,
+                        with_trajectories: bool = False) -> dict:
+    """
+    結果付きアーカイブ（start〜end の日付。YYYYMMDD、両端含む）から state を再構築。
+    日ごとの読み込み・α寄与の計算は workers > 1 でプロセス並列、EWMA は全日を日付順に連結してから計算する。
+    Returns: {"state", "races", "days", "by_venue"（by_venue 時: 場名 → state）, "trajectories"（指定時: ソース → EWMA系列）}
+    """
+    from race_archive import get_index
+
+    dates = [d for d in sorted(get_index(archive_dir).dates)
+             if (start is None or d >= start) and (end is None or d <= end)]
+    jobs = [(archive_dir, d, params_override) for d in dates]
+    if workers > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            days = list(pool.map(_day_fires, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        days = [_day_fires(job) for job in jobs]
+
+    empty = np.zeros((0, 6, len(ALPHA_SOURCES)), dtype=bool)
+    fired = np.concatenate([f for f, _, _ in days]) if days else empty
+    hit = np.concatenate([h for _, h, _ in days]) if days else empty
+    venues = np.array([v for _, _, vs in days for v in vs], dtype=object)
+
+    trajectories = {} if with_trajectories else None
+    out = {"state": _state_from_fires(fired, hit, ewma_alpha, min_samples, trajectories),
+           "races": len(fired), "days": len(dates)}
+    if by_venue:
+        out["by_venue"] = {v: _state_from_fires(fired[venues == v], hit[venues == v], ewma_alpha, min_samples)
+                           for v in sorted(set(venues.tolist()))}
+    if trajectories is not None:
+        out["trajectories"] = trajectories
+    return out
 
 
 # ============================================================
@@ -252,21 +446,51 @@ class AlphaReliabilityTracker:
 if __name__ == "__main__":
     import sys
 
-    tracker = AlphaReliabilityTracker()
-
-    if len(sys.argv) > 1 and sys.argv[1] == "report":
-        report = tracker.get_report()
-        print("=== Alpha Reliability Report ===")
+    def print_report(report):
         for src, data in report.items():
             print(f"  {src:20s} | 発火{data['fires']:4d}回 | "
                   f"的中{data['hit_rate']:.1f}% | "
                   f"EWMA{data['ewma_rate']:.1f}% | "
                   f"信頼度{data['reliability']:.3f} | {data['status']}")
+
+    def arg_value(name, default):
+        return sys.argv[sys.argv.index(name) + 1] if name in sys.argv else default
+
+    tracker = AlphaReliabilityTracker()
+
+    if len(sys.argv) > 1 and sys.argv[1] == "report":
+        print("=== Alpha Reliability Report ===")
+        print_report(tracker.get_report())
     elif len(sys.argv) > 1 and sys.argv[1] == "reset":
         tracker.state = {src: tracker._default_entry() for src in ALPHA_SOURCES}
         tracker._save_state()
         print("リセット完了")
+    elif len(sys.argv) > 1 and sys.argv[1] == "rebuild":
+        archive_dir = arg_value("--archive", "race_data_archive")
+        t0 = time.perf_counter()
+        rebuilt = rebuild_reliability(archive_dir, start=arg_value("--from", None), end=arg_value("--to", None),
+                                      workers=int(arg_value("--workers", 1)), by_venue="--by-venue" in sys.argv,
+                                      ewma_alpha=float(arg_value("--ewma", EWMA_ALPHA)),
+                                      min_samples=int(arg_value("--min-samples", MIN_SAMPLES)))
+        print(f"=== Alpha Reliability Rebuild: {archive_dir} "
+              f"({rebuilt['days']}日 / {rebuilt['races']}レース, {time.perf_counter() - t0:.1f}秒) ===")
+        tracker.state = rebuilt["state"]
+        print_report(tracker.get_report())
+        if "--dry-run" in sys.argv:
+            print("（--dry-run: 保存しません）")
+        else:
+            tracker._save_state()
+            print(f"💾 {tracker.state_file} に保存")
+            if "by_venue" in rebuilt:
+                tmp = BY_VENUE_FILE + ".tmp"
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(rebuilt["by_venue"], f, ensure_ascii=False, indent=2)
+                os.replace(tmp, BY_VENUE_FILE)
+                print(f"💾 {BY_VENUE_FILE} に場別 {len(rebuilt['by_venue'])} 場を保存")
     else:
         print("Usage:")
         print("  python alpha_adapter.py report  — 信頼度レポート表示")
         print("  python alpha_adapter.py reset   — 信頼度リセット")
+        print("  python alpha_adapter.py rebuild [--archive race_data_archive] [--from YYYYMMDD] [--to YYYYMMDD]")
+        print("        [--workers 4] [--by-venue] [--ewma 0.05] [--min-samples 10] [--dry-run]"
+              "  — アーカイブから再構築")
@@ -0,0 +1,245 @@
+"""
+analysis_cache.py — Content-addressed analyze() Result Cache
+=============================================================
+同じ入力の analyze() を再計算しないためのメモ化層
+（Streamlit の再実行・ライブスキャンの再走査・同じアーカイブ/同じパラメータでの再解析）。
+
+キー = sha1(レース入力 RaceInput.digest(), 適用後のパラメータ, bankroll, MLモデルの version, エンジンのソース)
+  - メモリは LRU（max_entries 件）、disk_dir 指定時はディスクにも保存（容量超過で最終利用の古い順に削除）
+  - パラメータは alpha_params.json の再読込後の値でキーを作るので、ファイル更新で自然に別キーになる
+  - rtpt_engine.py のソースもキーに含めるので、エンジン修正後に古い結果は使われない
+  - ML モデルは version 属性がある場合だけキャッシュ（race_data 全体もキーに含める）。ない場合は素通し
+  - 戻り値は毎回新しいオブジェクト（呼び出し側が結果を書き換えてもキャッシュは汚れない）
+
+使い方:
+  from analysis_cache import analyze_cached
+  result = analyze_cached(race_data, bankroll=10000)      # analyze() と同じ引数・戻り値
+
+  python analysis_cache.py stats     # ディスク件数・容量
+  python analysis_cache.py clear     # キャッシュ削除
+"""
+import os
+import json
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import rtpt_engine
+from rtpt_engine import analyze, analyze_batch, freeze_race, get_params
+
+CACHE_DIR = "analysis_cache"
+MEMORY_MAX_ENTRIES = 2048
+DISK_MAX_BYTES = 512 * 1024 * 1024
+
+with open(rtpt_engine.__file__, 'rb') as _f:
+    ENGINE_DIGEST = hashlib.sha1(_f.read()).hexdigest()
+
+
+def model_version(ml_model) -> Optional[str]:
+    """ML モデルの識別子（version 属性）。モデルなしは ""、識別できないモデルは None（キャッシュしない）"""
+    if ml_model is None:
+        return ""
+    version = getattr(ml_model, "version", None)
+    return str(version) if version is not None else None
+
+
+class AnalysisCache:
+    """
+    analyze() の結果キャッシュ（キー → pickle 済みの結果）。
+    hits（メモリ）/ disk_hits / misses / bypassed（キャッシュ不可のため素通し）を数える。
+    """
+
+    def __init__(self, max_entries: int = MEMORY_MAX_ENTRIES, disk_dir: Optional[str] = None,
+                 max_bytes: int = DISK_MAX_BYTES):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+        self.hits = self.disk_hits = self.misses = self.bypassed = 0
+
+    def key(self, inp, bankroll, params, ml_model=None) -> Optional[str]:
+        """キャッシュキー（キャッシュできない組み合わせは None）"""
+        version = model_version(ml_model)
+        if version is None:
+            return None
+        h = hashlib.sha1()
+        for part in (ENGINE_DIGEST, inp.digest(), params.digest(), repr(bankroll), version):
+            h.update(part.encode('utf-8')); h.update(b"\0")
+        if ml_model is not None:
+            h.update(json.dumps(inp.race_data, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], key + ".pkl")
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            blob = self._memory.get(key)
+            if blob is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return pickle.loads(blob)
+        if self.disk_dir:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    blob = f.read()
+                result = pickle.loads(blob)
+                os.utime(path)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass
+            else:
+                self._remember(key, blob)
+                with self._lock:
+                    self.disk_hits += 1
+                return result
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, key: str, blob: bytes):
+        with self._lock:
+            self._memory[key] = blob
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def put(self, key: str, result: Dict):
+        blob = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, blob)
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+            else:
+                self._disk_bytes += len(blob)
+            over = self._disk_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def _disk_files(self):
+        if not self.disk_dir or not os.path.isdir(self.disk_dir):
+            return []
+        files = []
+        for sub in os.scandir(self.disk_dir):
+            if sub.is_dir():
+                files.extend((e.stat().st_mtime, e.stat().st_size, e.path)
+                             for e in os.scandir(sub.path) if e.name.endswith(".pkl"))
+        return files
+
+    def evict(self, target: Optional[int] = None):
+        """ディスク容量を target（省略時は上限の 90%）まで最終利用の古い順に削除"""
+        target = int(self.max_bytes * 0.9) if target is None else target
+        files = sorted(self._disk_files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        self.evict(target=0)
+
+    def stats(self) -> Dict:
+        files = self._disk_files()
+        lookups = self.hits + self.disk_hits + self.misses
+        return {"memory_entries": len(self._memory), "disk_entries": len(files),
+                "disk_bytes": sum(size for _, size, _ in files),
+                "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.}
+
+    # ----------------------------------------------------------
+    # analyze のメモ化
+    # ----------------------------------------------------------
+    def analyze(self, race_data, bankroll=1000, params_override=None, ml_model=None) -> Dict:
+        """analyze() と同じ引数・戻り値。入力不正（freeze_race が例外）はそのまま analyze() に任せる"""
+        try:
+            inp = freeze_race(race_data)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return analyze(race_data, bankroll, params_override, ml_model)
+        key = self.key(inp, bankroll, get_params(params_override), ml_model)
+        if key is None:
+            with self._lock:
+                self.bypassed += 1
+            return analyze(inp, bankroll, params_override, ml_model)
+        result = self.get(key)
+        if result is None:
+            result = analyze(inp, bankroll, params_override, ml_model)
+            self.put(key, result)
+        return result
+
+    def analyze_batch(self, races: List, params_override=None, bankroll=1000, ml_model=None) -> List[Dict]:
+        """analyze_batch() と同じ（race_data / RaceInput のリスト）。未キャッシュのレースだけを一括計算"""
+        P = get_params(params_override)
+        inputs, keys = [], []
+        for rd in races:
+            try:
+                inp = freeze_race(rd)
+            except (KeyError, TypeError, ValueError, AttributeError):
+                inputs.append(rd); keys.append(None)  # 入力不正は analyze_batch 側で error 付きの結果になる
+                continue
+            inputs.append(inp); keys.append(self.key(inp, bankroll, P, ml_model))
+        out = [self.get(k) if k is not None else None for k in keys]
+        todo = [i for i, r in enumerate(out) if r is None]
+        with self._lock:
+            self.bypassed += sum(1 for k in keys if k is None)
+        if todo:
+            fresh = analyze_batch([inputs[i] for i in todo], params_override, bankroll, ml_model)
+            for i, result in zip(todo, fresh):
+                if keys[i] is not None:
+                    self.put(keys[i], result)
+                out[i] = result
+        return out
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_analysis_cache() -> AnalysisCache:
+    """プロセス共有のキャッシュ（ディスク保存あり: CACHE_DIR）"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnalysisCache(disk_dir=CACHE_DIR)
+        return _cache
+
+
+def analyze_cached(race_data, bankroll=1000, params_override=None, ml_model=None) -> Dict:
+    """analyze() のキャッシュ付き版（プロセス共有キャッシュを使う）"""
+    return get_analysis_cache().analyze(race_data, bankroll, params_override, ml_model)
+
+
+if __name__ == "__main__":
+    import sys
+
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if cmd == "clear":
+        get_analysis_cache().clear()
+        print(f"🗑 {CACHE_DIR}/ を削除しました")
+    elif cmd == "stats":
+        print(json.dumps(get_analysis_cache().stats(), ensure_ascii=False, indent=2))
+    else:
+        print("Usage:")
+        print("  python analysis_cache.py stats")
+        print("  python analysis_cache.py clear")
@@ -3,7 +3,7 @@ backtest_system.py — Result Reconciliation + Walk-Forward Backtest + Calibrati
 ==================================================================================
 機能:
   1. boatrace.jpからレース結果を自動スクレイピング
-  2. predictions_log.csvとの自動照合（的中/不的中/払戻額の書き戻し）
+  2. predictions_log.csvとの自動照合（的中/不的中/払戻額を追記専用ジャーナルに記録）
   3. Walk-Forward バックテスト（N日訓練 → M日テスト → ロールフォワード）
   4. Calibration検証（推定確率 vs 実際の的中率の一致度）
   5. αパラメータの最適化（グリッドサーチ）
@@ -13,24 +13,31 @@ backtest_system.py — Result Reconciliation + Walk-Forward Backtest + Calibrati
   # 結果照合
   python backtest_system.py reconcile --log predictions_log.csv
 
+  # 照合ジャーナルをCSV本体に畳み込む
+  python backtest_system.py compact --log predictions_log.csv
+
   # バックテスト（過去90日、30日訓練/7日テスト）
   python backtest_system.py backtest --days 90 --train 30 --test 7
 
+  # バックテスト（ウィンドウを8プロセスで並列処理）
+  python backtest_system.py backtest --days 180 --train 30 --test 7 --workers 8
+
   # Calibration検証
   python backtest_system.py calibrate --log predictions_log.csv
 """
-import requests
 import re
 import csv
+import io
 import os
 import json
-import math
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, date
-from bs4 import BeautifulSoup
-from collections import defaultdict
+from race_archive import get_index, load_day, load_day_compiled
+from race_scraper import parse_raceresult
+from http_client import get_session, http_get
 
-HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
 
 JCD_MAP = {
     "桐生": "01", "戸田": "02", "江戸川": "03", "平和島": "04", "多摩川": "05",
@@ -45,11 +52,69 @@ JCD_REVERSE = {v: k for k, v in JCD_MAP.items()}
 # ============================================================
 # 1. レース結果スクレイピング
 # ============================================================
+class TokenBucket:
+    """スレッド間で共有するレート制限（平均 rate 件/秒、最大 burst 件まで連続で通す）"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
 class ResultScraper:
-    """boatrace.jpからレース結果を取得"""
+    """
+    boatrace.jpからレース結果を取得。
+    全リクエストは1つのトークンバケット（rate 件/秒）を通し、1つのプール済みセッションを共有する。
+    """
 
     BASE = "https://www.boatrace.jp/owpc/pc/race"
 
+    def __init__(self, rate=5.0, workers=8, retries=3, backoff=1.0):
+        self.bucket = TokenBucket(rate, burst=workers)
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+
+    def _session(self):
+        """ワーカー数ぶんの接続を保持するプロセス共有セッション（http_client）"""
+        return get_session(self.workers)
+
+    def _get(self, url, session):
+        """
+        レート制限付きGET（http_client 経由: 確定済みページはキャッシュから返し、通信時のみトークンを使う）。
+        接続エラー・429・5xx は指数バックオフで再試行し、それ以外の失敗（404等）と再試行上限到達時は None
+        """
+        return http_get(url, session, acquire=self.bucket.acquire, retries=self.retries, backoff=self.backoff)
+
+    def fetch_held_venues(self, date_str, session=None):
+        """
+        その日の開催場（JCD_MAP順）。開催一覧ページから取得し、取得失敗時は None。
+        app.fetch_available_races と違い、発売終了済みの場も含める（結果取得用）。
+        """
+        html = self._get(f"{self.BASE}/index?hd={date_str}", session or self._session())
+        if not html:
+            return None
+        held = set()
+        for match in re.finditer(r'<tbody.*?>.*?</tbody>', html, re.DOTALL):
+            stadium_match = re.search(r'alt="([^"]+)"', match.group(0))
+            if stadium_match and stadium_match.group(1).strip() in JCD_MAP:
+                held.add(stadium_match.group(1).strip())
+        return [v for v in JCD_MAP if v in held]
+
     def fetch_result(self, date_str, jcd, rno, session=None):
         """
         1レースの結果を取得。
@@ -58,126 +123,133 @@ class ResultScraper:
             "payouts": {"3連単": {"combo": "x-y-z", "payout": int}, ...}
         } or None
         """
-        s = session or requests.Session()
-        s.headers.update(HEADERS)
         url = f"{self.BASE}/raceresult?rno={rno}&jcd={jcd}&hd={date_str}"
-        try:
-            res = s.get(url, timeout=10)
-            res.raise_for_status()
-            res.encoding = 'utf-8'
-        except Exception:
-            return None
-
-        soup = BeautifulSoup(res.text, 'html.parser')
-        result = {"1st": 0, "2nd": 0, "3rd": 0, "payouts": {}}
-
-        # 着順取得
-        result_table = soup.select_one('.is-w495')
-        if not result_table:
-            return None
-
-        rows = result_table.select('tbody tr')
-        for row in rows:
-            tds = row.find_all('td')
-            if len(tds) < 2:
-                continue
-            rank_text = tds[0].text.strip()
-            boat_match = re.search(r'[1-6]', tds[1].text)
-            if not boat_match:
-                continue
-            boat_no = int(boat_match.group())
-            if rank_text == '1':
-                result["1st"] = boat_no
-            elif rank_text == '2':
-                result["2nd"] = boat_no
-            elif rank_text == '3':
-                result["3rd"] = boat_no
-
-        # 払戻金取得
-        # [Bug#31修正] 拡連複/複勝は複数行をリストで保存
-        # 払戻金テーブルの行は "組番 + 金額" の2セル以上で、
-        # 組番は 数字[-=]数字 のパターン（単勝/複勝は1桁数字）
-        combo_pattern = re.compile(r'^[1-6](?:[-=][1-6]){0,2}$')
-        for table in soup.select('.table1'):
-            text = table.get_text()
-            for bet_type in ["3連単", "3連複", "2連単", "2連複", "拡連複", "単勝", "複勝"]:
-                if bet_type in text:
-                    rows = table.select('tr')
-                    for row in rows:
-                        tds = row.find_all('td')
-                        if len(tds) < 2: continue
-                        combo_text = tds[0].text.strip()
-                        # 組番が有効なパターンか検証（非払戻テーブルの誤取得を防止）
-                        if not combo_pattern.match(combo_text):
-                            continue
-                        payout_text = tds[-1].text.strip()
-                        payout_match = re.search(r'[\d]+', payout_text.replace(',', '').replace('¥', ''))
-                        if payout_match:
-                            try:
-                                payout_val = int(payout_match.group())
-                                entry = {"combo": combo_text, "payout": payout_val}
-                                if bet_type in ("拡連複", "複勝"):
-                                    if bet_type not in result["payouts"]:
-                                        result["payouts"][bet_type] = []
-                                    if isinstance(result["payouts"][bet_type], list):
-                                        result["payouts"][bet_type].append(entry)
-                                    else:
-                                        result["payouts"][bet_type] = [result["payouts"][bet_type], entry]
-                                else:
-                                    result["payouts"][bet_type] = entry
-                            except ValueError:
-                                pass
-
-        if result["1st"] == 0:
+        html = self._get(url, session or self._session())
+        if not html:
             return None
-        return result
+        return parse_raceresult(html)
 
     def fetch_day_results(self, date_str):
-        """1日分の全場全レースの結果を取得"""
-        results = {}
-        session = requests.Session()
-        session.headers.update(HEADERS)
+        """
+        1日分の開催場全レースの結果を取得。
+        非開催場はスキップし、各レースは workers 並列 + トークンバケットでレート制限して取得。
+        """
+        session = self._session()
+        venues = self.fetch_held_venues(date_str, session)
+        if venues is None:
+            venues = list(JCD_MAP)  # 開催一覧が取れない場合は全場を試す
 
-        for venue_name, jcd in JCD_MAP.items():
-            for rno in range(1, 13):
-                result = self.fetch_result(date_str, jcd, rno, session)
-                if result:
-                    key = f"{date_str}_{venue_name}_{rno}R"
-                    results[key] = result
-                time.sleep(0.3)  # サーバー負荷軽減
+        keys = [(v, rno) for v in venues for rno in range(1, 13)]
+        with ThreadPoolExecutor(max_workers=self.workers) as ex:
+            fetched = list(ex.map(lambda k: self.fetch_result(date_str, JCD_MAP[k[0]], k[1], session), keys))
 
+        results = {}
+        for (venue_name, rno), result in zip(keys, fetched):
+            if result:
+                results[f"{date_str}_{venue_name}_{rno}R"] = result
         return results
 
 
 # ============================================================
 # 2. 予想ログ照合
 # ============================================================
+RESULT_FIELDS = ["result_1st", "result_2nd", "result_3rd", "hit", "payout"]
+# 未照合行として保持し、ジャーナルにも書き写す列（集計側が CSV を読み直さずに済むように）
+_PENDING_FIELDS = ["date", "stadium", "race", "type", "combo", "prob_pct", "recommended_yen"]
+
+
+def _journal_path(log_path):
+    return log_path + ".results.jsonl"
+
+
+def _state_path(log_path):
+    return log_path + ".reconcile.json"
+
+
+def read_journal(log_path):
+    """照合ジャーナル → {行番号: 結果列}（同じ行が複数回あれば後勝ち。書きかけの末尾行は無視）"""
+    results = {}
+    path = _journal_path(log_path)
+    if not os.path.exists(path):
+        return results
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                results[int(entry["row"])] = {k: entry[k] for k in RESULT_FIELDS}
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                continue
+    return results
+
+
+def _read_tail(path, offset):
+    """offset 以降の完結した行（改行まで）のバイト列と、その直後のオフセット"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        chunk = f.read()
+    cut = chunk.rfind(b"\n") + 1
+    return chunk[:cut], offset + cut
+
+
+def _read_csv_tail(log_path, offset, fieldnames):
+    """
+    CSV の offset 以降に追記された行を読む → (行dictのリスト, 新offset, fieldnames)。
+    offset=0 ならヘッダーから読む。追記途中の最終行（改行なし）は含めない。ヘッダーが空なら fieldnames は空
+    """
+    if offset == 0:
+        with open(log_path, 'rb') as f:
+            header = f.readline()
+        fieldnames = next(csv.reader([header.decode('utf-8-sig')]), [])
+        if not fieldnames:
+            return [], 0, []
+        offset = len(header)
+    chunk, offset = _read_tail(log_path, offset)
+    # csv.DictReader と同じく空行は行として数えない
+    rows = [dict(zip(fieldnames, values))
+            for values in csv.reader(io.StringIO(chunk.decode('utf-8'))) if values]
+    return rows, offset, fieldnames
+
+
+def _tail_mark(path, offset, width=32):
+    """offset 直前の数バイト（ファイルが作り直されていないかの確認用）"""
+    with open(path, 'rb') as f:
+        f.seek(max(0, offset - width))
+        return f.read(min(offset, width)).hex()
+
+
+def read_prediction_log(log_path):
+    """predictions_log.csv を読み、照合ジャーナルの結果を行番号で結合して返す"""
+    with open(log_path, 'r', encoding='utf-8-sig') as f:
+        rows = list(csv.DictReader(f))
+    for i, updates in read_journal(log_path).items():
+        if i < len(rows):
+            rows[i].update(updates)
+    return rows
+
+
 class Reconciler:
-    """predictions_log.csvとレース結果を照合"""
+    """
+    predictions_log.csvとレース結果を照合。
+    CSV本体は追記専用のまま書き換えず、照合結果は行番号付きで
+    {log}.results.jsonl に追記する（読み出し時に read_prediction_log で結合）。
+    {log}.reconcile.json に走査済みバイト位置（ウォーターマーク）と未照合行を保持し、
+    毎回は新規追記分だけを読む。
+    """
 
     def reconcile(self, log_path, results_cache_dir="results_cache"):
         """
-        CSVの未照合行にレース結果を書き戻す。
+        未照合行にレース結果を照合してジャーナルへ追記。
         results_cache_dirに日付ごとのJSON結果をキャッシュ。
         """
         os.makedirs(results_cache_dir, exist_ok=True)
 
-        rows = []
-        with open(log_path, 'r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            fieldnames = reader.fieldnames
-            if not fieldnames:
-                return 0  # 空のCSVファイル
-            rows = list(reader)
+        state = self._load_state(log_path)
+        if not self._scan_new_rows(log_path, state):
+            return 0  # 空のCSVファイル
+        pending = state["pending"]
 
         scraper = ResultScraper()
-        updated = 0
-        dates_needed = set()
-
-        # まず必要な日付を洗い出し
-        for row in rows:
-            if not row.get("hit"):  # 未照合
-                dates_needed.add(row["date"])
+        dates_needed = {row["date"] for row in pending.values()}
 
         # 日付ごとに結果を取得（キャッシュ活用）
         results_by_date = {}
@@ -192,73 +264,139 @@ class Reconciler:
                 results_by_date[d] = day_results
                 with open(cache_file, 'w', encoding='utf-8') as f:
                     json.dump(day_results, f, ensure_ascii=False, indent=2)
-                time.sleep(1)
 
         # 照合
-        for row in rows:
-            if row.get("hit"):
-                continue
-
-            d = row["date"]
-            venue = row["stadium"]
-            race = row["race"]  # "3R"
-            rno = race.replace("R", "")
-            key = f"{d}_{venue}_{race}"
-
-            day_res = results_by_date.get(d, {})
-            result = day_res.get(key)
+        entries = []
+        for idx, row in pending.items():
+            key = f"{row['date']}_{row['stadium']}_{row['race']}"  # race は "3R"
+            result = results_by_date.get(row["date"], {}).get(key)
             if not result:
                 continue
+            entries.append({"row": int(idx), **row, **self._resolve(row, result)})
+
+        # ジャーナル追記 → fsync 後に状態を更新（途中でクラッシュしても再実行で同じ行を上書き追記するだけ）
+        if entries:
+            path = _journal_path(log_path)
+            with open(path, 'a+b') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")  # 前回の書きかけ行と連結しないように
+                for e in entries:
+                    f.write((json.dumps(e, ensure_ascii=False) + "\n").encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            for e in entries:
+                pending.pop(str(e["row"]), None)
+        self._save_state(log_path, state)
+
+        return len(entries)
+
+    def _resolve(self, row, result):
+        """1行分の照合結果（RESULT_FIELDS）"""
+        out = {
+            "result_1st": str(result["1st"]),
+            "result_2nd": str(result["2nd"]),
+            "result_3rd": str(result["3rd"]),
+        }
 
-            row["result_1st"] = str(result["1st"])
-            row["result_2nd"] = str(result["2nd"])
-            row["result_3rd"] = str(result["3rd"])
-
-            # 的中判定
-            combo = row["combo"]
-            bet_type = row["type"]
-            hit = self._check_hit(combo, bet_type, result)
-            row["hit"] = "1" if hit else "0"
-
-            if hit:
-                # [Bug#31修正] 的中した買い目に一致する払戻金を検索
-                payout_info = result["payouts"].get(bet_type, {})
-                payout_val = 0
-                target_combo = row["combo"]
-
-                if isinstance(payout_info, list):
-                    # 拡連複/複勝: 複数組の中から一致するcomboを探す
-                    for pi in payout_info:
-                        if isinstance(pi, dict):
-                            # comboの正規化比較（"1=2" と "2=1" を一致させる）
-                            stored = pi.get("combo", "")
-                            if self._normalize_combo(stored) == self._normalize_combo(target_combo):
-                                payout_val = pi.get("payout", 0)
-                                break
-                    # 見つからなかった場合はフォールバック（最小値を使用）
-                    if payout_val == 0 and payout_info:
-                        positive_payouts = [
-                            pi.get("payout", 0) for pi in payout_info
-                            if isinstance(pi, dict) and pi.get("payout", 0) > 0
-                        ]
-                        if positive_payouts:
-                            payout_val = min(positive_payouts)
-                elif isinstance(payout_info, dict):
-                    payout_val = payout_info.get("payout", 0)
-
-                row["payout"] = str(payout_val)
-            else:
-                row["payout"] = "0"
+        # 的中判定
+        combo = row["combo"]
+        bet_type = row["type"]
+        hit = self._check_hit(combo, bet_type, result)
+        out["hit"] = "1" if hit else "0"
+
+        if hit:
+            # [Bug#31修正] 的中した買い目に一致する払戻金を検索
+            payout_info = result["payouts"].get(bet_type, {})
+            payout_val = 0
+            target_combo = row["combo"]
+
+            if isinstance(payout_info, list):
+                # 拡連複/複勝: 複数組の中から一致するcomboを探す
+                for pi in payout_info:
+                    if isinstance(pi, dict):
+                        # comboの正規化比較（"1=2" と "2=1" を一致させる）
+                        stored = pi.get("combo", "")
+                        if self._normalize_combo(stored) == self._normalize_combo(target_combo):
+                            payout_val = pi.get("payout", 0)
+                            break
+                # 見つからなかった場合はフォールバック（最小値を使用）
+                if payout_val == 0 and payout_info:
+                    positive_payouts = [
+                        pi.get("payout", 0) for pi in payout_info
+                        if isinstance(pi, dict) and pi.get("payout", 0) > 0
+                    ]
+                    if positive_payouts:
+                        payout_val = min(positive_payouts)
+            elif isinstance(payout_info, dict):
+                payout_val = payout_info.get("payout", 0)
+
+            out["payout"] = str(payout_val)
+        else:
+            out["payout"] = "0"
 
-            updated += 1
+        return out
 
-        # 書き戻し
-        with open(log_path, 'w', encoding='utf-8-sig', newline='') as f:
+    def _load_state(self, log_path):
+        path = _state_path(log_path)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                # CSV が作り直された（ウォーターマークより短い）場合は全走査し直す
+                if state.get("offset", 0) <= os.path.getsize(log_path):
+                    return state
+            except (json.JSONDecodeError, IOError):
+                pass
+        return {"offset": 0, "rows": 0, "fieldnames": None, "pending": {}}
+
+    def _save_state(self, log_path, state):
+        path = _state_path(log_path)
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _scan_new_rows(self, log_path, state):
+        """
+        ウォーターマーク以降に追記された行だけを読み、未照合行を pending に加える。
+        追記途中の最終行（改行なし）は次回に回す。ヘッダーが空なら False。
+        """
+        rows, state["offset"], state["fieldnames"] = _read_csv_tail(
+            log_path, state["offset"], state["fieldnames"])
+        if not state["fieldnames"]:
+            return False
+        for row in rows:
+            if not row.get("hit"):  # 未照合
+                state["pending"][str(state["rows"])] = {k: row.get(k, "") for k in _PENDING_FIELDS}
+            state["rows"] += 1
+        return True
+
+    def compact(self, log_path):
+        """
+        ジャーナルの結果をCSV本体に畳み込んで書き出す（エクスポート・整理用）。
+        一時ファイル経由で置き換えるので途中で落ちても元のCSVは壊れない。
+        """
+        rows = read_prediction_log(log_path)
+        with open(log_path, 'r', encoding='utf-8-sig') as f:
+            fieldnames = csv.DictReader(f).fieldnames
+        if not fieldnames:
+            return 0
+        tmp = log_path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8-sig', newline='') as f:
             writer = csv.DictWriter(f, fieldnames=fieldnames)
             writer.writeheader()
             writer.writerows(rows)
-
-        return updated
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, log_path)
+        # 畳み込み済みなのでジャーナルと状態は破棄（次回 reconcile で1回だけ全走査）
+        for path in (_journal_path(log_path), _state_path(log_path)):
+            if os.path.exists(path):
+                os.remove(path)
+        return len(rows)
 
     def _check_hit(self, combo, bet_type, result):
         """買い目が的中したかを判定"""
@@ -313,45 +451,190 @@ class Reconciler:
 # ============================================================
 # 3. パフォーマンス分析
 # ============================================================
-class PerformanceAnalyzer:
-    """照合済みログからパフォーマンス指標を計算"""
+CALIBRATION_BUCKETS = [(0, 5), (5, 10), (10, 20), (20, 30), (30, 50), (50, 100)]
 
-    def analyze(self, log_path):
-        """Returns: dict of performance metrics"""
-        rows = []
-        with open(log_path, 'r', encoding='utf-8-sig') as f:
-            rows = list(csv.DictReader(f))
 
-        reconciled = [r for r in rows if r.get("hit") in ("0", "1")]
-        if not reconciled:
-            return {"error": "照合済みデータなし"}
+def _stats_path(log_path):
+    return log_path + ".stats.json"
+
+
+class LogAccumulator:
+    """
+    照合済み行を1パスで畳み込む集計器（PerformanceAnalyzer と CalibrationChecker で共有）。
+    ROI/日別PnL/券種別/Calibrationバケット/Brier を同時に積算し、状態を {log}.stats.json に保存。
+    次回は CSV の新規追記行とジャーナルの新規照合分だけを畳み込む。
+    CSV やジャーナルが作り直された（compact 等）場合はウォーターマーク直前のバイトの不一致で検知して全再集計。
+    畳み込み済みの行は CSV の読み済み行数を境に、それより前の未照合行（unfolded）と
+    それ以降でジャーナルから先に畳み込んだ行（ahead）だけを持つ（どちらも照合待ちの件数程度）。
+    """
+
+    VERSION = 2
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+        self.state = None
+        path = _stats_path(log_path)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.state = json.load(f)
+            except (json.JSONDecodeError, IOError):
+                self.state = None
+        if not self._state_valid():
+            self.state = self._empty_state()
+
+    @staticmethod
+    def _empty_state():
+        return {
+            "version": LogAccumulator.VERSION,
+            "buckets": [list(b) for b in CALIBRATION_BUCKETS],
+            "csv": {"offset": 0, "rows": 0, "fieldnames": [], "mark": ""},
+            "journal": {"offset": 0, "mark": ""},
+            "unfolded": [],   # 読み済み行のうち未畳み込み（未照合）の行番号
+            "ahead": [],      # 未読行のうちジャーナルから畳み込み済みの行番号
+            "bets": 0, "invested": 0, "payout": 0, "hits": 0,
+            "daily": {},      # date → [pnl, invested]
+            "by_type": {},    # type → {"bets","hits","invested","payout"}
+            "cal": [[0, 0, 0.0] for _ in CALIBRATION_BUCKETS],   # [n, hits, prob_pct合計]
+            "brier": 0.0,
+        }
 
-        total_bets = len(reconciled)
-        total_invested = sum(int(r.get("recommended_yen", 100)) for r in reconciled)
+    def _state_valid(self):
+        s = self.state
+        if not s or s.get("version") != self.VERSION or s.get("buckets") != [list(b) for b in CALIBRATION_BUCKETS]:
+            return False
+        for path, part in ((self.log_path, s["csv"]), (_journal_path(self.log_path), s["journal"])):
+            if part["offset"] == 0:
+                continue
+            if not os.path.exists(path) or os.path.getsize(path) < part["offset"]:
+                return False
+            if _tail_mark(path, part["offset"]) != part["mark"]:
+                return False
+        return True
+
+    def update(self):
+        """新規の照合済み行を畳み込んで状態を保存。畳み込んだ行数を返す"""
+        added = self._update()
+        if added is None:
+            # 旧形式ジャーナル（集計列なし）で CSV 側の行が手元にない → 全再集計
+            self.state = self._empty_state()
+            added = self._update() or 0
+        self._save()
+        return added
+
+    def _update(self):
+        s = self.state
+        if not os.path.exists(self.log_path):
+            return 0
+        part = s["csv"]
+        rows, offset, part["fieldnames"] = _read_csv_tail(self.log_path, part["offset"], part["fieldnames"])
+        if not part["fieldnames"]:
+            return 0
+        unfolded = set(s["unfolded"])
+        ahead = set(s["ahead"])
+        new_rows = {}
+        base = part["rows"]
+        end = base + len(rows)
+        for i, row in enumerate(rows):
+            new_rows[base + i] = row
+
+        def folded(idx):
+            return idx in ahead if idx >= base else idx not in unfolded
+
+        # ジャーナルは CSV の行番号を指すので、CSV を先に読んでから読む
+        journal = {}
+        jpath = _journal_path(self.log_path)
+        jpart = s["journal"]
+        joffset = jpart["offset"]
+        if os.path.exists(jpath):
+            chunk, joffset = _read_tail(jpath, jpart["offset"])
+            for line in chunk.decode('utf-8').splitlines():
+                try:
+                    entry = json.loads(line)
+                    journal[int(entry["row"])] = entry
+                except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                    continue
+
+        todo = {}
+        for idx, row in new_rows.items():
+            if idx in journal:
+                entry = journal.pop(idx)
+                row = {**row, **{k: entry[k] for k in RESULT_FIELDS}}
+            if not folded(idx) and row.get("hit") in ("0", "1"):
+                todo[idx] = row
+        for idx, entry in journal.items():
+            if folded(idx) or entry.get("hit") not in ("0", "1"):
+                continue
+            if any(k not in entry for k in ("date", "type", "prob_pct", "recommended_yen")):
+                return None  # 何も畳み込まずに返す（呼び出し側で全再集計）
+            todo[idx] = entry
+        for row in todo.values():
+            self._fold(row)
+        added = len(todo)
+        done = ahead.union(todo)
+        unfolded.difference_update(done)
+        unfolded.update(idx for idx in range(base, end) if idx not in done)
+
+        part["offset"] = offset
+        part["rows"] = base + len(rows)
+        part["mark"] = _tail_mark(self.log_path, offset)
+        jpart["offset"] = joffset
+        jpart["mark"] = _tail_mark(jpath, joffset) if joffset else ""
+        s["unfolded"] = sorted(unfolded)
+        s["ahead"] = sorted(idx for idx in done if idx >= end)
+        return added
+
+    def _fold(self, r):
+        s = self.state
+        invested = int(r.get("recommended_yen", 100))
+        hit = r["hit"] == "1"
         # payout on boatrace.jp is per 100-yen ticket; scale by actual bet size
-        total_payout = sum(
-            int(r.get("payout", 0)) * int(r.get("recommended_yen", 100)) // 100
-            for r in reconciled if r["hit"] == "1"
-        )
-        hits = sum(1 for r in reconciled if r["hit"] == "1")
-
-        # 日別P&L
-        daily_pnl = defaultdict(float)
-        daily_invested = defaultdict(float)
-        for r in reconciled:
-            d = r["date"]
-            invested = int(r.get("recommended_yen", 100))
-            raw_payout = int(r.get("payout", 0)) if r["hit"] == "1" else 0
-            payout = raw_payout * invested // 100  # scale per-100-yen payout to actual bet
-            daily_pnl[d] += (payout - invested)
-            daily_invested[d] += invested
+        payout = int(r.get("payout", 0)) * invested // 100 if hit else 0
+        s["bets"] += 1
+        s["invested"] += invested
+        s["payout"] += payout
+        s["hits"] += hit
+
+        day = s["daily"].setdefault(r["date"], [0.0, 0.0])
+        day[0] += payout - invested
+        day[1] += invested
+
+        bt = s["by_type"].setdefault(r["type"], {"bets": 0, "hits": 0, "invested": 0, "payout": 0})
+        bt["bets"] += 1
+        bt["invested"] += invested
+        if hit:
+            bt["hits"] += 1
+            bt["payout"] += payout
+
+        prob = float(r.get("prob_pct", 0))
+        for k, (lo, hi) in enumerate(CALIBRATION_BUCKETS):
+            if lo <= prob < hi:
+                c = s["cal"][k]
+                c[0] += 1
+                c[1] += hit
+                c[2] += prob
+                break
+        s["brier"] += (prob / 100 - (1.0 if hit else 0.0)) ** 2
+
+    def _save(self):
+        path = _stats_path(self.log_path)
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def performance(self):
+        """PerformanceAnalyzer.analyze と同じ形式の指標"""
+        s = self.state
+        if not s["bets"]:
+            return {"error": "照合済みデータなし"}
 
         # 累積リターン
-        sorted_dates = sorted(daily_pnl.keys())
+        sorted_dates = sorted(s["daily"])
         cumulative = []
         running = 0
         for d in sorted_dates:
-            running += daily_pnl[d]
+            running += s["daily"][d][0]
             cumulative.append(running)
 
         # Max Drawdown
@@ -365,7 +648,7 @@ class PerformanceAnalyzer:
                 max_dd = dd
 
         # Sharpe Ratio (日次)
-        daily_returns = [daily_pnl[d] / max(daily_invested[d], 1) for d in sorted_dates]
+        daily_returns = [s["daily"][d][0] / max(s["daily"][d][1], 1) for d in sorted_dates]
         if len(daily_returns) > 1:
             mean_r = sum(daily_returns) / len(daily_returns)
             std_r = max(0.001, (sum((r - mean_r) ** 2 for r in daily_returns) / (len(daily_returns) - 1)) ** 0.5)
@@ -373,63 +656,33 @@ class PerformanceAnalyzer:
         else:
             sharpe = 0
 
-        # 券種別成績
-        by_type = defaultdict(lambda: {"bets": 0, "hits": 0, "invested": 0, "payout": 0})
-        for r in reconciled:
-            bt = r["type"]
-            by_type[bt]["bets"] += 1
-            by_type[bt]["invested"] += int(r.get("recommended_yen", 100))
-            if r["hit"] == "1":
-                by_type[bt]["hits"] += 1
-                bet_yen = int(r.get("recommended_yen", 100))
-                by_type[bt]["payout"] += int(r.get("payout", 0)) * bet_yen // 100
-
         return {
-            "total_bets": total_bets,
-            "total_invested": total_invested,
-            "total_payout": total_payout,
-            "roi": (total_payout - total_invested) / max(total_invested, 1) * 100,
-            "hit_rate": hits / max(total_bets, 1) * 100,
-            "hits": hits,
+            "total_bets": s["bets"],
+            "total_invested": s["invested"],
+            "total_payout": s["payout"],
+            "roi": (s["payout"] - s["invested"]) / max(s["invested"], 1) * 100,
+            "hit_rate": s["hits"] / max(s["bets"], 1) * 100,
+            "hits": s["hits"],
             "max_drawdown": max_dd,
             "sharpe_ratio": round(sharpe, 2),
             "n_days": len(sorted_dates),
-            "daily_avg_pnl": sum(daily_pnl.values()) / max(len(daily_pnl), 1),
-            "by_type": dict(by_type),
+            "daily_avg_pnl": sum(v[0] for v in s["daily"].values()) / max(len(s["daily"]), 1),
+            "by_type": {k: dict(v) for k, v in s["by_type"].items()},
             "cumulative_pnl": list(zip(sorted_dates, cumulative)),
         }
 
-
-# ============================================================
-# 4. Calibration検証
-# ============================================================
-class CalibrationChecker:
-    """推定確率 vs 実的中率の一致度を検証"""
-
-    BUCKETS = [(0, 5), (5, 10), (10, 20), (20, 30), (30, 50), (50, 100)]
-
-    def check(self, log_path):
-        rows = []
-        with open(log_path, 'r', encoding='utf-8-sig') as f:
-            rows = list(csv.DictReader(f))
-
-        reconciled = [r for r in rows if r.get("hit") in ("0", "1")]
-        if not reconciled:
+    def calibration(self):
+        """CalibrationChecker.check と同じ形式の結果"""
+        s = self.state
+        if not s["bets"]:
             return {"error": "照合済みデータなし"}
 
         buckets = {}
-        for lo, hi in self.BUCKETS:
-            label = f"{lo}-{hi}%"
-            bucket_rows = [
-                r for r in reconciled
-                if lo <= float(r.get("prob_pct", 0)) < hi
-            ]
-            if bucket_rows:
-                n = len(bucket_rows)
-                hits = sum(1 for r in bucket_rows if r["hit"] == "1")
+        for (lo, hi), (n, hits, prob_sum) in zip(CALIBRATION_BUCKETS, s["cal"]):
+            if n:
                 actual_rate = hits / n * 100
-                expected_rate = sum(float(r.get("prob_pct", 0)) for r in bucket_rows) / n
-                buckets[label] = {
+                expected_rate = prob_sum / n
+                buckets[f"{lo}-{hi}%"] = {
                     "n": n,
                     "hits": hits,
                     "actual_rate_pct": round(actual_rate, 1),
@@ -438,14 +691,7 @@ class CalibrationChecker:
                     "calibrated": abs(actual_rate - expected_rate) < 5.0,
                 }
 
-        # Brier Score
-        brier = 0
-        for r in reconciled:
-            p = float(r.get("prob_pct", 0)) / 100
-            outcome = 1.0 if r["hit"] == "1" else 0.0
-            brier += (p - outcome) ** 2
-        brier /= max(len(reconciled), 1)
-
+        brier = s["brier"] / max(s["bets"], 1)
         return {
             "buckets": buckets,
             "brier_score": round(brier, 4),
@@ -454,10 +700,34 @@ class CalibrationChecker:
                 "普通 (0.15-0.25)" if brier < 0.25 else
                 "要改善 (>0.25)"
             ),
-            "total_evaluated": len(reconciled),
+            "total_evaluated": s["bets"],
         }
 
 
+class PerformanceAnalyzer:
+    """照合済みログからパフォーマンス指標を計算"""
+
+    def analyze(self, log_path):
+        """Returns: dict of performance metrics（前回以降の照合分だけを LogAccumulator に畳み込む）"""
+        acc = LogAccumulator(log_path)
+        acc.update()
+        return acc.performance()
+
+
+# ============================================================
+# 4. Calibration検証
+# ============================================================
+class CalibrationChecker:
+    """推定確率 vs 実的中率の一致度を検証"""
+
+    BUCKETS = CALIBRATION_BUCKETS
+
+    def check(self, log_path):
+        acc = LogAccumulator(log_path)
+        acc.update()
+        return acc.calibration()
+
+
 # ============================================================
 # 5. Walk-Forward バックテスト
 # ============================================================
@@ -478,51 +748,37 @@ class WalkForwardBacktester:
         """
         self.data_dir = data_dir
 
-    def run(self, total_days=90, train_days=30, test_days=7, bankroll=10000):
+    def run(self, total_days=90, train_days=30, test_days=7, bankroll=10000, workers=1):
         """
         Walk-Forward実行。
+        workers > 1 の場合、各ウィンドウをプロセスプールで並列処理する（結果はウィンドウ順に整列）。
         Returns: list of window results
         """
         today = date.today()
         start_date = today - timedelta(days=total_days)
 
-        windows = []
+        # ウィンドウ計画: (訓練開始, 訓練終了=テスト開始, テスト終了)
+        plan = []
         current_start = start_date
-
         while current_start + timedelta(days=train_days + test_days) <= today:
             train_end = current_start + timedelta(days=train_days)
-            test_end = train_end + timedelta(days=test_days)
-
-            # 訓練期間: αパラメータを最適化
-            train_data = self._load_period(current_start, train_end)
-            if not train_data:
-                current_start += timedelta(days=test_days)
-                continue
-
-            optimized_params = self._optimize_alpha(train_data)
-
-            # テスト期間: 最適化済みパラメータで予測実行
-            test_data = self._load_period(train_end, test_end)
-            if not test_data:
-                current_start += timedelta(days=test_days)
-                continue
-
-            test_results = self._evaluate(test_data, optimized_params, bankroll)
-
-            windows.append({
-                "train_period": f"{current_start} ~ {train_end}",
-                "test_period": f"{train_end} ~ {test_end}",
-                "train_races": len(train_data),
-                "test_races": len(test_data),
-                "optimized_params": optimized_params,
-                "test_roi": test_results["roi"],
-                "test_hits": test_results["hits"],
-                "test_bets": test_results["total_bets"],
-                "test_pnl": test_results["pnl"],
-            })
-
+            plan.append((current_start, train_end, train_end + timedelta(days=test_days)))
             current_start += timedelta(days=test_days)
 
+        if workers > 1:
+            windows = self._run_parallel(plan, bankroll, workers)
+        else:
+            windows = []
+            for train_start, train_end, test_end in plan:
+                # 訓練期間 / テスト期間のどちらかが空ならスキップ
+                train = self._compile_period(train_start, train_end)
+                if not train[0]:
+                    continue
+                test = self._compile_period(train_end, test_end)
+                if not test[0]:
+                    continue
+                windows.append(self._window_result((train_start, train_end, test_end), train, test, bankroll))
+
         # サマリー
         if windows:
             avg_roi = sum(w["test_roi"] for w in windows) / len(windows)
@@ -537,39 +793,123 @@ class WalkForwardBacktester:
             }
         return {"windows": [], "error": "データ不足"}
 
+    def _window_result(self, period, train, test, bankroll):
+        """
+        1ウィンドウ分の処理: 訓練期間でαを最適化 → テスト期間で評価。
+        train / test: (ロード件数, _compile() の戻り値)
+        """
+        train_start, train_end, test_end = period
+        n_train, train_compiled = train
+        n_test, test_compiled = test
+
+        # 訓練期間: αパラメータを最適化
+        optimized_params = self._optimize_compiled(train_compiled)
+
+        # テスト期間: 最適化済みパラメータで予測実行
+        test_results = self._evaluate_compiled(test_compiled, optimized_params, bankroll)
+
+        return {
+            "train_period": f"{train_start} ~ {train_end}",
+            "test_period": f"{train_end} ~ {test_end}",
+            "train_races": n_train,
+            "test_races": n_test,
+            "optimized_params": optimized_params,
+            "test_roi": test_results["roi"],
+            "test_hits": test_results["hits"],
+            "test_bets": test_results["total_bets"],
+            "test_pnl": test_results["pnl"],
+        }
+
+    def _run_parallel(self, plan, bankroll, workers):
+        """
+        ウィンドウをプロセスプールに分配。
+        1) 各日をワーカーでロード+パック（日単位で1回だけ。重複するウィンドウ間で共有）
+        2) 日単位の配列を連結したコンパクトなペイロードだけを各ウィンドウのワーカーへ送る
+        race_data の dict 自体はプロセス間で pickle しない。
+        """
+        from collections import deque
+        from concurrent.futures import ProcessPoolExecutor
+        from rtpt_engine import RaceBatch
+
+        def span(a, b):
+            return [a + timedelta(days=k) for k in range((b - a).days)]
+
+        days = sorted({d for s, _, e in plan for d in span(s, e)})
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunk = max(1, len(days) // (workers * 4))
+            packed = dict(zip(days, pool.map(
+                _compile_day, [(self.data_dir, d) for d in days], chunksize=chunk)))
+
+            def merge(a, b):
+                ds = span(a, b)
+                return (sum(packed[d][0] for d in ds),
+                        (RaceBatch.concat([packed[d][1][0] for d in ds]),
+                         [r for d in ds for r in packed[d][1][1]]))
+
+            # 送信中のペイロードを workers*2 個までに抑えてメモリを一定に保つ
+            windows, pending = [], deque()
+            for period in plan:
+                train = merge(period[0], period[1])
+                if not train[0]:
+                    continue
+                test = merge(period[1], period[2])
+                if not test[0]:
+                    continue
+                pending.append(pool.submit(_run_window, (self.data_dir, period, train, test, bankroll)))
+                if len(pending) >= workers * 2:
+                    windows.append(pending.popleft().result())
+            windows.extend(f.result() for f in pending)
+        return windows
+
     def _load_period(self, start, end):
-        """指定期間のレースデータをロード"""
+        """
+        指定期間のレースデータをロード。
+        日ごとの os.listdir 走査ではなくアーカイブインデックスでファイルを引き、
+        パース済みレースはプロセス内LRUキャッシュから返す（ローリングウィンドウの重複日を再パースしない）。
+        カラムナ形式に変換済みの日はそちらを mmap で読む。
+        返すレース辞書はキャッシュと共有されるため変更しないこと。
+        """
+        index = get_index(self.data_dir)
         data = []
         current = start
         while current < end:
-            date_str = current.strftime("%Y%m%d")
-            pattern = f"{date_str}_"
-            if os.path.isdir(self.data_dir):
-                for fname in os.listdir(self.data_dir):
-                    if fname.startswith(pattern) and fname.endswith('.json'):
-                        fpath = os.path.join(self.data_dir, fname)
-                        try:
-                            with open(fpath, 'r', encoding='utf-8') as f:
-                                archive = json.load(f)
-                            # [Bug#20修正] アーカイブ構造を正規化
-                            # historical_scraper形式: {"race_data": {...}, "actual_result": {...}}
-                            # 旧形式: レースデータが直接トップレベル
-                            if "race_data" in archive:
-                                entry = archive["race_data"]
-                                entry["actual_result"] = archive.get("actual_result")
-                            else:
-                                entry = archive
-                            data.append(entry)
-                        except (json.JSONDecodeError, IOError):
-                            pass
+            data.extend(load_day(self.data_dir, current.strftime("%Y%m%d"), index))
             current += timedelta(days=1)
         return data
 
+    def _compile_period(self, start, end):
+        """
+        指定期間を日単位でパックして連結 → (ロード件数, (RaceBatch, 結果リスト))。
+        カラムナ形式の日は保存済み特徴量から直接組み立てる（_compile(_load_period()) と同じ内容）。
+        """
+        from rtpt_engine import RaceBatch
+
+        index = get_index(self.data_dir)
+        parts = []
+        current = start
+        while current < end:
+            parts.append(load_day_compiled(self.data_dir, current.strftime("%Y%m%d"), index))
+            current += timedelta(days=1)
+        return (sum(p[0] for p in parts),
+                (RaceBatch.concat([p[1] for p in parts]), [r for p in parts for r in p[2]]))
+
+    # グリッドサーチ対象（_optimize_alpha の探索ベクトルの並び順）
+    TUNED_PARAMS = ["wall_decay_strong", "wall_decay_weak", "ex_time_coeff",
+                    "motor_coeff", "weight_coeff", "henery_gamma"]
+
     def _optimize_alpha(self, train_data):
         """
         訓練データでαパラメータを最適化。
         グリッドサーチ（各パラメータ±20%の範囲）でBrier Scoreを最小化。
         """
+        return self._optimize_compiled(self._compile(train_data))
+
+    def _optimize_compiled(self, compiled):
+        """
+        _compile() 済みの訓練データでグリッドサーチ。
+        パース等のパラメータ非依存処理は済んでいるので、
+        各座標の5試行は sweep_brier で1回のブロードキャスト演算として評価する。
+        """
         # 最適化対象のパラメータ
         # [wall_decay_strong, wall_decay_weak, ex_time_coeff,
         #  motor_coeff, weight_coeff, henery_gamma]
@@ -577,19 +917,22 @@ class WalkForwardBacktester:
         initial = [1.30, 1.12, 0.06, 0.12, 0.008, 0.91]
 
         best_params = initial
-        best_score = self._brier_score(train_data, initial)
+        best_score = float(self._brier_scores(compiled, [initial])[0])
 
         # 簡易グリッドサーチ + 局所探索
-        # 各パラメータを±20%の範囲で5点探索
+        # 各パラメータを±20%の範囲で5点探索（同一座標の5点は他座標が共通なので一括評価）
         for param_idx in range(len(initial)):
             base = initial[param_idx]
+            trials = []
             for mult in [0.8, 0.9, 1.0, 1.1, 1.2]:
                 trial = list(best_params)
                 trial[param_idx] = base * mult
-                score = self._brier_score(train_data, trial)
-                if score < best_score:
-                    best_score = score
-                    best_params = trial
+                trials.append(trial)
+            scores = self._brier_scores(compiled, trials)
+            i = int(scores.argmin())
+            if scores[i] < best_score - 1e-12:  # 同値（効果のない座標）は更新しない
+                best_score = float(scores[i])
+                best_params = trials[i]
 
         return {
             "wall_decay_strong": round(best_params[0], 3),
@@ -601,65 +944,45 @@ class WalkForwardBacktester:
             "train_brier": round(best_score, 4),
         }
 
-    def _brier_score(self, data, params):
-        """パラメータセットに対するBrier Scoreを計算"""
-        from rtpt_engine import analyze as engine_analyze
-
-        # [Bug#2修正] params を engine の params_override に変換して渡す
-        engine_params = {
-            "wall_decay_strong": params[0],
-            "wall_decay_weak": params[1],
-            "ex_time_coeff": params[2],
-            "motor_coeff": params[3],
-            "weight_coeff": params[4],
-            "henery_gamma": params[5],
-        }
+    def _compile(self, data):
+        """結果付きレースのパラメータ非依存特徴量を1回だけ抽出 → (RaceBatch, 結果リスト)"""
+        from rtpt_engine import pack_races
 
-        total_brier = 0
-        n = 0
+        races = [rd for rd in data if rd.get("actual_result")]
+        return pack_races(races), [rd["actual_result"] for rd in races]
 
-        for race_data in data:
-            result = race_data.get("actual_result")
-            if not result:
-                continue
+    def _brier_scores(self, compiled, trials):
+        """試行パラメータ列（TUNED_PARAMS順）ごとの Brier Score"""
+        from rtpt_engine import sweep_brier
 
-            try:
-                analysis = engine_analyze(race_data, bankroll=1000, params_override=engine_params)
-            except Exception:
-                continue
+        batch, results = compiled
+        winners = [r.get("1st", 0) for r in results]
+        # [Bug#2修正] params を engine の params_override 名に変換して渡す
+        grid = {name: [t[k] for t in trials] for k, name in enumerate(self.TUNED_PARAMS)}
+        return sweep_brier(batch, winners, grid)
 
-            if analysis.get("error"):
-                continue
-
-            # 単勝の calibration で Brier を計算
-            actual_winner = result.get("1st", 0)
-            for boat in analysis["boats"]:
-                p = boat["post_prob"]
-                outcome = 1.0 if boat["boat"] == actual_winner else 0.0
-                total_brier += (p - outcome) ** 2
-                n += 1
-
-        return total_brier / max(n, 1)
+    def _brier_score(self, data, params):
+        """パラメータセットに対するBrier Scoreを計算"""
+        return float(self._brier_scores(self._compile(data), [params])[0])
 
     def _evaluate(self, test_data, params, bankroll):
         """テストデータでパフォーマンスを評価"""
-        from rtpt_engine import analyze as engine_analyze
+        return self._evaluate_compiled(self._compile(test_data), params, bankroll)
+
+    def _evaluate_compiled(self, compiled, params, bankroll):
+        """_compile() 済みのテストデータでパフォーマンスを評価"""
+        from rtpt_engine import analyze_batch
 
         total_invested = 0
         total_payout = 0
         total_bets = 0
         hits = 0
 
-        for race_data in test_data:
-            result = race_data.get("actual_result")
-            if not result:
-                continue
-
-            try:
-                analysis = engine_analyze(race_data, bankroll, params_override=params)
-            except Exception:
-                continue
+        batch, results = compiled
+        # 結果未照合のレースしかない期間（ライブ保存直後など）は空バッチ → 買い目なしのウィンドウとして扱う
+        analyses = analyze_batch(batch, params, bankroll=bankroll) if len(batch) else []
 
+        for result, analysis in zip(results, analyses):
             if analysis.get("error") or not analysis.get("targets"):
                 continue
 
@@ -692,6 +1015,18 @@ class WalkForwardBacktester:
         }
 
 
+# 並列Walk-Forwardのワーカー（spawn環境でも pickle できるようモジュールレベルに置く）
+def _compile_day(args):
+    """1日分をロードしてパック → (ロード件数, (RaceBatch, 結果リスト))"""
+    data_dir, day = args
+    return WalkForwardBacktester(data_dir)._compile_period(day, day + timedelta(days=1))
+
+
+def _run_window(args):
+    data_dir, period, train, test, bankroll = args
+    return WalkForwardBacktester(data_dir)._window_result(period, train, test, bankroll)
+
+
 # ============================================================
 # 6. レースデータ・アーカイバ（バックテスト用データ蓄積）
 # ============================================================
@@ -699,6 +1034,7 @@ class RaceDataArchiver:
     """
     毎日の解析時にレースデータ + 結果をJSONで保存。
     Walk-Forwardバックテストのデータソースになる。
+    蓄積後は `python race_archive.py convert` で日単位のカラムナ形式に変換すると高速にロードできる。
     """
 
     def __init__(self, archive_dir="race_data_archive"):
@@ -714,6 +1050,8 @@ class RaceDataArchiver:
 
         fname = f"{d}_{venue}_{race}.json"
         fpath = os.path.join(self.archive_dir, fname)
+        # 書き込み前にインデックスを最新化しておき、書き込み後は自分の1件だけ追記する
+        index = get_index(self.archive_dir)
 
         archive = {
             "race_data": race_data,
@@ -724,6 +1062,7 @@ class RaceDataArchiver:
 
         with open(fpath, 'w', encoding='utf-8') as f:
             json.dump(archive, f, ensure_ascii=False, indent=2)
+        index.add(fname)
 
     def attach_result(self, date_str, venue, rno):
         """アーカイブ済みデータにレース結果を付加"""
@@ -762,9 +1101,10 @@ if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage:")
         print("  python backtest_system.py reconcile --log predictions_log.csv")
+        print("  python backtest_system.py compact --log predictions_log.csv")
         print("  python backtest_system.py calibrate --log predictions_log.csv")
         print("  python backtest_system.py performance --log predictions_log.csv")
-        print("  python backtest_system.py backtest --days 90 --train 30 --test 7")
+        print("  python backtest_system.py backtest --days 90 --train 30 --test 7 [--workers N]")
         sys.exit(1)
 
     cmd = sys.argv[1]
@@ -775,6 +1115,11 @@ if __name__ == "__main__":
         updated = r.reconcile(log)
         print(f"照合完了: {updated}件更新")
 
+    elif cmd == "compact":
+        log = sys.argv[3] if len(sys.argv) > 3 else "predictions_log.csv"
+        n = Reconciler().compact(log)
+        print(f"畳み込み完了: {n}行")
+
     elif cmd == "calibrate":
         log = sys.argv[3] if len(sys.argv) > 3 else "predictions_log.csv"
         cc = CalibrationChecker()
@@ -793,6 +1138,7 @@ if __name__ == "__main__":
         days = 90
         train = 30
         test = 7
+        workers = 1
         for i, arg in enumerate(sys.argv):
             if arg == "--days" and i + 1 < len(sys.argv):
                 days = int(sys.argv[i + 1])
@@ -800,7 +1146,9 @@ if __name__ == "__main__":
                 train = int(sys.argv[i + 1])
             elif arg == "--test" and i + 1 < len(sys.argv):
                 test = int(sys.argv[i + 1])
+            elif arg == "--workers" and i + 1 < len(sys.argv):
+                workers = int(sys.argv[i + 1])
 
         bt = WalkForwardBacktester()
-        result = bt.run(total_days=days, train_days=train, test_days=test)
+        result = bt.run(total_days=days, train_days=train, test_days=test, workers=workers)
         print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
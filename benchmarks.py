@@ -0,0 +1,325 @@
+"""
+benchmarks.py — Engine / Backtest Micro-benchmarks
+===================================================
+合成レース（6艇・全券種のオッズ表・展示欠損/進入変化/荒れ場/潮汐場を含む）で
+エンジンとバックテストのホットパスを計測し、JSON で保存してコミット間で比較する。
+
+ケース（ms は1呼び出しあたり）:
+  harville          _harville（1レース）
+  prob_index        _build_prob_index（1レース）
+  multi_market_tmp  _multi_market_tmp（1レース）
+  analyze           analyze()（1レース、キャッシュなし）
+  analyze_batch     analyze_batch(全レース)
+  optimize_alpha    WalkForwardBacktester._optimize_alpha(全レース)
+  odds_validate     OddsValidator.validate（1レース）
+  perf_analyze      PerformanceAnalyzer.analyze（合成ログ CSV、状態ファイルなしから全集計）
+  calibration       CalibrationChecker.check（同上）
+
+  - 乱数は seed 固定（同じ seed・件数なら同じ入力）
+  - 各ケースを repeat 回計測し min / median / mean を出す。比較は min 基準
+  - 結果にはコミット・Python/numpy のバージョン・入力サイズを添える
+
+使い方:
+  python benchmarks.py run [--races 200] [--log-rows 20000] [--repeat 5] [--only analyze,harville] [--out bench.json]
+  python benchmarks.py compare base.json new.json      # new/base の比（1.10 超は ⚠）
+"""
+import os
+import csv
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import itertools
+import statistics
+import subprocess
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+# 過去のコミットにも同じスイートを持ち込んで比べられるよう、エンジンの関数は getattr で引き、
+# 存在しないケースはスキップする（ベースラインには analyze_batch 等がない）
+import rtpt_engine
+from rtpt_engine import VENUE_COURSE_BIAS, TIDAL_VENUES
+
+REGRESSION_RATIO = 1.10
+
+
+# ============================================================
+# 合成データ
+# ============================================================
+def _synthetic_harville(p: List[float]) -> Dict[tuple, float]:
+    """3連単の Harville 確率（合成データ専用。エンジン側の実装が変わっても同じデータになるように独立させる）"""
+    return {(f, s, t): p[f - 1] * p[s - 1] / (1 - p[f - 1]) * p[t - 1] / (1 - p[f - 1] - p[s - 1])
+            for f, s, t in itertools.permutations(range(1, 7), 3)}
+
+
+def synthetic_race(seed: int) -> dict:
+    """
+    1レース分の race_data（analyze() に渡す形式 + actual_result）。
+    艇の強さから Harville で全券種の理論確率を作り、控除率とノイズを掛けてオッズ表にする。
+    """
+    r = random.Random(seed)
+    venue = r.choice(list(VENUE_COURSE_BIAS))
+    strength = [r.uniform(0.3, 3.0) for _ in range(6)]
+    p = [s / sum(strength) for s in strength]
+
+    courses = list(range(1, 7))
+    if r.random() < 0.3:
+        r.shuffle(courses)
+    racelist = {}
+    for i in range(6):
+        b = {"name": f"選手{i + 1}", "racer_no": str(4000 + r.randint(0, 999)),
+             "class": r.choice(["A1", "A2", "B1", "B2"]),
+             "weight": round(r.uniform(47, 58), 1), "motor_2ren": round(r.uniform(15, 55), 1),
+             "avg_st": round(r.uniform(0.11, 0.20), 2)}
+        if r.random() < 0.92:  # 展示あり（一部欠損のレースも混ぜる）
+            b["exhibition_time"] = round(r.uniform(6.55, 6.95), 2)
+            b["tilt"] = r.choice([-0.5, 0.0, 0.5, 1.0])
+            b["start_exhibition_st"] = r.choice([".05", ".10", ".12", ".15", ".20", "F.03", ".08", ".18"])
+            b["start_course"] = courses[i]
+        racelist[str(i + 1)] = b
+
+    env = {"wind_speed": r.randint(0, 6), "wind_direction": r.choice(["追い風", "向かい風", "横風", "無風"]),
+           "wind_direction_code": r.randint(1, 16), "wave_height": r.choice([0, 2, 5, 8])}
+    if venue in TIDAL_VENUES:
+        env["tide"] = r.choice(["high", "low", "ebb", "flood"])
+
+    take = 0.75
+    noise = lambda: r.uniform(0.7, 1.6)
+    harv = _synthetic_harville(p)
+    od = {"3連単": {}, "3連複": {}, "2連単": {}, "2連複": {}, "拡連複": {}, "単勝": {}, "複勝": {}}
+    for i in range(6):
+        od["単勝"][str(i + 1)] = round(max(1.0, take / p[i] * noise()), 1)
+        lo = max(1.0, take / min(0.95, p[i] * 2.5) * noise())
+        od["複勝"][str(i + 1)] = f"{lo:.1f}-{lo * 1.5:.1f}"
+    for (f, s, t), q in harv.items():
+        od["3連単"][f"{f}-{s}-{t}"] = round(max(1.0, take / q * noise()), 1)
+    for c in itertools.combinations(range(1, 7), 3):
+        q = sum(harv[perm] for perm in itertools.permutations(c))
+        od["3連複"]["=".join(map(str, c))] = round(max(1.0, take / q * noise()), 1)
+    for f, s in itertools.permutations(range(1, 7), 2):
+        q = sum(harv[(f, s, t)] for t in range(1, 7) if t not in (f, s))
+        od["2連単"][f"{f}-{s}"] = round(max(1.0, take / q * noise()), 1)
+    for f, s in itertools.combinations(range(1, 7), 2):
+        q = sum(harv[(a, b, t)] for a, b in ((f, s), (s, f)) for t in range(1, 7) if t not in (a, b))
+        od["2連複"][f"{f}={s}"] = round(max(1.0, take / q * noise()), 1)
+        w = sum(v for k, v in harv.items() if f in k and s in k)
+        lo = max(1.0, take / w * noise())
+        od["拡連複"][f"{f}={s}"] = f"{lo:.1f}-{lo * 1.6:.1f}"
+
+    finish = sorted(range(1, 7), key=lambda k: -p[k - 1] * r.random())
+    date = f"2026{r.randint(1, 12):02d}{r.randint(1, 28):02d}"
+    return {"metadata": {"date": date, "stadium": venue, "race_number": f"{r.randint(1, 12)}R"},
+            "environment": env, "racelist": racelist, "odds": od,
+            "actual_result": dict(zip(["1st", "2nd", "3rd"], finish[:3]))}
+
+
+def synthetic_races(n: int, seed: int = 0) -> List[dict]:
+    return [synthetic_race(seed + i) for i in range(n)]
+
+
+LOG_FIELDS = ["date", "stadium", "race", "type", "combo", "prob_pct", "odds", "ev", "kelly_pct",
+              "recommended_yen", "result_1st", "result_2nd", "result_3rd", "hit", "payout"]
+
+
+def write_synthetic_log(path: str, rows: int, seed: int = 0):
+    """照合済みの predictions_log.csv（app.py と同じ列）を rows 行書く"""
+    r = random.Random(seed)
+    types = [("3連単", "-", 3), ("3連複", "=", 3), ("2連単", "-", 2), ("2連複", "=", 2), ("拡連複", "=", 2)]
+    venues = list(VENUE_COURSE_BIAS)
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=LOG_FIELDS)
+        writer.writeheader()
+        for i in range(rows):
+            bet_type, sep, k = r.choice(types)
+            prob = r.uniform(0.5, 60.0)
+            odds = round(max(1.1, 100 / prob * r.uniform(0.8, 2.0)), 1)
+            hit = r.random() < prob / 100
+            result = r.sample(range(1, 7), 3)
+            writer.writerow({
+                "date": f"2026{(i // 2000) % 12 + 1:02d}{(i // 100) % 28 + 1:02d}", "stadium": r.choice(venues),
+                "race": f"{r.randint(1, 12)}R", "type": bet_type, "combo": sep.join(map(str, r.sample(range(1, 7), k))),
+                "prob_pct": f"{prob:.1f}", "odds": odds, "ev": f"{prob * odds / 100:.2f}",
+                "kelly_pct": f"{r.uniform(1, 20):.1f}", "recommended_yen": r.choice([100, 200, 300, 500, 1000]),
+                "result_1st": result[0], "result_2nd": result[1], "result_3rd": result[2],
+                "hit": "1" if hit else "0", "payout": int(odds * 100) if hit else 0,
+            })
+
+
+# ============================================================
+# 計測
+# ============================================================
+def _measure(fn: Callable[[], None], repeat: int, calls: int, setup: Optional[Callable[[], None]] = None) -> Dict:
+    """fn を repeat 回実行（setup は計測外）→ 1呼び出しあたりの ms"""
+    samples = []
+    for _ in range(max(1, repeat)):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000 / calls)
+    return {"calls": calls, "min_ms": round(min(samples), 4), "median_ms": round(statistics.median(samples), 4),
+            "mean_ms": round(statistics.fmean(samples), 4)}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class BenchmarkSuite:
+    """合成データを1回だけ作り、各ケースを計測して JSON 化できる dict を返す"""
+
+    CASES = ("harville", "prob_index", "multi_market_tmp", "analyze", "analyze_batch",
+             "optimize_alpha", "odds_validate", "perf_analyze", "calibration")
+
+    def __init__(self, n_races: int = 200, log_rows: int = 20000, seed: int = 0):
+        self.n_races = n_races
+        self.log_rows = log_rows
+        self.seed = seed
+        self.races = synthetic_races(n_races, seed)
+        self.pds = [{k + 1: v for k, v in enumerate(np.random.default_rng(seed + i).dirichlet([2.0] * 6).tolist())}
+                    for i in range(n_races)]
+        harville = getattr(rtpt_engine, "_harville", None)
+        self.harvs = [harville(pd) for pd in self.pds] if harville else []
+
+    def _cases(self, tmp_dir: str) -> Dict[str, tuple]:
+        races, n = self.races, self.n_races
+        harville, prob_index, market_tmp, analyze, analyze_batch = (
+            getattr(rtpt_engine, k, None)
+            for k in ("_harville", "_build_prob_index", "_multi_market_tmp", "analyze", "analyze_batch"))
+        cases = {}
+        if harville:
+            cases["harville"] = (lambda: [harville(pd) for pd in self.pds], n, None)
+        if prob_index and self.harvs:
+            cases["prob_index"] = (lambda: [prob_index(h) for h in self.harvs], n, None)
+        if market_tmp:
+            cases["multi_market_tmp"] = (lambda: [market_tmp(rd["odds"]) for rd in races], n, None)
+        if analyze:
+            cases["analyze"] = (lambda: [analyze(rd, bankroll=10000) for rd in races], n, None)
+        if analyze_batch:
+            cases["analyze_batch"] = (lambda: analyze_batch(races, bankroll=10000), 1, None)
+
+        try:
+            import backtest_system
+        except ImportError:
+            backtest_system = None
+        if backtest_system is not None:
+            log_path = os.path.join(tmp_dir, "predictions_log.csv")
+            write_synthetic_log(log_path, self.log_rows, self.seed)
+            # 集計状態・照合ジャーナル・照合ウォーターマーク（あるコミットのみ）を消して毎回フル集計を測る
+            sidecars = [f(log_path) for f in (getattr(backtest_system, k, None)
+                                              for k in ("_stats_path", "_journal_path", "_state_path")) if f]
+
+            def fresh_log():
+                for path in sidecars:
+                    if os.path.exists(path):
+                        os.remove(path)
+
+            bt = backtest_system
+            cases["optimize_alpha"] = (lambda: bt.WalkForwardBacktester(tmp_dir)._optimize_alpha(races), 1, None)
+            cases["perf_analyze"] = (lambda: bt.PerformanceAnalyzer().analyze(log_path), 1, fresh_log)
+            cases["calibration"] = (lambda: bt.CalibrationChecker().check(log_path), 1, fresh_log)
+        try:
+            from data_quality import OddsValidator
+            validator = OddsValidator()
+            cases["odds_validate"] = (lambda: [validator.validate(rd["odds"]) for rd in races], n, None)
+        except ImportError:
+            pass
+        return cases
+
+    def run(self, repeat: int = 5, only: Optional[List[str]] = None) -> Dict:
+        tmp_dir = tempfile.mkdtemp(prefix="boatodds_bench_")
+        try:
+            cases = self._cases(tmp_dir)
+            results = {}
+            for name in self.CASES:
+                if name not in cases or (only and name not in only):
+                    continue
+                fn, calls, setup = cases[name]
+                fn() if setup is None else (setup(), fn())  # ウォームアップ（import・キャッシュ生成を計測から除く）
+                results[name] = _measure(fn, repeat, calls, setup)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return {
+            "meta": {"commit": _git_commit(), "timestamp": datetime.now().isoformat(timespec="seconds"),
+                     "python": platform.python_version(), "numpy": np.__version__,
+                     "machine": platform.machine(), "races": self.n_races, "log_rows": self.log_rows,
+                     "seed": self.seed, "repeat": repeat,
+                     "skipped": [c for c in self.CASES if c not in cases and not (only and c not in only)]},
+            "results": results,
+        }
+
+
+def format_results(report: Dict) -> str:
+    meta = report["meta"]
+    lines = [f"=== benchmarks @ {meta['commit'] or '?'}  ({meta['races']}レース / ログ{meta['log_rows']}行 / "
+             f"repeat {meta['repeat']}) ===",
+             f"  {'case':<18} {'calls':>6} {'min ms':>10} {'median ms':>10} {'mean ms':>10}"]
+    for name, r in report["results"].items():
+        lines.append(f"  {name:<18} {r['calls']:>6} {r['min_ms']:>10.4f} {r['median_ms']:>10.4f} {r['mean_ms']:>10.4f}")
+    if meta.get("skipped"):
+        lines.append(f"  （このコミットにないためスキップ: {', '.join(meta['skipped'])}）")
+    return "\n".join(lines)
+
+
+def compare_results(base: Dict, new: Dict) -> Dict[str, Optional[float]]:
+    """ケースごとの new/base（min_ms 基準）。片方にしかないケースは None"""
+    out = {}
+    for name in list(base["results"]) + [k for k in new["results"] if k not in base["results"]]:
+        b, n = base["results"].get(name), new["results"].get(name)
+        out[name] = round(n["min_ms"] / b["min_ms"], 3) if b and n and b["min_ms"] > 0 else None
+    return out
+
+
+def format_comparison(base: Dict, new: Dict) -> str:
+    ratios = compare_results(base, new)
+    lines = [f"=== {base['meta']['commit'] or 'base'} → {new['meta']['commit'] or 'new'}（new/base, min 基準） ==="]
+    for name, ratio in ratios.items():
+        if ratio is None:
+            lines.append(f"  {name:<18} {'-':>8}")
+            continue
+        mark = "⚠" if ratio > REGRESSION_RATIO else ("✅" if ratio < 1 / REGRESSION_RATIO else "")
+        lines.append(f"  {name:<18} {ratio:>8.3f}x {mark}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+
+    if cmd == "run":
+        n_races, log_rows, repeat, only, out = 200, 20000, 5, None, None
+        for i, arg in enumerate(sys.argv):
+            if arg == "--races" and i + 1 < len(sys.argv):
+                n_races = int(sys.argv[i + 1])
+            elif arg == "--log-rows" and i + 1 < len(sys.argv):
+                log_rows = int(sys.argv[i + 1])
+            elif arg == "--repeat" and i + 1 < len(sys.argv):
+                repeat = int(sys.argv[i + 1])
+            elif arg == "--only" and i + 1 < len(sys.argv):
+                only = sys.argv[i + 1].split(",")
+            elif arg == "--out" and i + 1 < len(sys.argv):
+                out = sys.argv[i + 1]
+        report = BenchmarkSuite(n_races, log_rows).run(repeat, only)
+        if out:
+            with open(out, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        print(format_results(report))
+    elif cmd == "compare" and len(sys.argv) > 3:
+        with open(sys.argv[2], 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        with open(sys.argv[3], 'r', encoding='utf-8') as f:
+            new = json.load(f)
+        print(format_comparison(base, new))
+    else:
+        print("Usage:")
+        print("  python benchmarks.py run [--races 200] [--log-rows 20000] [--repeat 5] [--only a,b] [--out bench.json]")
+        print("  python benchmarks.py compare base.json new.json")
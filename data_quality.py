@@ -6,26 +6,157 @@ data_quality.py — Data Quality Monitor, Odds Validator, Timestamp Tracker
   2. スクレイピング品質スコア算出
   3. オッズ取得タイムスタンプの記録
   4. 異常検知アラート生成
-  5. HTMLスナップショットの保存（デバッグ・テスト用）
+  5. HTMLスナップショットの保存（デバッグ・テスト用。内容アドレス + gzip、ポーリングごとのマニフェスト、
+     書き込みはバックグラウンドスレッド）
+  6. スナップショットを使ったパーサーの回帰テスト・ベンチマーク
 """
 import os
+import gzip
 import json
+import queue
+import atexit
 import hashlib
 import logging
+import operator
+import itertools
+import threading
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 
+import numpy as np
+
 logger = logging.getLogger("rtpt.data_quality")
 
 # ============================================================
 # 1. オッズ整合性バリデーター
 # ============================================================
+# 券種ごとの組番は固定なので、組番 → 序数・3連単序数の置換群・集計行列を import 時に1回だけ作る。
+# 検証は「序数順のオッズ配列」（欠損 NaN）に対して全件まとめて行う。
+_TRIFECTA = list(itertools.permutations(range(1, 7), 3))        # 3連単 120通り
+_MARKETS = {                                                    # 券種 → (区切り, 組番, 順序あり)
+    "3連単": ('-', _TRIFECTA, True),
+    "3連複": ('=', list(itertools.combinations(range(1, 7), 3)), False),
+    "2連単": ('-', list(itertools.permutations(range(1, 7), 2)), True),
+    "2連複": ('=', list(itertools.combinations(range(1, 7), 2)), False),
+}
+_MARKET_ORD = {bt: {sep.join(map(str, k)): i for i, k in enumerate(keys)} for bt, (sep, keys, _) in _MARKETS.items()}
+_MARKET_KEYS = {bt: list(canon) for bt, canon in _MARKET_ORD.items()}
+_MARKET_GETTER = {bt: operator.itemgetter(*keys) for bt, keys in _MARKET_KEYS.items()}   # 全組番が揃った板用
+_TUPLE_ORD = {bt: {(k if ordered else frozenset(k)): i for i, k in enumerate(keys)}
+              for bt, (sep, keys, ordered) in _MARKETS.items()}
+
+
+def _market_of_trifecta(bt):
+    """3連単序数 → 券種序数（1着/2連単/2連複/3連複）"""
+    if bt == "単勝":
+        return np.array([p[0] - 1 for p in _TRIFECTA], dtype=np.intp)
+    _, keys, ordered = _MARKETS[bt]
+    n = len(keys[0])
+    return np.array([_TUPLE_ORD[bt][p[:n] if ordered else frozenset(p[:n])] for p in _TRIFECTA], dtype=np.intp)
+
+
+# 3連複/2連複の各組番に対応する3連単/2連単の序数（置換群）: (20, 6) / (15, 2)
+_TRIO_PERMS = np.array([[_MARKET_ORD["3連単"]["-".join(map(str, p))] for p in itertools.permutations(k)]
+                        for k in _MARKETS["3連複"][1]], dtype=np.intp)
+_QUINELLA_PERMS = np.array([[_MARKET_ORD["2連単"]["-".join(map(str, p))] for p in itertools.permutations(k)]
+                            for k in _MARKETS["2連複"][1]], dtype=np.intp)
+# 3連単の implied 確率を単勝/2連単/2連複/3連複へ一度に集計する行列: (120, 6+30+15+20)
+_AGGREGATE_MARKETS = (("単勝", 6), ("2連単", 30), ("2連複", 15), ("3連複", 20))
+_AGGREGATE = np.zeros((len(_TRIFECTA), sum(n for _, n in _AGGREGATE_MARKETS)))
+_AGGREGATE_SLICE = {}
+_col = 0
+for _bt, _n in _AGGREGATE_MARKETS:
+    _AGGREGATE[np.arange(len(_TRIFECTA)), _col + _market_of_trifecta(_bt)] = 1.
+    _AGGREGATE_SLICE[_bt] = slice(_col, _col + _n)
+    _col += _n
+_AGGREGATE_STARTS = np.array([_AGGREGATE_SLICE[bt].start for bt, _ in _AGGREGATE_MARKETS])
+_AGGREGATE_SIZES = np.array([n for _, n in _AGGREGATE_MARKETS])
+
+
 class OddsValidator:
     """
     スクレイピングしたオッズの整合性を検証。
     「サイレントに壊れている」状態を検知する。
+    3連単/3連複/2連単/2連複は組番序数順の配列にして全件（120/20/30/15）を検査する（サンプリングしない）。
     """
 
+    # 3連単から集計した implied 確率と各券種の implied 確率の全変動距離（0~1）の許容値。
+    # benchmarks.synthetic_race の整合した板（組番ごとに独立なばらつき 0.7~1.6倍）2000レースで
+    # 各券種の中央値 ≈ 0.10、p99.9 ≈ 0.18、最大 0.19。1番人気と最下位艇の艇番ずれは 8~9割がこれを超える
+    # （python data_quality.py test_cross_market で再計測できる）
+    CROSS_MARKET_TV_OK = 0.20
+
+    @staticmethod
+    def _market_array(book: dict, bet_type: str):
+        """
+        券種のオッズdict → (序数順のオッズ配列（欠損 NaN）, 組番の異常, 値の異常)。
+        異常はそれぞれ最初の1件の (種類, 組番/値) と件数。
+        """
+        sep, keys, ordered = _MARKETS[bet_type]
+        canon, tuple_ord = _MARKET_ORD[bet_type], _TUPLE_ORD[bet_type]
+        # 通常の板（正規形の組番だけ・値はすべて数値化できる）は序数順に1回で埋める
+        if len(book.keys() & canon.keys()) == len(book):
+            if len(book) == len(keys):
+                vals = _MARKET_GETTER[bet_type](book)
+            else:
+                vals = [book.get(k, np.nan) for k in _MARKET_KEYS[bet_type]]
+            if None not in vals:   # None は np.array で黙って NaN になるので個別判定に回す
+                try:
+                    return np.array(vals, dtype=float), (None, 0), (None, 0)
+                except (ValueError, TypeError):
+                    pass
+        odds = np.full(len(keys), np.nan)
+        key_err, key_bad = None, 0
+        val_err, val_bad = None, 0
+        for k, v in book.items():
+            i = canon.get(k)
+            if i is None:
+                # 正規形でない組番（"3=1=2" 等）は数値化して照合し、だめなら異常の種類を判定
+                parts = str(k).split(sep)
+                try:
+                    nums = [int(p) for p in parts]
+                except ValueError:
+                    nums = None
+                if len(parts) != len(keys[0]):
+                    kind = "format"
+                elif nums is None:
+                    kind = "parse"
+                elif not all(1 <= n <= 6 for n in nums):
+                    kind = "range"
+                elif len(set(nums)) != len(nums):
+                    kind = "dup"
+                else:
+                    kind = None
+                    i = tuple_ord[tuple(nums) if ordered else frozenset(nums)]
+                if kind is not None:
+                    key_bad += 1
+                    key_err = key_err or (kind, k)
+                    continue
+            try:
+                odds[i] = float(v)
+            except (ValueError, TypeError):
+                val_bad += 1
+                val_err = val_err or (k, v)
+        return odds, (key_err, key_bad), (val_err, val_bad)
+
+    @staticmethod
+    def _implied_tv(agg: np.ndarray, market: np.ndarray) -> np.ndarray:
+        """
+        3連単の implied 確率を集計したもの agg と、各券種自身の implied 確率の全変動距離（_AGGREGATE_MARKETS 順）。
+        agg / market は _AGGREGATE の列順に券種を連結したもの。券種ごとに両方にオッズがある組番だけで
+        正規化して比べる（比較できる組番が半分未満の券種は NaN）
+        """
+        present = (market > 0) & (agg > 0)
+        p = np.where(present, agg, 0.)
+        q = np.divide(1.0, market, out=np.zeros(len(market)), where=present)
+        p_sum = np.add.reduceat(p, _AGGREGATE_STARTS)
+        q_sum = np.add.reduceat(q, _AGGREGATE_STARTS)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            diff = np.abs(p / np.repeat(p_sum, _AGGREGATE_SIZES) - q / np.repeat(q_sum, _AGGREGATE_SIZES))
+        tv = 0.5 * np.add.reduceat(np.where(present, diff, 0.), _AGGREGATE_STARTS)
+        enough = np.add.reduceat(present, _AGGREGATE_STARTS) >= np.maximum(_AGGREGATE_SIZES // 2, 2)
+        return np.where(enough, tv, np.nan)
+
     def validate(self, odds_data: dict) -> dict:
         """
         Returns: {
@@ -40,6 +171,11 @@ class OddsValidator:
         checks_passed = 0
         checks_total = 0
 
+        books = {bt: odds_data.get(bt, {}) for bt in _MARKETS}
+        arrays, key_errs, val_errs = {}, {}, {}
+        for bt, book in books.items():
+            arrays[bt], key_errs[bt], val_errs[bt] = self._market_array(book, bt)
+
         # --- Check 1: 単勝オッズが6艇分あるか ---
         checks_total += 1
         win = odds_data.get("単勝", {})
@@ -53,8 +189,13 @@ class OddsValidator:
 
         # --- Check 2: 単勝オッズの合理性（合計オーバーラウンド） ---
         checks_total += 1
+        win_odds = np.full(6, np.nan)
         if win:
-            implied_total = sum(1.0 / max(float(v), 1.0) for v in win.values())
+            implied_total = 0.0
+            for k, v in win.items():
+                implied_total += 1.0 / max(float(v), 1.0)
+                if str(k) in ("1", "2", "3", "4", "5", "6"):
+                    win_odds[int(k) - 1] = float(v)
             # 正常: 1.15~1.40（控除率15~40%）
             if 1.05 <= implied_total <= 1.50:
                 checks_passed += 1
@@ -66,7 +207,7 @@ class OddsValidator:
 
         # --- Check 3: 3連単が120通り近くあるか ---
         checks_total += 1
-        trifecta = odds_data.get("3連単", {})
+        trifecta = books["3連単"]
         if len(trifecta) >= 100:  # 一部不成立はありうるが100は欲しい
             checks_passed += 1
         elif len(trifecta) >= 50:
@@ -77,58 +218,52 @@ class OddsValidator:
         else:
             errors.append("3連単オッズが0件")
 
-        # --- Check 4: 3連単の買い目フォーマット検証 ---
+        # --- Check 4: 買い目フォーマット検証（3連単/3連複/2連単/2連複の全件） ---
         checks_total += 1
         format_ok = True
-        for k, v in list(trifecta.items())[:20]:  # 先頭20件をサンプルチェック
-            parts = k.split('-')
-            if len(parts) != 3:
-                format_ok = False
-                errors.append(f"3連単フォーマット異常: '{k}'")
-                break
-            try:
-                nums = [int(p) for p in parts]
-                if not all(1 <= n <= 6 for n in nums):
-                    format_ok = False
-                    errors.append(f"3連単の艇番異常: '{k}' (1-6の範囲外)")
-                    break
-                if len(set(nums)) != 3:
-                    format_ok = False
-                    errors.append(f"3連単に重複艇番: '{k}'")
-                    break
-            except ValueError:
-                format_ok = False
-                errors.append(f"3連単の数値パースエラー: '{k}'")
-                break
+        messages = {"format": "フォーマット異常", "parse": "の数値パースエラー",
+                    "range": "の艇番異常", "dup": "に重複艇番"}
+        for bt, (err, n_bad) in key_errs.items():
+            if err is None:
+                continue
+            format_ok = False
+            kind, k = err
+            more = f"（他{n_bad - 1}件）" if n_bad > 1 else ""
+            suffix = " (1-6の範囲外)" if kind == "range" else ""
+            errors.append(f"{bt}{messages[kind]}: '{k}'{suffix}{more}")
         if format_ok:
             checks_passed += 1
 
         # --- Check 5: オッズ値の範囲チェック ---
         checks_total += 1
         odds_ok = True
-        all_odds_values = []
-        for bet_type in ["3連単", "3連複", "2連単", "2連複"]:
-            for k, v in odds_data.get(bet_type, {}).items():
-                try:
-                    val = float(v)
-                    all_odds_values.append(val)
-                    if val <= 0:
-                        odds_ok = False
-                        errors.append(f"{bet_type} '{k}' のオッズが0以下: {val}")
-                        break
-                    if val > 100000:
-                        warnings.append(f"{bet_type} '{k}' のオッズが異常に高い: {val}")
-                except (ValueError, TypeError):
-                    odds_ok = False
-                    errors.append(f"{bet_type} '{k}' のオッズが数値でない: {v}")
-                    break
+        all_odds = np.concatenate(list(arrays.values()))
+        suspect = (all_odds <= 0) | (all_odds > 100000)   # NaN（欠損）は False
+        for bt, odds in arrays.items():
+            err, n_bad = val_errs[bt]
+            if err is not None:
+                odds_ok = False
+                errors.append(f"{bt} '{err[0]}' のオッズが数値でない: {err[1]}")
+                continue
+            if not suspect.any():
+                continue
+            if (odds <= 0).any():
+                odds_ok = False
+                i = int(np.argmax(odds <= 0))
+                errors.append(f"{bt} '{_MARKET_KEYS[bt][i]}' のオッズが0以下: {odds[i]}")
+                continue
+            if (odds > 100000).any():
+                high = np.flatnonzero(odds > 100000)
+                k = _MARKET_KEYS[bt][high[0]]
+                more = f"（他{len(high) - 1}件）" if len(high) > 1 else ""
+                warnings.append(f"{bt} '{k}' のオッズが異常に高い: {odds[high[0]]}{more}")
         if odds_ok:
             checks_passed += 1
 
         # --- Check 6: 2連単/2連複の件数チェック ---
         checks_total += 1
-        nitan = len(odds_data.get("2連単", {}))
-        nifuku = len(odds_data.get("2連複", {}))
+        nitan = len(books["2連単"])
+        nifuku = len(books["2連複"])
         if nitan >= 25 and nifuku >= 10:
             checks_passed += 1
         elif nitan >= 15 or nifuku >= 5:
@@ -139,39 +274,59 @@ class OddsValidator:
 
         # --- Check 7: 最低オッズの合理性 ---
         checks_total += 1
-        if all_odds_values:
-            min_odds = min(all_odds_values)
-            max_odds = max(all_odds_values)
+        all_odds = all_odds[all_odds > 0]
+        if len(all_odds):
+            min_odds = float(all_odds.min())
+            max_odds = float(all_odds.max())
             if min_odds >= 1.0 and max_odds <= 100000:
                 checks_passed += 1
             else:
                 warnings.append(f"オッズ範囲: {min_odds}~{max_odds}")
                 checks_passed += 0.5
 
-        # --- Check 8: 3連複と3連単の整合性 ---
+        # --- Check 8: 3連複/2連複と、対応する3連単/2連単（置換群）の整合性 ---
         checks_total += 1
-        sanfuku = odds_data.get("3連複", {})
-        if trifecta and sanfuku:
-            # 3連複のオッズは必ず対応する3連単の最低オッズ以下であるべき
-            sample_ok = True
-            for kf, vf in list(sanfuku.items())[:10]:
-                parts_f = sorted(kf.split('='))
-                min_exacta = float('inf')
-                for perm_key in [
-                    f"{a}-{b}-{c}"
-                    for a in parts_f for b in parts_f for c in parts_f
-                    if a != b and b != c and a != c
-                ]:
-                    if perm_key in trifecta:
-                        min_exacta = min(min_exacta, float(trifecta[perm_key]))
-                if min_exacta < float('inf') and float(vf) > min_exacta * 1.5:
-                    # 3連複が3連単の1.5倍以上はおかしい（通常は6分の1程度）
-                    sample_ok = False
-                    break
-            if sample_ok:
+        # 連複のオッズは対応する連単の最低オッズ以下であるべき（1.5倍以上はおかしい。通常は6分の1程度）
+        checked, inconsistent = False, []
+        for fuku, tan, perms in (("3連複", "3連単", _TRIO_PERMS), ("2連複", "2連単", _QUINELLA_PERMS)):
+            f_odds, t_odds = arrays[fuku], arrays[tan]
+            if not (books[fuku] and books[tan]):
+                continue
+            checked = True
+            group = t_odds[perms]
+            min_tan = np.where(group > 0, group, np.inf).min(axis=1)
+            bad_mask = f_odds > min_tan * 1.5  # 連単が全欠損（inf）なら False
+            if bad_mask.any():
+                bad = np.flatnonzero(bad_mask)
+                inconsistent.append(f"{fuku} '{_MARKET_KEYS[fuku][bad[0]]}' 等{len(bad)}件")
+        if not checked:
+            checks_passed += 0.5  # チェック不能
+        elif not inconsistent:
+            checks_passed += 1
+        else:
+            warnings.append(f"連複と連単のオッズ整合性に疑問あり: {', '.join(inconsistent)}")
+            checks_passed += 0.5
+
+        # --- Check 9: 券種間の implied 確率の整合性（3連単から集計した分布 vs 各券種の分布） ---
+        # 艇番ずれ・列ずれのような「値は正常だが組番と対応していない」破損を検知する
+        checks_total += 1
+        divergent = []
+        tri = arrays["3連単"]
+        tri_live = tri > 0
+        if np.count_nonzero(tri_live) >= 60:
+            agg = np.divide(1.0, tri, out=np.zeros(len(tri)), where=tri_live) @ _AGGREGATE
+            market = np.concatenate([win_odds, arrays["2連単"], arrays["2連複"], arrays["3連複"]])
+            tvs = self._implied_tv(agg, market)
+            compared = int(np.count_nonzero(tvs == tvs))
+            for (bt, _), tv in zip(_AGGREGATE_MARKETS, tvs.tolist()):
+                if tv > self.CROSS_MARKET_TV_OK:   # NaN（比較不能）は False
+                    divergent.append(f"{bt} {tv:.2f}")
+            if not compared:
+                checks_passed += 0.5  # チェック不能
+            elif not divergent:
                 checks_passed += 1
             else:
-                warnings.append("3連複と3連単のオッズ整合性に疑問あり")
+                warnings.append(f"3連単と他券種の implied 確率が乖離（全変動距離 {', '.join(divergent)}）")
                 checks_passed += 0.5
         else:
             checks_passed += 0.5  # チェック不能
@@ -249,6 +404,125 @@ class RacelistValidator:
 # ============================================================
 # 3. オッズ取得タイムスタンプ + スナップショット
 # ============================================================
+class SnapshotStore:
+    """
+    HTMLスナップショットの内容アドレス型ストア。
+
+      odds_snapshots/
+        _blobs/ab/<sha256>.html.gz               # ページ本文（同じ内容は1回だけ保存、gzip）
+        20260101_住之江_3R/manifest.jsonl         # 1ポーリング1行: {"fetched_at", "unix", "pages": {ページ: sha256}}
+
+    write() はキューに積むだけで、ハッシュ・圧縮・書き込みは専用スレッドで行う（解析の待ち時間に入れない）。
+    マニフェストへの追記は1スレッドなので順序どおり。プロセス終了時は残りを書き切る（atexit、最大 EXIT_FLUSH_TIMEOUT 秒）。
+    1件の保存失敗はログに残して次へ進む。書き込みスレッドが止まっていたら write() で起動し直す。
+    """
+
+    BLOB_DIR = "_blobs"
+    MANIFEST = "manifest.jsonl"
+    EXIT_FLUSH_TIMEOUT = 10.0
+
+    def __init__(self, root: str):
+        self.root = root
+        self._queue = queue.Queue()
+        self._known = set()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, self.BLOB_DIR, digest[:2], digest + ".html.gz")
+
+    def write(self, race_dir: str, meta: dict, html_data: Dict[str, str]):
+        self._queue.put((race_dir, meta, html_data))
+        self._ensure_writer()
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+                self._thread.start()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """投入済みの書き込みが終わるまで待つ。timeout 秒で終わらなければ False"""
+        done = self._queue.all_tasks_done
+        with done:
+            if not self._queue.unfinished_tasks:
+                return True
+        self._ensure_writer()
+        with done:
+            return done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def _run(self):
+        while True:
+            race_dir, meta, html_data = self._queue.get()
+            try:
+                self._write(race_dir, meta, html_data)
+            except Exception as e:
+                logger.warning(f"スナップショット保存失敗 {race_dir}: {e!r}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, race_dir: str, meta: dict, html_data: Dict[str, str]):
+        pages = {}
+        for key, html in html_data.items():
+            if not html:
+                continue
+            data = html if isinstance(html, bytes) else html.encode('utf-8')
+            digest = hashlib.sha256(data).hexdigest()
+            self._store_blob(digest, data)
+            pages[key] = digest
+        os.makedirs(race_dir, exist_ok=True)
+        with open(os.path.join(race_dir, self.MANIFEST), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({**meta, "pages": pages}, ensure_ascii=False) + "\n")
+
+    def _store_blob(self, digest: str, data: bytes):
+        if digest in self._known:
+            return
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(gzip.compress(data, compresslevel=6))
+            os.replace(tmp, path)
+        self._known.add(digest)
+
+    def read_blob(self, digest: str) -> str:
+        with open(self.blob_path(digest), 'rb') as f:
+            return gzip.decompress(f.read()).decode('utf-8')
+
+    @classmethod
+    def read_manifest(cls, snapshot_dir: str) -> List[dict]:
+        path = os.path.join(snapshot_dir, cls.MANIFEST)
+        if not os.path.exists(path):
+            return []
+        polls = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    polls.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # 書き込み途中で落ちた最終行
+        return polls
+
+
+_stores: Dict[str, SnapshotStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_snapshot_store(root: str) -> SnapshotStore:
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = SnapshotStore(root)
+        return _stores[root]
+
+
+@atexit.register
+def _flush_snapshot_stores():
+    for store in list(_stores.values()):
+        if not store.flush(timeout=SnapshotStore.EXIT_FLUSH_TIMEOUT):
+            logger.warning(f"スナップショットの書き込みが終了時に完了しませんでした: {store.root}")
+
+
 class OddsTimestamp:
     """オッズ取得時刻の記録・管理"""
 
@@ -256,10 +530,11 @@ class OddsTimestamp:
 
     def __init__(self):
         os.makedirs(self.SNAPSHOT_DIR, exist_ok=True)
+        self.store = get_snapshot_store(self.SNAPSHOT_DIR)
 
     def record(self, race_data: dict, html_data: dict = None) -> dict:
         """
-        タイムスタンプを記録し、オプションでHTMLスナップショットを保存。
+        タイムスタンプを記録し、オプションでHTMLスナップショットを保存（バックグラウンド）。
         race_dataのmetadataに書き込む。
         """
         now = datetime.now()
@@ -273,19 +548,13 @@ class OddsTimestamp:
             race_data["metadata"] = {}
         race_data["metadata"]["odds_timestamp"] = ts_info
 
-        # HTMLスナップショット保存（デバッグ用）
+        # HTMLスナップショット保存（デバッグ用。ポーリングごとにマニフェストへ1行追記）
         if html_data:
             meta = race_data.get("metadata", {})
             prefix = f"{meta.get('date', 'unknown')}_{meta.get('stadium', 'unknown')}_{meta.get('race_number', '0R')}"
             snapshot_dir = os.path.join(self.SNAPSHOT_DIR, prefix)
-            os.makedirs(snapshot_dir, exist_ok=True)
-
-            for key, html in html_data.items():
-                if html:
-                    fpath = os.path.join(snapshot_dir, f"{key}.html")
-                    with open(fpath, 'w', encoding='utf-8') as f:
-                        f.write(html)
-
+            self.store.write(snapshot_dir, {"fetched_at": ts_info["odds_fetched_at"],
+                                            "unix": ts_info["odds_fetched_unix"]}, dict(html_data))
             ts_info["snapshot_path"] = snapshot_dir
 
         return ts_info
@@ -389,12 +658,7 @@ class OddsParserTester:
         保存済みHTMLでパーサーを実行し、結果を検証。
         parse_func: parse_all_odds関数
         """
-        html_data = {}
-        for fname in os.listdir(snapshot_dir):
-            if fname.endswith('.html'):
-                key = fname.replace('.html', '')
-                with open(os.path.join(snapshot_dir, fname), 'r', encoding='utf-8') as f:
-                    html_data[key] = f.read()
+        html_data = self.load_snapshot(snapshot_dir)
 
         # パース実行
         import copy
@@ -409,6 +673,150 @@ class OddsParserTester:
 
         return result
 
+    @staticmethod
+    def load_snapshot(snapshot_dir: str, poll: int = -1) -> Dict[str, str]:
+        """
+        スナップショット → {ページ: HTML}。マニフェストがあれば poll 番目（既定は最新）のポーリング、
+        なければ旧形式（ページごとの .html）を読む
+        """
+        polls = SnapshotStore.read_manifest(snapshot_dir)
+        if polls:
+            store = get_snapshot_store(os.path.dirname(os.path.normpath(snapshot_dir)))
+            return {key: store.read_blob(digest) for key, digest in polls[poll]["pages"].items()}
+        html_data = {}
+        for fname in os.listdir(snapshot_dir):
+            if fname.endswith('.html'):
+                key = fname.replace('.html', '')
+                with open(os.path.join(snapshot_dir, fname), 'r', encoding='utf-8') as f:
+                    html_data[key] = f.read()
+        return html_data
+
+    @staticmethod
+    def snapshot_dirs(snapshot_root: str) -> List[Tuple[str, str]]:
+        """snapshot_root 直下のレースごとのスナップショット [(名前, パス)]（_blobs 等は除く）"""
+        names = sorted(os.listdir(snapshot_root)) if os.path.isdir(snapshot_root) else []
+        return [(name, os.path.join(snapshot_root, name)) for name in names
+                if not name.startswith('_') and os.path.isdir(os.path.join(snapshot_root, name))]
+
+    def test_fast_path(self, snapshot_root: str = OddsTimestamp.SNAPSHOT_DIR) -> dict:
+        """
+        全スナップショットで DOM を作らないオッズ抽出（race_scraper.extract_odds）を
+        DOM パーサー（html.parser）と突き合わせる。構造チェックで DOM に戻ったページも数える。
+        """
+        from race_scraper import new_race_data, extract_odds, parse_all_odds
+        report = {"snapshots": 0, "identical": 0, "mismatches": [], "fallback": {}}
+        for name, snapshot_dir in self.snapshot_dirs(snapshot_root):
+            html_data = self.load_snapshot(snapshot_dir)
+            fast, dom = new_race_data("", "", 0), new_race_data("", "", 0)
+            fallback = extract_odds(html_data, fast)
+            parse_all_odds(html_data, dom, "html.parser")
+            report["snapshots"] += 1
+            for page in fallback:
+                report["fallback"][page] = report["fallback"].get(page, 0) + 1
+            diff = [k for k in dom["odds"] if fast["odds"][k] != dom["odds"][k]]
+            if diff:
+                report["mismatches"].append({"snapshot": name, "types": diff})
+            else:
+                report["identical"] += 1
+        return report
+
+
+class ParserBenchmark:
+    """
+    保存済みHTMLスナップショット（OddsTimestamp が保存したもの）でパーサーを計測。
+    ページ種別ごとに各パーサーの1ページあたり解析時間を出し、
+    基準実装（html.parser）と異なる race_data になったページを列挙する。
+
+    使い方:
+      python data_quality.py bench_parser --snapshots odds_snapshots --repeat 5
+    """
+
+    BASELINE = "html.parser"
+
+    ODDS_PAGES = ("odds3t", "odds3f", "odds2tf", "oddsk", "oddstf")
+
+    def _parse(self, page: str, html: str, parser: str):
+        from race_scraper import (new_race_data, parse_racelist, parse_beforeinfo,
+                                  parse_all_odds, parse_raceresult, extract_odds)
+        if parser == "regex":
+            rd = new_race_data("", "", 0)
+            self._fallback = extract_odds({page: html}, rd)
+            return rd
+        if page == "raceresult":
+            return parse_raceresult(html, parser)
+        rd = new_race_data("", "", 0)
+        if page == "racelist":
+            parse_racelist(html, rd, parser)
+        elif page == "beforeinfo":
+            parse_beforeinfo(html, rd, parser)
+        else:
+            parse_all_odds({page: html}, rd, parser)
+        return rd
+
+    def run(self, snapshot_root: str = OddsTimestamp.SNAPSHOT_DIR, repeat: int = 3,
+            parsers: Optional[List[str]] = None) -> dict:
+        import time
+        from race_scraper import ODDS_PARSERS
+        parsers = list(parsers or ODDS_PARSERS)
+        pages = {}
+        mismatches = []
+        n_snapshots = 0
+        for name, snapshot_dir in OddsParserTester.snapshot_dirs(snapshot_root):
+            n_snapshots += 1
+            for page, html in sorted(OddsParserTester.load_snapshot(snapshot_dir).items()):
+                page_parsers = [p for p in parsers if p != "regex" or page in self.ODDS_PAGES]
+                stats = pages.setdefault(page, {"count": 0, "fallback": 0,
+                                                "seconds": {p: 0.0 for p in page_parsers}})
+                stats["count"] += 1
+                outputs = {}
+                for parser in page_parsers:
+                    best = float('inf')
+                    for _ in range(max(1, repeat)):
+                        t0 = time.perf_counter()
+                        outputs[parser] = self._parse(page, html, parser)
+                        best = min(best, time.perf_counter() - t0)
+                    stats["seconds"][parser] += best
+                    if parser == "regex":
+                        stats["fallback"] += bool(self._fallback)
+                if self.BASELINE in outputs:
+                    for parser in page_parsers:
+                        if outputs[parser] != outputs[self.BASELINE]:
+                            mismatches.append({"snapshot": name, "page": page, "parser": parser})
+
+        report = {"snapshots": n_snapshots, "repeat": repeat, "pages": {}, "mismatches": mismatches}
+        for page, stats in sorted(pages.items()):
+            ms = {p: round(sec / stats["count"] * 1000, 3) for p, sec in stats["seconds"].items()}
+            entry = {"count": stats["count"], "ms_per_page": ms}
+            if "regex" in ms:
+                entry["regex_fallback"] = stats["fallback"]
+            if self.BASELINE in ms:
+                entry["speedup"] = {p: round(ms[self.BASELINE] / v, 1) if v > 0 else None
+                                    for p, v in ms.items() if p != self.BASELINE}
+            report["pages"][page] = entry
+        return report
+
+    @staticmethod
+    def format(report: dict) -> str:
+        parsers = [p for p in ("regex", "lxml", "html.parser")
+                   if any(p in e["ms_per_page"] for e in report["pages"].values())]
+        lines = [f"=== パーサーベンチマーク: スナップショット {report['snapshots']}件 "
+                 f"（各ページ {report['repeat']}回中の最速） ===",
+                 f"{'ページ':<12}{'件数':>6}" + "".join(f"{p + ' ms':>16}" for p in parsers) + f"{'速度比':>16}"]
+        for page, e in report["pages"].items():
+            speed = " / ".join(f"{v}x" for v in e.get("speedup", {}).values() if v is not None)
+            lines.append(f"{page:<12}{e['count']:>6}" +
+                         "".join(f"{e['ms_per_page'][p]:>16.3f}" if p in e["ms_per_page"] else f"{'-':>16}"
+                                 for p in parsers) + f"{speed:>16}")
+            if e.get("regex_fallback"):
+                lines.append(f"  └ regex の構造チェック失敗 → DOM: {e['regex_fallback']}件")
+        if report["mismatches"]:
+            lines.append(f"🛑 基準実装と不一致: {len(report['mismatches'])}件")
+            for m in report["mismatches"][:20]:
+                lines.append(f"  {m['snapshot']} {m['page']} ({m['parser']})")
+        else:
+            lines.append("✅ 全ページで基準実装と一致")
+        return "\n".join(lines)
+
 
 # ============================================================
 # CLI
@@ -423,37 +831,71 @@ if __name__ == "__main__":
             print("Usage: python data_quality.py test_parser --snapshot <dir>")
             sys.exit(1)
 
-        # app.pyはStreamlit環境が必要なため、完全なmockで全st.*呼び出しを無効化
-        import sys
-        import types
-
-        class _StreamlitMock(types.ModuleType):
-            """app.pyのモジュールレベルst.*呼び出しを全て吸収するモック"""
-            def __getattr__(self, name):
-                # 任意の属性アクセスにcallable mockを返す
-                def _noop(*a, **kw):
-                    return lambda f: f  # デコレータ対応
-                return _noop
-
-        mock_st = _StreamlitMock("streamlit")
-        orig_st = sys.modules.get("streamlit")
-        sys.modules["streamlit"] = mock_st
-        try:
-            import importlib.util
-            spec = importlib.util.spec_from_file_location("app_module", "app.py")
-            app_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(app_module)
-            parse_all_odds = app_module.parse_all_odds
-        finally:
-            # 元のstreamlitモジュールを復元
-            if orig_st is not None:
-                sys.modules["streamlit"] = orig_st
-            else:
-                sys.modules.pop("streamlit", None)
+        # パーサーは race_scraper.py にあり Streamlit なしで import できる
+        from race_scraper import parse_all_odds
         tester = OddsParserTester()
         template = {"odds": {"3連単": {}, "3連複": {}, "2連単": {}, "2連複": {}, "拡連複": {}, "単勝": {}, "複勝": {}}}
         result = tester.test_snapshot(snapshot, parse_all_odds, template)
         print(json.dumps(result, ensure_ascii=False, indent=2))
+    elif len(sys.argv) > 1 and sys.argv[1] == "bench_parser":
+        snapshot_root = OddsTimestamp.SNAPSHOT_DIR
+        repeat = 3
+        for i, arg in enumerate(sys.argv):
+            if arg == "--snapshots" and i + 1 < len(sys.argv):
+                snapshot_root = sys.argv[i + 1]
+            elif arg == "--repeat" and i + 1 < len(sys.argv):
+                repeat = int(sys.argv[i + 1])
+        report = ParserBenchmark().run(snapshot_root, repeat)
+        if "--json" in sys.argv:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            print(ParserBenchmark.format(report))
+        if report["mismatches"]:
+            sys.exit(1)
+    elif len(sys.argv) > 1 and sys.argv[1] == "test_cross_market":
+        # Check 9 の閾値の確認: 整合した合成板がほぼ通り、1番人気と最下位艇の艇番ずれが検知されること
+        from benchmarks import synthetic_race
+        n_races = 500
+        for i, arg in enumerate(sys.argv):
+            if arg == "--races" and i + 1 < len(sys.argv):
+                n_races = int(sys.argv[i + 1])
+
+        def swap_boats(book, a, b):
+            out = {}
+            for key, v in book.items():
+                sep = "-" if "-" in key else "="
+                out[sep.join(str({a: b, b: a}.get(int(x), int(x))) for x in key.split(sep))] = v
+            return out
+
+        validator = OddsValidator()
+        clean_warn, swap_hit = 0, {}
+        for seed in range(n_races):
+            odds = synthetic_race(seed)["odds"]
+            clean_warn += any("implied" in w for w in validator.validate(odds)["warnings"])
+            by_odds = sorted(odds["単勝"], key=lambda k: float(odds["単勝"][k]))
+            fav, weakest = int(by_odds[0]), int(by_odds[-1])
+            for bt in ("単勝", "2連単", "2連複", "3連複"):
+                swapped = {**odds, bt: swap_boats(odds[bt], fav, weakest)}
+                hit = any("implied" in w for w in validator.validate(swapped)["warnings"])
+                swap_hit[bt] = swap_hit.get(bt, 0) + hit
+        report = {"races": n_races, "threshold": OddsValidator.CROSS_MARKET_TV_OK,
+                  "clean_warn_rate": round(clean_warn / n_races, 4),
+                  "swap_detect_rate": {bt: round(h / n_races, 3) for bt, h in swap_hit.items()}}
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        if report["clean_warn_rate"] > 0.01 or min(report["swap_detect_rate"].values()) < 0.7:
+            sys.exit(1)
+    elif len(sys.argv) > 1 and sys.argv[1] == "test_fast_odds":
+        snapshot_root = OddsTimestamp.SNAPSHOT_DIR
+        for i, arg in enumerate(sys.argv):
+            if arg == "--snapshots" and i + 1 < len(sys.argv):
+                snapshot_root = sys.argv[i + 1]
+        report = OddsParserTester().test_fast_path(snapshot_root)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        if report["mismatches"]:
+            sys.exit(1)
     else:
         print("Usage:")
         print("  python data_quality.py test_parser --snapshot <dir>")
+        print("  python data_quality.py test_fast_odds [--snapshots odds_snapshots]")
+        print("  python data_quality.py test_cross_market [--races 500]")
+        print("  python data_quality.py bench_parser [--snapshots odds_snapshots] [--repeat 3] [--json]")
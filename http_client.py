@@ -0,0 +1,270 @@
+"""
+http_client.py — Shared HTTP Layer (connection pool + conditional GET + response cache)
+========================================================================================
+app.py / live_scanner.py / odds_poller.py / backtest_system.py が共有する boatrace.jp 取得層。
+
+  - プロセス全体で1つのプール済みセッション（keep-alive を再実行・スレッド間で使い回す）
+  - ETag / Last-Modified があれば条件付きGET（304 ならキャッシュ本文を返す）
+  - 確定後に変わらないページ（公開後の出走表・確定後の結果）はディスクに保存し、
+    TTL 内は通信しない。容量を超えたら最終利用が古いものから削除。
+  - それ以外（直前情報・オッズ・開催一覧）は検証子と本文をメモリに持ち、毎回条件付きGET
+
+使い方:
+  html = http_get(url)                                 # 失敗時 None
+  html = http_get(url, acquire=bucket.acquire)          # 通信する時だけレート制限を通す
+
+  python http_client.py stats     # キャッシュ件数・容量
+  python http_client.py clear     # キャッシュ削除
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import requests
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
+CACHE_DIR = "http_cache"
+DISK_MAX_BYTES = 256 * 1024 * 1024
+MEMORY_MAX_ENTRIES = 512
+DEFAULT_POOL_SIZE = 16
+
+# ページ名（URL パス末尾）→ (TTL秒, ディスクに保存するか, 確定済みか判定)
+# 確定判定が False の本文（発表前の出走表・確定前の結果）は TTL 0 のメモリ扱いにする
+def _racelist_published(html):
+    return "is-tableFixed__3rdadd" in html and "toban=" in html
+
+
+def _result_confirmed(html):
+    from race_scraper import parse_raceresult
+    return parse_raceresult(html) is not None
+
+
+CACHE_POLICY = {
+    "racelist": (24 * 3600, True, _racelist_published),
+    "raceresult": (30 * 24 * 3600, True, _result_confirmed),
+    "index": (60, False, None),
+}
+NO_CACHE = (0, False, None)
+
+
+def page_policy(url: str):
+    page = url.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+    return CACHE_POLICY.get(page, NO_CACHE)
+
+
+# ============================================================
+# セッション
+# ============================================================
+_session = None
+_pool_size = 0
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """プロセス共有のプール済みセッション（より大きい pool_size を求められたら接続プールを張り替える）"""
+    global _session, _pool_size
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update(HEADERS)
+        if pool_size > _pool_size:
+            from requests.adapters import HTTPAdapter
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _pool_size = pool_size
+        return _session
+
+
+# ============================================================
+# キャッシュ
+# ============================================================
+class ResponseCache:
+    """
+    URL → {"body", "etag", "last_modified", "expires"}。
+    メモリは LRU（MEMORY_MAX_ENTRIES 件）、永続化対象はディスク（1 URL 1 JSON）にも書く。
+    ディスクは合計 max_bytes を超えたら mtime（最終利用）の古い順に削除。
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = DISK_MAX_BYTES,
+                 max_entries: int = MEMORY_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+        self.hits = self.revalidated = self.misses = 0
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + ".json")
+
+    def get(self, url: str, disk: bool = True) -> Optional[Dict]:
+        with self._lock:
+            entry = self._memory.get(url)
+            if entry is not None:
+                self._memory.move_to_end(url)
+                return entry
+        if not disk:
+            return None
+        path = self._path(url)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        if entry.get("url") != url:
+            return None
+        self._remember(url, entry)
+        return entry
+
+    def _remember(self, url: str, entry: Dict):
+        with self._lock:
+            self._memory[url] = entry
+            self._memory.move_to_end(url)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def put(self, url: str, entry: Dict, persist: bool = False):
+        self._remember(url, entry)
+        if not persist:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(url)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"url": url, **entry}, f, ensure_ascii=False)
+        old = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp, path)
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_bytes()
+            else:
+                self._disk_bytes += os.path.getsize(path) - old
+            over = self._disk_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def _scan_bytes(self) -> int:
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        return sum(e.stat().st_size for e in os.scandir(self.cache_dir) if e.name.endswith(".json"))
+
+    def evict(self, target: Optional[int] = None):
+        """ディスク容量を target（省略時は上限の 90%）まで最終利用の古い順に削除"""
+        target = int(self.max_bytes * 0.9) if target is None else target
+        if not os.path.isdir(self.cache_dir):
+            return
+        files = sorted((e.stat().st_mtime, e.stat().st_size, e.path)
+                       for e in os.scandir(self.cache_dir) if e.name.endswith(".json"))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        self.evict(target=0)
+
+    def stats(self) -> Dict:
+        files = [e for e in os.scandir(self.cache_dir) if e.name.endswith(".json")] \
+            if os.path.isdir(self.cache_dir) else []
+        return {"memory_entries": len(self._memory), "disk_entries": len(files),
+                "disk_bytes": sum(e.stat().st_size for e in files),
+                "hits": self.hits, "revalidated": self.revalidated, "misses": self.misses}
+
+
+_cache = None
+
+
+def get_cache() -> ResponseCache:
+    global _cache
+    with _session_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+# ============================================================
+# GET
+# ============================================================
+def http_get(url: str, session: Optional[requests.Session] = None, acquire: Optional[Callable[[], None]] = None,
+             retries: int = 3, backoff: float = 1.0, cache: Optional[ResponseCache] = None) -> Optional[str]:
+    """
+    キャッシュ・条件付きGET付きの GET → 本文（UTF-8）。
+    TTL 内のキャッシュがあれば通信しない（acquire も呼ばない）。
+    接続エラー・429・5xx は指数バックオフで再試行し、それ以外の失敗（404等）と再試行上限到達時は None
+    """
+    session = session or get_session()
+    cache = cache or get_cache()
+    ttl, persist, is_final = page_policy(url)
+    entry = cache.get(url, disk=persist)
+    if entry is not None and entry["expires"] > time.time():
+        cache.hits += 1
+        return entry["body"]
+
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+
+    for attempt in range(retries):
+        if acquire: acquire()
+        try:
+            res = session.get(url, timeout=10, headers=headers)
+            if res.status_code == 304 and entry is not None:
+                cache.revalidated += 1
+                entry = {**entry, "expires": time.time() + ttl}
+                cache.put(url, entry, persist and ttl > 0)
+                return entry["body"]
+            if res.status_code == 429 or res.status_code >= 500:
+                raise requests.HTTPError(f"{res.status_code}", response=res)
+            res.raise_for_status()
+            res.encoding = 'utf-8'
+            body = res.text
+        except requests.HTTPError as e:
+            code = e.response.status_code if e.response is not None else 0
+            if code != 429 and code < 500:
+                return None
+        except requests.RequestException:
+            pass
+        else:
+            cache.misses += 1
+            final = ttl > 0 and (is_final is None or is_final(body))
+            etag, last_modified = res.headers.get("ETag"), res.headers.get("Last-Modified")
+            if final or etag or last_modified:
+                cache.put(url, {"body": body, "etag": etag, "last_modified": last_modified,
+                                "expires": time.time() + ttl if final else 0},
+                          persist and final)
+            return body
+        if attempt < retries - 1:
+            time.sleep(backoff * (2 ** attempt))
+    return None
+
+
+if __name__ == "__main__":
+    import sys
+
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if cmd == "clear":
+        get_cache().clear()
+        print(f"🗑 {CACHE_DIR}/ を削除しました")
+    elif cmd == "stats":
+        print(json.dumps(get_cache().stats(), ensure_ascii=False, indent=2))
+    else:
+        print("Usage:")
+        print("  python http_client.py stats")
+        print("  python http_client.py clear")
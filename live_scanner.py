@@ -0,0 +1,185 @@
+"""
+live_scanner.py — All-Venue Live Scanner (headless)
+=====================================================
+開催中の全場の未発走レースをまとめて取得 → analyze() → EV順の買い目ボードを出力。
+app.py は1レースずつ7ページを7並列で取得するが、こちらは全レース×7ページを
+1つの有界スレッドプール（1つのプール済みセッション）に投入する。
+
+使い方:
+  # 今日の全場・残り全レース
+  python live_scanner.py
+
+  # 各場の次の2レースだけ、16並列、上位20件をJSONで
+  python live_scanner.py --next 2 --workers 16 --top 20 --json
+
+  # 日付・資金を指定
+  python live_scanner.py --date 20260101 --bankroll 30000
+
+  # 段階別の所要時間（取得待ち/パース/品質/解析と analyze 内部）も出す
+  python live_scanner.py --profile
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from analysis_cache import analyze_cached
+from http_client import get_session
+from profiler import PROFILER, format_report, stage
+from race_scraper import (JCD_MAP, fetch_available_races, new_race_data, race_urls,
+                          submit_race_pages, parse_race_pages, RACE_PAGES)
+
+# 安全にインポート（モジュールがない場合でも動作）
+try:
+    from data_quality import DataQualityMonitor
+    HAS_DATA_QUALITY = True
+except ImportError:
+    HAS_DATA_QUALITY = False
+
+try:
+    from tide_data import TideInjector
+    HAS_TIDE = True
+except ImportError:
+    HAS_TIDE = False
+
+
+class LiveScanner:
+    """
+    全場スキャナ。
+      scanner = LiveScanner(bankroll=10000, workers=16)
+      report = scanner.scan()   # {"board": [...EV降順の買い目...], "races": [...], ...}
+    """
+
+    def __init__(self, target_date: Optional[str] = None, bankroll: int = 10000, workers: int = 16,
+                 next_races: Optional[int] = None, ml_model=None):
+        self.target_date = target_date or datetime.now().strftime('%Y%m%d')
+        self.bankroll = bankroll
+        self.workers = workers
+        self.next_races = next_races      # 各場の先頭 N レースのみ（None = 残り全レース）
+        self.ml_model = ml_model
+
+    def schedule(self) -> List[tuple]:
+        """(場, R) の一覧。発走順が近いものから取得されるよう R 昇順 → 場順に並べる"""
+        available = fetch_available_races(self.target_date)
+        races = []
+        for venue, rnos in available.items():
+            if self.next_races is not None:
+                rnos = rnos[:self.next_races]
+            races.extend((venue, rno) for rno in rnos)
+        races.sort(key=lambda x: (x[1], JCD_MAP[x[0]]))
+        return races
+
+    def _session(self):
+        return get_session(self.workers)
+
+    def scan(self) -> Dict:
+        races = self.schedule()
+        session = self._session()
+        report = {"date": self.target_date, "scanned": 0, "skipped": [], "races": [], "board": []}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as ex:
+            # 全レースのページ取得を先に投入し、発走順に結果を回収して解析
+            pending = [(venue, rno, submit_race_pages(race_urls(self.target_date, JCD_MAP[venue], rno), session, ex))
+                       for venue, rno in races]
+            for venue, rno, futs in pending:
+                with stage("scan.wait"):
+                    html_data = {k: f.result() for k, f in futs.items()}
+                entry = self._analyze_race(venue, rno, html_data)
+                report["scanned"] += 1
+                if entry.get("skip"):
+                    report["skipped"].append({"venue": venue, "race": f"{rno}R", "reason": entry["skip"]})
+                    continue
+                report["races"].append(entry["summary"])
+                report["board"].extend(entry["targets"])
+
+        report["board"].sort(key=lambda t: t["ev"], reverse=True)
+        return report
+
+    def _analyze_race(self, venue: str, rno: int, html_data: Dict[str, str]) -> Dict:
+        race_data = new_race_data(self.target_date, venue, rno)
+        with stage("scan.parse"):
+            parse_race_pages(html_data, race_data)
+
+        # [Bug#17] app.py と同じデータ品質ゲート
+        if HAS_DATA_QUALITY:
+            with stage("scan.quality"):
+                quality = DataQualityMonitor().assess(race_data, html_data)
+            if not quality["tradeable"]:
+                return {"skip": quality["recommendation"]}
+
+        if HAS_TIDE:
+            with stage("scan.tide"):
+                race_data = TideInjector().inject(race_data)
+
+        with stage("scan.analyze"):
+            result = analyze_cached(race_data, self.bankroll, ml_model=self.ml_model)
+        if result.get("error"):
+            return {"skip": result["error"]}
+
+        race = f"{rno}R"
+        summary = result["summary"]
+        warnings = list(result.get("warnings", []))
+        missing = [k for k in RACE_PAGES if not html_data.get(k)]
+        if missing:
+            warnings.append(f"取得失敗ページ: {', '.join(missing)}")
+        targets = [{"venue": venue, "race": race, "type": t["type"], "combo": t["combo"],
+                    "prob": t["prob"], "odds": t["odds"], "ev": t["ev"],
+                    "kelly_pct": t["kelly_pct"], "recommended_yen": t["recommended_yen"]}
+                   for t in result["targets"]]
+        return {
+            "summary": {"venue": venue, "race": race, "verdict": summary["verdict"],
+                        "count": summary["count"], "max_ev": summary["max_ev"],
+                        "warnings": warnings},
+            "targets": targets,
+        }
+
+
+def format_board(report: Dict, top: int = 30) -> str:
+    lines = [f"=== {report['date']} ライブスキャン: {report['scanned']}R 取得 / "
+             f"{len(report['races'])}R 解析 / 買い目 {len(report['board'])}件 ===",
+             f"{'EV':>6} {'場':<4} {'R':>3} {'券種':<4} {'組番':<7} {'確率':>6} {'オッズ':>7} {'推奨額':>8}"]
+    for t in report["board"][:top]:
+        lines.append(f"{t['ev']:6.2f} {t['venue']:<4} {t['race']:>3} {t['type']:<4} {t['combo']:<7} "
+                     f"{t['prob'] * 100:5.1f}% {t['odds']:7.1f} ¥{t['recommended_yen']:>7,}")
+    if report["skipped"]:
+        lines.append(f"--- スキップ {len(report['skipped'])}R ---")
+        for s in report["skipped"]:
+            lines.append(f"  {s['venue']} {s['race']}: {s['reason']}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import sys
+
+    target_date = None
+    bankroll = 10000
+    workers = 16
+    next_races = None
+    top = 30
+    as_json = "--json" in sys.argv
+    if "--profile" in sys.argv:
+        PROFILER.enable()
+    for i, arg in enumerate(sys.argv):
+        if arg == "--date" and i + 1 < len(sys.argv):
+            target_date = sys.argv[i + 1]
+        elif arg == "--bankroll" and i + 1 < len(sys.argv):
+            bankroll = int(sys.argv[i + 1])
+        elif arg == "--workers" and i + 1 < len(sys.argv):
+            workers = int(sys.argv[i + 1])
+        elif arg == "--next" and i + 1 < len(sys.argv):
+            next_races = int(sys.argv[i + 1])
+        elif arg == "--top" and i + 1 < len(sys.argv):
+            top = int(sys.argv[i + 1])
+
+    scanner = LiveScanner(target_date, bankroll=bankroll, workers=workers, next_races=next_races)
+    report = scanner.scan()
+    if PROFILER.enabled:
+        report["profile"] = PROFILER.report()
+    if as_json:
+        report["board"] = report["board"][:top]
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(format_board(report, top))
+        if PROFILER.enabled:
+            print("\n⏱ 段階別の所要時間")
+            print(format_report(report["profile"]))
@@ -0,0 +1,302 @@
+"""
+odds_poller.py — Deadline-Aware Odds Polling Scheduler
+=======================================================
+各レースの締切予定時刻を取得し、締切が近いレースほど短い間隔でオッズを再取得する。
+全リクエストは1つのトークンバケット（rate 件/秒）と総リクエスト上限（--budget）を通す。
+取得したオッズは RaceSession.update() に流し、スナップショットごとに on_snapshot を呼ぶ。
+
+  締切まで   ポーリング間隔
+  〜2分      10秒
+  〜5分      20秒
+  〜10分     45秒
+  〜30分     2分
+  〜60分     5分      （horizon より先のレースはまだ取得しない）
+
+同時刻に複数レースが取得待ちになった場合は締切の近いレースから予算を使う。
+
+使い方:
+  # 今日の全場、平均2件/秒・総3000件まで
+  python odds_poller.py --rate 2 --budget 3000
+
+  # 住之江だけ、締切30分前から
+  python odds_poller.py --venue 住之江 --horizon 30
+"""
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from rtpt_engine import RaceSession
+from backtest_system import TokenBucket
+from http_client import get_session
+from race_scraper import (JCD_MAP, RACE_PAGES, fetch_available_races, new_race_data, race_urls,
+                          submit_race_pages, parse_deadlines, parse_racelist, parse_beforeinfo, parse_all_odds)
+
+try:
+    from data_quality import DataQualityMonitor
+    HAS_DATA_QUALITY = True
+except ImportError:
+    HAS_DATA_QUALITY = False
+
+try:
+    from tide_data import TideInjector
+    HAS_TIDE = True
+except ImportError:
+    HAS_TIDE = False
+
+# (締切までの秒数の上限, ポーリング間隔秒)
+POLL_TIERS = ((120, 10), (300, 20), (600, 45), (1800, 120), (3600, 300))
+STATIC_PAGES = ("racelist", "beforeinfo")
+ODDS_PAGES = tuple(p for p in RACE_PAGES if p not in STATIC_PAGES)
+# 展示情報は締切10分前後に出るので、この時点で直前情報を1回だけ取り直す
+BEFOREINFO_LEAD = 600
+
+
+def poll_interval(seconds_left, tiers=POLL_TIERS):
+    """締切までの秒数 → 次回取得までの秒数（最も遠い段より先は最も長い間隔）"""
+    for limit, interval in tiers:
+        if seconds_left <= limit:
+            return interval
+    return tiers[-1][1]
+
+
+def deadline_unix(target_date, hhmm):
+    return datetime.strptime(f"{target_date} {hhmm}", "%Y%m%d %H:%M").timestamp()
+
+
+class PolledRace:
+    """ポーリング対象1レースの状態"""
+
+    def __init__(self, venue: str, rno: int, deadline: float):
+        self.venue = venue
+        self.rno = rno
+        self.deadline = deadline
+        self.race_data = None
+        self.session = None
+        self.beforeinfo_refreshed = False
+        self.static_html = {}
+        self.polls = 0
+
+    @property
+    def key(self):
+        return f"{self.venue} {self.rno}R"
+
+
+class OddsPoller:
+    """
+    締切連動のオッズポーリング。
+      poller = OddsPoller(rate=2.0, budget=3000, on_snapshot=print)
+      poller.run()          # 対象レースが全て締切を過ぎるか予算が尽きるまで
+      poller.latest         # {"住之江 5R": 最新スナップショット}
+    now / sleep は差し替え可能（テスト・リプレイ用）。
+    """
+
+    def __init__(self, target_date: Optional[str] = None, bankroll: int = 10000, rate: float = 2.0,
+                 burst: int = len(ODDS_PAGES), budget: Optional[int] = None, workers: int = 8,
+                 horizon: float = 3600, tiers=POLL_TIERS, venues: Optional[List[str]] = None,
+                 on_snapshot: Optional[Callable[[Dict], None]] = None, ml_model=None,
+                 now: Callable[[], float] = time.time, sleep: Callable[[float], None] = time.sleep):
+        self.target_date = target_date or datetime.now().strftime('%Y%m%d')
+        self.bankroll = bankroll
+        self.bucket = TokenBucket(rate, burst)
+        self.budget = budget
+        self.workers = workers
+        self.tiers = tiers
+        self.horizon = horizon
+        self.venues = venues
+        self.on_snapshot = on_snapshot
+        self.ml_model = ml_model
+        self.now = now
+        self.sleep = sleep
+        self.used = 0
+        self.latest = {}
+        self._queue = []
+
+    # ---- 予算 ----
+    def _spend(self, n):
+        """n 件分の予算を確保（トークンバケットで待つ）。総上限を超えるなら False"""
+        if self.budget is not None and self.used + n > self.budget:
+            return False
+        for _ in range(n):
+            self.bucket.acquire()
+        self.used += n
+        return True
+
+    def _session(self):
+        return get_session(self.workers)
+
+    def _fetch(self, venue, rno, pages, session, ex):
+        """venue の rno レースの pages を取得 → {キー: HTML}。予算切れなら None"""
+        if not self._spend(len(pages)):
+            return None
+        urls = race_urls(self.target_date, JCD_MAP[venue], rno)
+        futs = submit_race_pages({k: urls[k] for k in pages}, session, ex)
+        return {k: f.result() for k, f in futs.items()}
+
+    # ---- スケジュール ----
+    def discover(self, session, ex) -> List[PolledRace]:
+        """開催場ごとに先頭レースの出走表を1回取得し、締切予定時刻から対象レースを作る"""
+        available = fetch_available_races(self.target_date)
+        races = []
+        for venue, rnos in available.items():
+            if self.venues and venue not in self.venues: continue
+            if not rnos: continue
+            html = self._fetch(venue, rnos[0], ("racelist",), session, ex)
+            if html is None: break
+            deadlines = parse_deadlines(html["racelist"])
+            for rno in rnos:
+                if rno not in deadlines: continue
+                race = PolledRace(venue, rno, deadline_unix(self.target_date, deadlines[rno]))
+                if rno == rnos[0]:
+                    race.static_html["racelist"] = html["racelist"]
+                races.append(race)
+        return races
+
+    def _push(self, due, race):
+        heapq.heappush(self._queue, (due, race.deadline, race.key, race))
+
+    def schedule(self, races: List[PolledRace]):
+        now = self.now()
+        for race in races:
+            if race.deadline <= now: continue
+            self._push(max(now, race.deadline - self.horizon), race)
+
+    def _next_ready(self):
+        """取得時刻を過ぎたレースのうち締切が最も近いもの（なければ次の取得時刻まで待つ）"""
+        while self._queue:
+            now = self.now()
+            due = self._queue[0][0]
+            if due > now:
+                self.sleep(due - now)
+                continue
+            ready = []
+            while self._queue and self._queue[0][0] <= now:
+                ready.append(heapq.heappop(self._queue))
+            ready.sort(key=lambda x: (x[1], x[2]))
+            for item in ready[1:]:
+                heapq.heappush(self._queue, item)
+            return ready[0][3]
+        return None
+
+    # ---- 取得 → 解析 ----
+    def _prepare(self, race, session, ex):
+        """出走表・直前情報を取得して RaceSession を（作り直）す。予算切れなら False"""
+        pages = [p for p in STATIC_PAGES if p not in race.static_html]
+        if race.session is not None:
+            pages = ["beforeinfo"]
+        if pages:
+            html = self._fetch(race.venue, race.rno, pages, session, ex)
+            if html is None: return False
+            race.static_html.update(html)
+        race_data = new_race_data(self.target_date, race.venue, race.rno)
+        parse_racelist(race.static_html.get("racelist"), race_data)
+        parse_beforeinfo(race.static_html.get("beforeinfo"), race_data)
+        if HAS_TIDE:
+            race_data = TideInjector().inject(race_data)
+        race.race_data = race_data
+        race.session = RaceSession(race_data, self.bankroll, ml_model=self.ml_model)
+        return True
+
+    def poll(self, race: PolledRace, session, ex) -> Optional[Dict]:
+        """1レース分のオッズを取得して再解析 → スナップショット。予算切れなら None"""
+        left = race.deadline - self.now()
+        if race.session is None:
+            if not self._prepare(race, session, ex): return None
+            race.beforeinfo_refreshed = left <= BEFOREINFO_LEAD
+        elif not race.beforeinfo_refreshed and left <= BEFOREINFO_LEAD:
+            if not self._prepare(race, session, ex): return None
+            race.beforeinfo_refreshed = True
+
+        html = self._fetch(race.venue, race.rno, ODDS_PAGES, session, ex)
+        if html is None: return None
+        race.polls += 1
+        fetched_at = self.now()
+        odds = new_race_data(self.target_date, race.venue, race.rno)["odds"]
+        parse_all_odds(html, {"odds": odds})
+
+        snapshot = {"venue": race.venue, "race": f"{race.rno}R", "poll": race.polls,
+                    "fetched_at": datetime.fromtimestamp(fetched_at).isoformat(timespec="seconds"),
+                    "seconds_to_deadline": round(race.deadline - fetched_at),
+                    "missing_pages": [k for k in ODDS_PAGES if not html.get(k)],
+                    "odds": odds, "result": None, "skip": None}
+        if HAS_DATA_QUALITY:
+            # [Bug#17] app.py と同じデータ品質ゲート（HTML スナップショットは保存しない）
+            quality = DataQualityMonitor().assess({**race.race_data, "odds": odds})
+            if not quality["tradeable"]:
+                snapshot["skip"] = quality["recommendation"]
+        if snapshot["skip"] is None:
+            snapshot["result"] = race.session.update(odds)
+        self.latest[race.key] = snapshot
+        if self.on_snapshot:
+            self.on_snapshot(snapshot)
+        return snapshot
+
+    def run(self, races: Optional[List[PolledRace]] = None) -> Dict:
+        """races（省略時は discover()）を締切まで、または予算が尽きるまでポーリング"""
+        session = self._session()
+        self._queue = []
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=self.workers) as ex:
+            if races is None:
+                races = self.discover(session, ex)
+            self.schedule(races)
+            while True:
+                race = self._next_ready()
+                if race is None: break
+                if race.deadline <= self.now(): continue
+                if self.poll(race, session, ex) is None:
+                    exhausted = True
+                    break
+                due = self.now() + poll_interval(race.deadline - self.now(), self.tiers)
+                if due < race.deadline:
+                    self._push(due, race)
+        return {"date": self.target_date, "races": len(races), "requests": self.used,
+                "budget": self.budget, "budget_exhausted": exhausted,
+                "snapshots": sum(r.polls for r in races)}
+
+
+def format_snapshot(s: Dict) -> str:
+    left = max(0, s["seconds_to_deadline"])
+    head = f"[{s['fetched_at'][11:]}] {s['venue']:<4} {s['race']:>3} 締切まで{left // 60:3d}:{left % 60:02d} #{s['poll']:<3}"
+    if s["skip"]:
+        return f"{head} スキップ: {s['skip']}"
+    summary = s["result"]["summary"] if s["result"] and not s["result"].get("error") else None
+    if summary is None:
+        return f"{head} {s['result'].get('error') if s['result'] else '解析なし'}"
+    return f"{head} {summary['verdict']} 買い目{summary['count']}件 最大EV {summary['max_ev']}"
+
+
+if __name__ == "__main__":
+    import sys
+
+    target_date = None
+    bankroll = 10000
+    rate = 2.0
+    budget = None
+    horizon = 60
+    workers = 8
+    venues = None
+    for i, arg in enumerate(sys.argv):
+        if arg == "--date" and i + 1 < len(sys.argv):
+            target_date = sys.argv[i + 1]
+        elif arg == "--bankroll" and i + 1 < len(sys.argv):
+            bankroll = int(sys.argv[i + 1])
+        elif arg == "--rate" and i + 1 < len(sys.argv):
+            rate = float(sys.argv[i + 1])
+        elif arg == "--budget" and i + 1 < len(sys.argv):
+            budget = int(sys.argv[i + 1])
+        elif arg == "--horizon" and i + 1 < len(sys.argv):
+            horizon = float(sys.argv[i + 1])
+        elif arg == "--workers" and i + 1 < len(sys.argv):
+            workers = int(sys.argv[i + 1])
+        elif arg == "--venue" and i + 1 < len(sys.argv):
+            venues = sys.argv[i + 1].split(",")
+
+    poller = OddsPoller(target_date, bankroll=bankroll, rate=rate, budget=budget, workers=workers,
+                        horizon=horizon * 60, venues=venues,
+                        on_snapshot=lambda s: print(format_snapshot(s), flush=True))
+    stats = poller.run()
+    print(f"=== 終了: {stats['races']}R / スナップショット {stats['snapshots']}件 / "
+          f"リクエスト {stats['requests']}件"
+          + (f"（予算 {stats['budget']}件を使い切り）" if stats["budget_exhausted"] else "") + " ===")
@@ -0,0 +1,178 @@
+"""
+profiler.py — Stage-level Timing for the Analysis Pipeline
+===========================================================
+取得 → パース → 品質チェック → 潮汐 → analyze → 保存 → ログ の各段階と、
+analyze 内部（特徴量 → TMP → α → Henery → Harville → インデックス → EV → 買い目 → Kelly）の
+経過時間（wall）と CPU 時間をステージ別のリングバッファに記録し、パーセンタイルで出す。
+
+  - 既定は無効。無効時の stage() は共有の空コンテキストを返すだけ（時計も読まない）
+  - 有効化: 環境変数 BOATODDS_PROFILE=1 / PROFILER.enable() / app.py サイドバー / live_scanner.py --profile
+  - CPU 時間は time.thread_time()（通信待ちは wall にだけ出る）
+  - ステージ名は "app.fetch" / "engine.alpha" のように「層.段階」。レポートは初出順
+  - analyze_cached のヒット時は engine.* は記録されない（app.analyze だけが短く出る）
+
+使い方:
+  from profiler import stage
+  with stage("app.fetch"):
+      ...
+  print(format_report(PROFILER.report()))
+
+  # アーカイブのレースで analyze の段階別時間を計測
+  python profiler.py archive race_data_archive [--limit 500] [--repeat 3] [--json]
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+import numpy as np
+
+RING_CAPACITY = 1024
+PERCENTILES = (50, 90, 99)
+
+
+class _NullStage:
+    """無効時の stage()（何もしない）"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("profiler", "name", "wall", "cpu")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.wall, time.thread_time() - self.cpu)
+        return False
+
+
+class StageProfiler:
+    """ステージ名 → 直近 capacity 回の (wall秒, CPU秒) のリングバッファ"""
+
+    def __init__(self, capacity: int = RING_CAPACITY, enabled: bool = False):
+        self.capacity = capacity
+        self.enabled = enabled
+        self._rings: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def enable(self, on: bool = True):
+        self.enabled = on
+
+    def stage(self, name: str):
+        return _Stage(self, name) if self.enabled else _NULL
+
+    def record(self, name: str, wall: float, cpu: float):
+        with self._lock:
+            ring = self._rings.get(name)
+            if ring is None:
+                ring = self._rings[name] = deque(maxlen=self.capacity)
+            ring.append((wall, cpu))
+
+    def reset(self):
+        with self._lock:
+            self._rings.clear()
+
+    def report(self) -> Dict[str, Dict]:
+        """ステージごとの件数・wall/CPU のパーセンタイル（ms）・合計（ms）"""
+        with self._lock:
+            samples = {name: np.array(ring, dtype=float) * 1e3 for name, ring in self._rings.items() if ring}
+        out = {}
+        for name, a in samples.items():
+            wall, cpu = a[:, 0], a[:, 1]
+            row = {"n": len(a)}
+            for q, w, c in zip(PERCENTILES, np.percentile(wall, PERCENTILES), np.percentile(cpu, PERCENTILES)):
+                row[f"wall_p{q}"] = round(float(w), 3)
+                row[f"cpu_p{q}"] = round(float(c), 3)
+            row["wall_max"] = round(float(wall.max()), 3)
+            row["wall_total"] = round(float(wall.sum()), 1)
+            out[name] = row
+        return out
+
+
+PROFILER = StageProfiler(enabled=os.environ.get("BOATODDS_PROFILE", "") not in ("", "0"))
+stage = PROFILER.stage
+
+
+def report_rows(report: Dict[str, Dict]) -> List[Dict]:
+    """表示用の行（st.dataframe にそのまま渡せる）"""
+    return [{"stage": name, "n": r["n"], "p50 ms": r["wall_p50"], "p90 ms": r["wall_p90"],
+             "p99 ms": r["wall_p99"], "cpu p50 ms": r["cpu_p50"], "total ms": r["wall_total"]}
+            for name, r in report.items()]
+
+
+def format_report(report: Dict[str, Dict]) -> str:
+    if not report:
+        return "（記録なし — BOATODDS_PROFILE=1 または PROFILER.enable() で計測）"
+    width = max(len(name) for name in report)
+    lines = [f"  {'stage':<{width}} {'n':>6} {'p50':>9} {'p90':>9} {'p99':>9} {'cpu p50':>9} {'total':>10}  (ms)"]
+    for name, r in report.items():
+        lines.append(f"  {name:<{width}} {r['n']:>6} {r['wall_p50']:>9.3f} {r['wall_p90']:>9.3f} "
+                     f"{r['wall_p99']:>9.3f} {r['cpu_p50']:>9.3f} {r['wall_total']:>10.1f}")
+    return "\n".join(lines)
+
+
+def profile_archive(archive_dir: str, limit: int = 500, repeat: int = 1,
+                    profiler: Optional[StageProfiler] = None) -> Dict[str, Dict]:
+    """アーカイブの直近 limit レースを repeat 回 analyze して段階別の時間を返す（キャッシュは使わない）"""
+    from race_archive import get_index, load_race
+    from rtpt_engine import analyze
+
+    profiler = profiler or PROFILER
+    index = get_index(archive_dir)
+    paths = []
+    for d in sorted(index.dates, reverse=True):
+        paths.extend(index.files_for(d))
+        if len(paths) >= limit:
+            break
+    races = [load_race(p) for p in paths[:limit]]
+    was = profiler.enabled
+    profiler.reset()
+    profiler.enable()
+    try:
+        for _ in range(repeat):
+            for rd in races:
+                with profiler.stage("engine.total"):
+                    analyze(rd, bankroll=10000)
+    finally:
+        profiler.enable(was)
+    return profiler.report()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 3 or sys.argv[1] != "archive":
+        print("Usage:")
+        print("  python profiler.py archive <archive_dir> [--limit 500] [--repeat 3] [--json]")
+        sys.exit(1)
+
+    # rtpt_engine が import する profiler モジュールの PROFILER に記録させる（__main__ 側の複製ではなく）
+    from profiler import profile_archive, format_report
+
+    archive_dir = sys.argv[2]
+    limit = int(sys.argv[sys.argv.index("--limit") + 1]) if "--limit" in sys.argv else 500
+    repeat = int(sys.argv[sys.argv.index("--repeat") + 1]) if "--repeat" in sys.argv else 1
+    report = profile_archive(archive_dir, limit, repeat)
+    if "--json" in sys.argv:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(f"⏱ {archive_dir}: 直近 {limit} レース × {repeat} 回")
+        print(format_report(report))
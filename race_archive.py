@@ -0,0 +1,647 @@
+"""
+race_archive.py — Race Data Archive Index + Parsed Race Cache
+==============================================================
+機能:
+  1. race_data_archive のインデックス（日付 → 場 → レース → ファイル名）
+     - 初回のみディレクトリを1回走査して構築し、_index/index.json に保存
+     - RaceDataArchiver.save からインクリメンタルに追記（_index/index.journal に1行追記するだけ。
+       一定行数たまったら index.json へ畳み込む）
+     - 他ツールがファイルを直接追加した場合はディレクトリmtimeの変化で検知して再構築
+  2. パース済みレースのプロセス内LRUキャッシュ
+     - ローリングウィンドウで重複する日のJSONを再パースしない
+     - (mtime, size) が変わったファイル（attach_result 後など）は自動で読み直す
+  3. 日単位のカラムナ形式（_columnar/YYYYMMDD/ に .npy カラム + meta.json）
+     - 艇・環境の数値は (N,6)/(N,) 配列、オッズは組番序数で (N,120) 等の行列
+     - np.load(mmap_mode='r') で必要なカラムだけ読める
+     - オッズの元のキー順も序数ごとの位置カラムで保持（スクレイプ順のままで無損失）
+     - エンジンの特徴量（RaceBatch の配列）も保存し、バックテストは辞書を作らず mmap から直接パックする
+     - 既存JSONアーカイブからの変換コマンド付き（変換後に増えた/更新されたJSONはJSON側を優先）
+
+使い方:
+  index = get_index("race_data_archive")
+  for path in index.files_for("20260101"):
+      entry = load_race(path)   # 共有オブジェクト。呼び出し側で変更しないこと
+
+  races = load_day("race_data_archive", "20260101")   # カラムナ優先、なければJSON
+  n, batch, results = load_day_compiled("race_data_archive", "20260101")   # 結果付きレースの RaceBatch
+
+  # 既存JSONアーカイブをカラムナ形式へ変換（変換済みの日はスキップ）
+  python race_archive.py convert race_data_archive
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import rtpt_engine
+from rtpt_engine import PERMS, EXACTA_KEYS, PAIR_KEYS, TRIO_KEYS, RaceBatch, _race_features, pack_races
+
+INDEX_DIR = "_index"          # アーカイブ直下のサブディレクトリ（書き込みでアーカイブのmtimeを動かさない）
+INDEX_FILE = "index.json"
+INDEX_JOURNAL = "index.journal"   # add() の追記分（1行1ファイル。読み込み時に index.json へ重ねる）
+JOURNAL_COMPACT_LINES = 5000      # これを超えたら index.json を書き直してジャーナルを空にする
+CACHE_MAX_RACES = 50000       # LRUキャッシュに保持するパース済みレース数の上限
+
+
+def parse_archive_name(fname: str) -> Optional[tuple]:
+    """'{date}_{venue}_{race}.json' → (date, venue, race)。アーカイブ以外は None"""
+    if not fname.endswith('.json') or len(fname) < 14 or fname[8] != '_' or not fname[:8].isdigit():
+        return None
+    rest = fname[9:-5]
+    venue, _, race = rest.rpartition('_')
+    if not venue:
+        venue, race = rest, ""
+    return fname[:8], venue, race
+
+
+class ArchiveIndex:
+    """
+    アーカイブディレクトリのインデックス。
+
+    index.json 構造:
+    {
+      "dir_mtime_ns": int,   # 構築時点のアーカイブディレクトリmtime
+      "dates": {"20260101": {"住之江": {"3R": "20260101_住之江_3R.json", ...}, ...}, ...}
+    }
+    index.journal の各行: {"file": ファイル名, "dir_mtime_ns": 追記直後のアーカイブディレクトリmtime}
+    """
+
+    def __init__(self, archive_dir: str):
+        self.archive_dir = archive_dir
+        self.path = os.path.join(archive_dir, INDEX_DIR, INDEX_FILE)
+        self.journal_path = os.path.join(archive_dir, INDEX_DIR, INDEX_JOURNAL)
+        self._load()
+        self.refresh()
+
+    def _load(self):
+        self.dates: Dict[str, Dict[str, Dict[str, str]]] = {}
+        self.dir_mtime_ns = None
+        self._journal_offset = 0
+        self._journal_lines = 0
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                self.dates = state.get("dates", {})
+                self.dir_mtime_ns = state.get("dir_mtime_ns")
+            except (json.JSONDecodeError, IOError):
+                pass
+        self._fold_journal()
+
+    def _fold_journal(self):
+        """ジャーナルの未読分（他プロセスの追記を含む）を取り込む。書きかけの末尾行は次回に回す"""
+        try:
+            size = os.path.getsize(self.journal_path)
+        except OSError:
+            size = 0
+        if size < self._journal_offset:
+            # 他プロセスが index.json へ畳み込んでジャーナルを空にした → 読み直す
+            self._load()
+            return
+        if size == self._journal_offset:
+            return
+        with open(self.journal_path, 'rb') as f:
+            f.seek(self._journal_offset)
+            chunk = f.read(size - self._journal_offset)
+        chunk = chunk[:chunk.rfind(b"\n") + 1]
+        self._journal_offset += len(chunk)
+        for line in chunk.decode('utf-8').splitlines():
+            try:
+                entry = json.loads(line)
+                fname, mtime = entry["file"], entry["dir_mtime_ns"]
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+            self._insert(fname)
+            # 畳み込み済みの古い行で mtime を巻き戻さない（巻き戻すと不要な再走査になる）
+            self.dir_mtime_ns = max(self.dir_mtime_ns or 0, mtime or 0) or None
+            self._journal_lines += 1
+
+    def _dir_mtime_ns(self) -> Optional[int]:
+        try:
+            return os.stat(self.archive_dir).st_mtime_ns
+        except OSError:
+            return None
+
+    def refresh(self):
+        """ジャーナルの追記分を取り込み、それでもディレクトリが外部から変更されていれば再構築（通常は stat 2回のみ）"""
+        self._fold_journal()
+        if self._dir_mtime_ns() != self.dir_mtime_ns:
+            self.rebuild()
+
+    def rebuild(self):
+        self.dates = {}
+        if os.path.isdir(self.archive_dir):
+            os.makedirs(os.path.join(self.archive_dir, INDEX_DIR), exist_ok=True)
+            for fname in os.listdir(self.archive_dir):
+                self._insert(fname)
+        self.dir_mtime_ns = self._dir_mtime_ns()
+        self._save()
+
+    def _insert(self, fname: str) -> bool:
+        parsed = parse_archive_name(fname)
+        if not parsed:
+            return False
+        d, venue, race = parsed
+        self.dates.setdefault(d, {}).setdefault(venue, {})[race] = fname
+        return True
+
+    def add(self, fname: str):
+        """
+        ファイル書き込み直後に呼ぶ。書き込み前に get_index()/refresh() 済みである前提で、
+        その後のディレクトリmtime変化は自分の追加分とみなして取り込む（再走査しない）。
+        index.json は書き直さず、ジャーナルに1行追記するだけ
+        """
+        if not os.path.isdir(self.archive_dir):
+            return
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        line = json.dumps({"file": fname, "dir_mtime_ns": self._dir_mtime_ns()}, ensure_ascii=False) + "\n"
+        with open(self.journal_path, 'ab') as f:
+            f.write(line.encode('utf-8'))
+        self._fold_journal()
+        if self._journal_lines > JOURNAL_COMPACT_LINES:
+            self._save()
+
+    def _save(self):
+        if not os.path.isdir(self.archive_dir):
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"dir_mtime_ns": self.dir_mtime_ns, "dates": self.dates}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        # 畳み込んだのでジャーナルを空にする（途中で落ちても同じ行を重ねて取り込むだけ）
+        if os.path.exists(self.journal_path):
+            open(self.journal_path, 'wb').close()
+        self._journal_offset = 0
+        self._journal_lines = 0
+
+    def files_for(self, date_str: str) -> List[str]:
+        """指定日のアーカイブファイルのフルパス（ファイル名順）"""
+        venues = self.dates.get(date_str, {})
+        names = sorted(f for races in venues.values() for f in races.values())
+        return [os.path.join(self.archive_dir, f) for f in names]
+
+
+_indexes: Dict[str, ArchiveIndex] = {}
+
+
+def get_index(archive_dir: str) -> ArchiveIndex:
+    """プロセス内で共有するインデックス（呼ぶたびに外部変更をチェック）"""
+    key = os.path.abspath(archive_dir)
+    index = _indexes.get(key)
+    if index is None:
+        index = _indexes[key] = ArchiveIndex(archive_dir)
+    else:
+        index.refresh()
+    return index
+
+
+# ============================================================
+# パース済みレースのLRUキャッシュ
+# ============================================================
+_race_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def normalize_archive(archive: dict) -> dict:
+    """
+    [Bug#20修正] アーカイブ構造を正規化
+    historical_scraper形式: {"race_data": {...}, "actual_result": {...}}
+    旧形式: レースデータが直接トップレベル
+    """
+    if "race_data" in archive:
+        entry = archive["race_data"]
+        entry["actual_result"] = archive.get("actual_result")
+        return entry
+    return archive
+
+
+def load_race(path: str) -> dict:
+    """
+    アーカイブ1件をロード（正規化済み）。同一プロセス内では (mtime, size) が同じ限りキャッシュを返す。
+    戻り値は共有オブジェクトなので呼び出し側で変更しないこと。
+    Raises: json.JSONDecodeError, IOError
+    """
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    hit = _race_cache.get(path)
+    if hit is not None and hit[0] == stamp:
+        _race_cache.move_to_end(path)
+        return hit[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        entry = normalize_archive(json.load(f))
+    _race_cache[path] = (stamp, entry)
+    while len(_race_cache) > CACHE_MAX_RACES:
+        _race_cache.popitem(last=False)
+    return entry
+
+
+def clear_cache():
+    _race_cache.clear()
+
+
+# ============================================================
+# 日単位カラムナ形式（race_data_archive/_columnar/YYYYMMDD/*.npy）
+# ============================================================
+# 数値は固定幅の .npy カラム（np.load(mmap_mode='r') で必要な列だけ読める）、
+# 文字列と結果は meta.json に持つ。オッズは組番序数（rtpt_engine の PERMS 等と同じ並び）で行列化し、
+# 元の辞書でのキー位置を <カラム名>_pos（なければ -1）に持つ。
+# 特徴量は feat_<名前>.npy + meta.json の "features"。エンジンのソースが変わったら使わない（convert で作り直す）。
+COLUMNAR_DIR = "_columnar"
+COLUMNAR_VERSION = 2
+
+with open(rtpt_engine.__file__, 'rb') as _f:
+    ENGINE_DIGEST = hashlib.sha1(_f.read()).hexdigest()
+
+_ENV_NUM = ("wind_speed", "wind_direction_code", "wave_height")
+_BOAT_NUM = ("weight", "motor_2ren", "avg_st", "exhibition_time", "tilt", "start_course")
+_INT_LIKE = {"wind_speed", "wind_direction_code", "wave_height", "start_course"}  # 整数値は int で復元（wind_label の "3m" 表記を保つ）
+_UNPARSEABLE = -1.0   # オッズ欄はあるが数値でない（"欠場" 等）→ "-" で復元
+_BLANK = 0.0          # オッズ欄が空（"" / None）→ "" で復元
+
+
+def _keys(keys, sep):
+    return [sep.join(map(str, k)) for k in keys]
+
+
+# (券種, カラム名, 組番キー列, "lo-hi" の範囲表記か)
+_ODDS_LAYOUT = (("単勝", "odds_win", _keys([(i,) for i in range(1, 7)], ""), False),
+                ("複勝", "odds_place", _keys([(i,) for i in range(1, 7)], ""), True),
+                ("2連単", "odds_exacta", _keys(EXACTA_KEYS, "-"), False),
+                ("2連複", "odds_quinella", _keys(PAIR_KEYS, "="), False),
+                ("拡連複", "odds_wide", _keys(PAIR_KEYS, "="), True),
+                ("3連単", "odds_trifecta", _keys(PERMS, "-"), False),
+                ("3連複", "odds_trio", _keys(TRIO_KEYS, "="), False))
+_NUM_COLUMNS = ([f"env_{k}" for k in _ENV_NUM] + [f"boat_{k}" for k in _BOAT_NUM]
+                + [c for _, name, _, ranged in _ODDS_LAYOUT
+                   for c in ((name + "_lo", name + "_hi") if ranged else (name,))])
+_POS_COLUMNS = [name + "_pos" for _, name, _, _ in _ODDS_LAYOUT]
+
+
+def _encode_num(v) -> float:
+    if v is None or isinstance(v, bool):
+        return float('nan')
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def _decode_num(name: str, x: float):
+    if x != x:
+        return None
+    return int(x) if name in _INT_LIKE and x.is_integer() else x
+
+
+def _encode_odds(v, ranged: bool) -> tuple:
+    """オッズ値 → (lo, hi)。hi は範囲表記のときのみ"""
+    if not v:
+        return _BLANK, float('nan')
+    parts = str(v).split('-') if ranged else [v]
+    try:
+        lo = float(parts[0])
+    except (TypeError, ValueError):
+        return _UNPARSEABLE, float('nan')
+    hi = float('nan')
+    if len(parts) > 1:
+        try:
+            hi = float(parts[1])
+        except ValueError:
+            pass
+    return lo, hi
+
+
+def _decode_odds(lo: float, hi: float, ranged: bool):
+    if lo == _BLANK:
+        return ""
+    if lo == _UNPARSEABLE:
+        return "-"
+    if not ranged:
+        return lo
+    return f"{lo}-{hi}" if hi == hi else f"{lo}"
+
+
+def _encode_race(entry: dict) -> tuple:
+    """正規化済みレース → (数値カラム dict, meta レコード)"""
+    rl = entry.get("racelist", {})
+    env = entry.get("environment", {})
+    od = entry.get("odds", {})
+    bs = [rl.get(str(i), {}) for i in range(1, 7)]
+    cols = {f"env_{k}": _encode_num(env.get(k)) for k in _ENV_NUM}
+    for k in _BOAT_NUM:
+        cols[f"boat_{k}"] = [_encode_num(b.get(k)) for b in bs]
+    for bet_type, name, keys, ranged in _ODDS_LAYOUT:
+        book = od.get(bet_type, {})
+        enc = [_encode_odds(book[k], ranged) if k in book else (float('nan'), float('nan')) for k in keys]
+        order = {k: p for p, k in enumerate(book)}
+        cols[name + "_pos"] = [order.get(k, -1) for k in keys]
+        if ranged:
+            cols[name + "_lo"] = [e[0] for e in enc]
+            cols[name + "_hi"] = [e[1] for e in enc]
+        else:
+            cols[name] = [e[0] for e in enc]
+    ar = entry.get("actual_result") or {}
+    cols["finish"] = [int(x) if x == x else 0 for x in (_encode_num(ar.get(k)) for k in ("1st", "2nd", "3rd"))]
+    rec = {
+        "metadata": entry.get("metadata", {}),
+        "wind_direction": env.get("wind_direction"),
+        "tide": env.get("tide"),
+        "names": [b.get("name") for b in bs],
+        "class": [b.get("class") for b in bs],
+        "st": [b.get("start_exhibition_st") for b in bs],
+        "actual_result": entry.get("actual_result"),
+    }
+    return cols, rec
+
+
+def _decode_race(cols: dict, i: int, rec: dict) -> dict:
+    """カラム i 行目 + meta レコード → race_data（rtpt_engine が参照するフィールドのみ）"""
+    env = {}
+    for k in _ENV_NUM:
+        v = _decode_num(k, cols[f"env_{k}"][i])
+        if v is not None:
+            env[k] = v
+    if rec["wind_direction"] is not None:
+        env["wind_direction"] = rec["wind_direction"]
+    if rec["tide"] is not None:
+        env["tide"] = rec["tide"]
+    racelist = {}
+    for j in range(6):
+        b = {}
+        for k, s in (("name", "names"), ("class", "class"), ("start_exhibition_st", "st")):
+            if rec[s][j] is not None:
+                b[k] = rec[s][j]
+        for k in _BOAT_NUM:
+            v = _decode_num(k, cols[f"boat_{k}"][i][j])
+            if v is not None:
+                b[k] = v
+        racelist[str(j + 1)] = b
+    odds = {}
+    for bet_type, name, keys, ranged in _ODDS_LAYOUT:
+        if ranged:
+            los, his = cols[name + "_lo"][i], cols[name + "_hi"][i]
+        else:
+            los = cols[name][i]
+            his = los
+        book = [(k, _decode_odds(lo, hi, ranged)) for k, lo, hi in zip(keys, los, his) if lo == lo]
+        if name + "_pos" in cols:   # 元のキー順に並べ直す（version 1 の日は組番順のまま）
+            pos = cols[name + "_pos"][i]
+            book = [kv for _, kv in sorted(zip((p for p, lo in zip(pos, los) if lo == lo), book))]
+        odds[bet_type] = dict(book)
+    return {"metadata": rec["metadata"], "environment": env, "racelist": racelist, "odds": odds,
+            "actual_result": rec["actual_result"]}
+
+
+def _features_or_error(entry: dict):
+    try:
+        return _race_features(entry)
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return repr(e)
+
+
+def write_columnar_day(archive_dir: str, date_str: str, entries: List[tuple]) -> dict:
+    """
+    1日分を書き出す。entries: [(元JSONファイル名, (mtime_ns, size) or None, 正規化済みレース), ...]
+    エンジンから見た特徴量が元データと完全一致しないレース（組番の表記揺れ・重複キー・型が特殊等）は
+    meta.json に元の辞書をそのまま保存して読み戻し時に使う（形式としては無損失）。
+    特徴量は元データから pack_races() した RaceBatch をそのまま保存する。
+    """
+    import shutil
+
+    n = len(entries)
+    layout = {}
+    recs = []
+    n_raw = 0
+    for row, (fname, stamp, entry) in enumerate(entries):
+        cols, rec = _encode_race(entry)
+        rec["file"] = fname
+        for k, v in cols.items():
+            layout.setdefault(k, []).append(v)
+        lists = {k: [v] for k, v in cols.items()}
+        if _features_or_error(_decode_race(lists, 0, rec)) != _features_or_error(entry):
+            rec["raw"] = entry
+            n_raw += 1
+        recs.append(rec)
+
+    out = os.path.join(archive_dir, COLUMNAR_DIR, date_str)
+    tmp = out + ".tmp"
+    if os.path.isdir(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    for k, v in layout.items():
+        dtype = np.int8 if k == "finish" else np.int16 if k in _POS_COLUMNS else np.float64
+        np.save(os.path.join(tmp, k + ".npy"), np.asarray(v, dtype=dtype))
+    arrays, info = pack_races([entry for _, _, entry in entries]).columns()
+    for k, v in arrays.items():
+        np.save(os.path.join(tmp, "feat_" + k + ".npy"), v)
+    meta = {"version": COLUMNAR_VERSION, "n": n, "races": recs,
+            "sources": {fname: list(stamp) for fname, stamp, _ in entries if stamp},
+            "features": {"engine": ENGINE_DIGEST, "columns": sorted(arrays), "info": info}}
+    with open(os.path.join(tmp, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    if os.path.isdir(out):
+        old = out + ".old"
+        os.replace(out, old)
+        os.replace(tmp, out)
+        shutil.rmtree(old)
+    else:
+        os.replace(tmp, out)
+    _day_cache.pop(out, None)
+    return {"date": date_str, "races": n, "raw_fallback": n_raw}
+
+
+class ColumnarDay:
+    """
+    カラムナ形式の1日分。数値カラムは初回アクセス時に mmap で開く。
+      day.column("odds_trifecta")   # (N, 120) mmap 配列
+      day.races()                   # race_data のリスト（pack_races にそのまま渡せる）
+      day.batch(rows)               # 保存済み特徴量から組み立てた RaceBatch（エンジン更新後は None）
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self._cols: Dict[str, object] = {}
+        self._races: Optional[List[dict]] = None
+        self._compiled: Optional[tuple] = None
+
+    def __len__(self):
+        return self.meta["n"]
+
+    @property
+    def files(self) -> List[str]:
+        return [r["file"] for r in self.meta["races"]]
+
+    def column(self, name: str):
+        if name not in self._cols:
+            self._cols[name] = np.load(os.path.join(self.path, name + ".npy"), mmap_mode='r')
+        return self._cols[name]
+
+    def covers(self, paths: List[str]) -> bool:
+        """現存する JSON がすべて変換時と同じ (mtime, size) で取り込み済みか（削除済みの JSON は問わない）"""
+        if self.meta.get("version") != COLUMNAR_VERSION:
+            return False
+        sources = self.meta.get("sources", {})
+        for p in paths:
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            if sources.get(os.path.basename(p)) != [st.st_mtime_ns, st.st_size]:
+                return False
+        return True
+
+    def features_current(self) -> bool:
+        """保存済み特徴量が現在のエンジンで作られたものか"""
+        return self.meta.get("features", {}).get("engine") == ENGINE_DIGEST
+
+    def races(self) -> List[dict]:
+        """race_data のリスト（初回だけ組み立てて保持。共有オブジェクトなので変更しないこと）"""
+        if self._races is None:
+            recs = self.meta["races"]
+            if all("raw" in r for r in recs):
+                self._races = [r["raw"] for r in recs]
+            else:
+                names = _NUM_COLUMNS + (_POS_COLUMNS if self.meta.get("version", 1) >= 2 else [])
+                cols = {k: self.column(k).tolist() for k in names}
+                self._races = [r["raw"] if "raw" in r else _decode_race(cols, i, r) for i, r in enumerate(recs)]
+        return self._races
+
+    def batch(self, rows: Optional[List[int]] = None) -> Optional[RaceBatch]:
+        """保存済み特徴量の mmap から RaceBatch を組み立てる（辞書は作らない）。特徴量が古ければ None"""
+        if not self.features_current():
+            return None
+        feats = self.meta["features"]
+        arrays = {k: self.column("feat_" + k) for k in feats["columns"]}
+        return RaceBatch.from_columns(arrays, feats["info"], rows)
+
+    def compiled(self) -> tuple:
+        """結果付きレースだけの (ロード件数, RaceBatch, 結果リスト)（初回だけ組み立てて保持）"""
+        if self._compiled is None:
+            recs = self.meta["races"]
+            rows = [i for i, r in enumerate(recs) if r.get("actual_result")]
+            batch = self.batch(rows)
+            if batch is None:
+                races = [rd for rd in self.races() if rd.get("actual_result")]
+                batch = pack_races(races)
+            self._compiled = (len(recs), batch, [recs[i]["actual_result"] for i in rows])
+        return self._compiled
+
+
+_day_cache: "OrderedDict[str, tuple]" = OrderedDict()
+CACHE_MAX_DAYS = 400
+
+
+def open_columnar_day(archive_dir: str, date_str: str) -> Optional[ColumnarDay]:
+    path = os.path.join(archive_dir, COLUMNAR_DIR, date_str)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    return ColumnarDay(path)
+
+
+def _covered_day(archive_dir: str, paths: List[str], date_str: str) -> Optional[ColumnarDay]:
+    """既存 JSON をすべて取り込み済みのカラムナ日（プロセス内で meta.json の mtime ごとに共有）"""
+    day_path = os.path.join(archive_dir, COLUMNAR_DIR, date_str)
+    try:
+        stamp = os.stat(os.path.join(day_path, "meta.json")).st_mtime_ns
+    except OSError:
+        return None
+    hit = _day_cache.get(day_path)
+    day = hit[1] if hit is not None and hit[0] == stamp else ColumnarDay(day_path)
+    if not day.covers(paths):
+        return None
+    _day_cache[day_path] = (stamp, day)
+    _day_cache.move_to_end(day_path)
+    while len(_day_cache) > CACHE_MAX_DAYS:
+        _day_cache.popitem(last=False)
+    return day
+
+
+def _load_json_day(paths: List[str]) -> List[dict]:
+    data = []
+    for fpath in paths:
+        try:
+            data.append(load_race(fpath))
+        except (json.JSONDecodeError, IOError):
+            pass
+    return data
+
+
+def load_day(archive_dir: str, date_str: str, index: Optional[ArchiveIndex] = None) -> List[dict]:
+    """
+    1日分のレースをロード。カラムナ形式があり既存 JSON をすべて取り込み済みならそちらを、
+    なければ（未変換・変換後に JSON が追加/更新された日）JSON から読む。戻り値のレースは共有オブジェクト。
+    """
+    paths = (index or get_index(archive_dir)).files_for(date_str)
+    day = _covered_day(archive_dir, paths, date_str)
+    if day is not None:
+        return list(day.races())
+    return _load_json_day(paths)
+
+
+def load_day_compiled(archive_dir: str, date_str: str, index: Optional[ArchiveIndex] = None) -> tuple:
+    """
+    1日分の結果付きレース → (ロード件数, RaceBatch, 結果リスト)。
+    カラムナ形式の日は保存済み特徴量の mmap から直接パックする（race_data の辞書を組み立てない）。
+    """
+    paths = (index or get_index(archive_dir)).files_for(date_str)
+    day = _covered_day(archive_dir, paths, date_str)
+    if day is not None:
+        return day.compiled()
+    data = _load_json_day(paths)
+    races = [rd for rd in data if rd.get("actual_result")]
+    return len(data), pack_races(races), [rd["actual_result"] for rd in races]
+
+
+def convert_archive(archive_dir: str, dates: Optional[List[str]] = None, force: bool = False) -> List[dict]:
+    """
+    JSON アーカイブを日単位のカラムナ形式へ変換（変換済みで JSON に変化がなく特徴量も最新の日はスキップ）。
+    既にカラムナ側にあって JSON が削除されたレースは保持したまま、追加/更新分だけ差し替える。
+    """
+    index = get_index(archive_dir)
+    stats = []
+    for date_str in sorted(dates or index.dates):
+        paths = index.files_for(date_str)
+        day = open_columnar_day(archive_dir, date_str)
+        if day is not None and not force and day.covers(paths) and day.features_current():
+            continue
+        merged = OrderedDict()
+        if day is not None:
+            sources = day.meta.get("sources", {})
+            for fname, entry in zip(day.files, day.races()):
+                merged[fname] = (fname, tuple(sources[fname]) if fname in sources else None, entry)
+        for fpath in paths:
+            try:
+                entry = load_race(fpath)
+                st = os.stat(fpath)
+            except (json.JSONDecodeError, IOError):
+                continue
+            fname = os.path.basename(fpath)
+            merged[fname] = (fname, (st.st_mtime_ns, st.st_size), entry)
+        if merged:
+            stats.append(write_columnar_day(archive_dir, date_str, sorted(merged.values(), key=lambda e: e[0])))
+    return stats
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] != "convert":
+        print("Usage: python race_archive.py convert [archive_dir] [--force]")
+        sys.exit(1)
+
+    archive_dir = "race_data_archive"
+    force = False
+    for arg in sys.argv[2:]:
+        if arg == "--force":
+            force = True
+        else:
+            archive_dir = arg
+
+    stats = convert_archive(archive_dir, force=force)
+    total = sum(s["races"] for s in stats)
+    raw = sum(s["raw_fallback"] for s in stats)
+    print(f"変換: {len(stats)}日 / {total}レース（カラム化不可で元データ保持: {raw}レース）")
@@ -0,0 +1,826 @@
+"""
+race_scraper.py — boatrace.jp 出走表・直前情報・オッズのスクレイピング
+=====================================================================
+app.py（Streamlit）と live_scanner.py（ヘッドレス全場スキャナ）で共有する取得・パース処理。
+Streamlit に依存しないので単体で import できる。
+
+使い方:
+  race_data = new_race_data("20260101", "住之江", 5)
+  html_data = fetch_race_pages(race_urls("20260101", "12", 5), session, executor)
+  parse_race_pages(html_data, race_data)
+"""
+import html as html_lib
+import re
+from bs4 import BeautifulSoup
+from http_client import http_get
+JCD_MAP = {
+    "桐生": "01", "戸田": "02", "江戸川": "03", "平和島": "04", "多摩川": "05",
+    "浜名湖": "06", "蒲郡": "07", "常滑": "08", "津": "09", "三国": "10",
+    "びわこ": "11", "住之江": "12", "尼崎": "13", "鳴門": "14", "丸亀": "15",
+    "児島": "16", "宮島": "17", "徳山": "18", "下関": "19", "若松": "20",
+    "芦屋": "21", "福岡": "22", "唐津": "23", "大村": "24"
+}
+BASE_URL = "https://www.boatrace.jp/owpc/pc/race"
+# 1レース分の取得ページ（キー → boatrace.jp のページ名）
+RACE_PAGES = ("racelist", "beforeinfo", "odds3t", "odds3f", "odds2tf", "oddsk", "oddstf")
+
+
+def new_race_data(target_date, venue, rno):
+    """パース結果を書き込む空の race_data"""
+    return {
+        "metadata": {"date": target_date, "stadium": venue, "race_number": f"{rno}R"},
+        "environment": {},
+        "racelist": {str(i): {} for i in range(1, 7)},
+        "odds": {"3連単": {}, "3連複": {}, "2連単": {}, "2連複": {}, "拡連複": {}, "単勝": {}, "複勝": {}}
+    }
+
+
+def race_urls(target_date, jcd, rno):
+    return {page: f"{BASE_URL}/{page}?rno={rno}&jcd={jcd}&hd={target_date}" for page in RACE_PAGES}
+
+
+def submit_race_pages(urls, session, executor):
+    """urls の全ページ取得を executor に投入 → {キー: Future}（複数レースをまとめて投入する用）"""
+    return {k: executor.submit(fetch_html, u, session) for k, u in urls.items()}
+
+
+def fetch_race_pages(urls, session, executor):
+    """urls の全ページを executor で並列取得 → {キー: HTML}（失敗は空文字）"""
+    return {k: f.result() for k, f in submit_race_pages(urls, session, executor).items()}
+
+
+def parse_race_pages(html_data, race_data):
+    parse_racelist(html_data.get("racelist"), race_data)
+    parse_beforeinfo(html_data.get("beforeinfo"), race_data)
+    parse_all_odds(html_data, race_data)
+
+
+def extract_float(text):
+    if not text: return 0.0
+    m = re.search(r'-?[\d\.]+', str(text))
+    return float(m.group()) if m else 0.0
+
+
+def fetch_available_races(target_date):
+    url = f"https://www.boatrace.jp/owpc/pc/race/index?hd={target_date}"
+    try:
+        html = http_get(url)
+        if html is None: return {}
+        available_dict = {}
+        tbodies = re.finditer(r'<tbody.*?>.*?</tbody>', html, re.DOTALL)
+        for match in tbodies:
+            tbody_html = match.group(0)
+            stadium_match = re.search(r'alt="([^"]+)"', tbody_html)
+            if not stadium_match: continue
+            name = stadium_match.group(1).strip()
+            if name not in JCD_MAP: continue
+            if "最終Ｒ発売終了" in tbody_html or "中止" in tbody_html: continue
+            current_r = 1
+            r_match = re.search(r'>(\d{1,2})R<', tbody_html)
+            if r_match: current_r = int(r_match.group(1))
+            available_dict[name] = list(range(current_r, 13))
+        return available_dict
+    except Exception:
+        return {}
+
+
+def parse_deadlines(html_text):
+    """出走表ページ上部の「締切予定時刻」行 → {R: "HH:MM"}（その場の全レース分）"""
+    if not html_text: return {}
+    m = re.search(r'締切予定時刻(.*?)</tr>', html_text, re.DOTALL)
+    if not m: return {}
+    times = re.findall(r'>\s*(\d{1,2}:\d{2})\s*<', m.group(1))
+    return {rno: t for rno, t in enumerate(times, 1)}
+
+
+def fetch_html(url, session=None, retries=3):
+    """共有 HTTP 層（http_client）経由で取得。失敗は空文字"""
+    return http_get(url, session, retries=retries) or ""
+
+
+def _parse_racelist_bs4(html_text, race_data):
+    soup = BeautifulSoup(html_text, 'html.parser')
+    tbodies = soup.select('.table1.is-tableFixed__3rdadd tbody.is-fs12')
+    for tbody in tbodies:
+        trs = tbody.find_all('tr')
+        if not trs: continue
+        tds = trs[0].find_all('td')
+        if len(tds) < 8: continue
+        b_no_raw = tds[0].text.strip()
+        b_no_match = re.search(r'[1-6１-６]', b_no_raw)
+        if not b_no_match: continue
+        b_no = str(int(b_no_match.group().translate(str.maketrans('１２３４５６', '123456'))))
+        class_info_div = tbody.select_one('div.is-fs11')
+        rank = ""
+        if class_info_div:
+            rank_span = class_info_div.select_one('span')
+            if rank_span: rank = rank_span.text.strip()
+        name_el = tbody.select_one('.is-fs18.is-fBold')
+        name = name_el.text.strip().replace('\u3000', ' ') if name_el else ""
+
+        # [Bug#29修正] 登録番号を抽出（recent_form.pyのinjectに必要）
+        toban = ""
+        toban_link = tbody.select_one('a[href*="toban"]')
+        if toban_link:
+            tm = re.search(r'toban=(\d+)', toban_link.get('href', ''))
+            if tm: toban = tm.group(1)
+
+        weight_match = re.search(r'([\d\.]+)kg', tds[2].text)
+        weight = float(weight_match.group(1)) if weight_match else 0.0
+        st_txt = [x.strip() for x in tds[3].get_text(separator='\n').split('\n') if x.strip()]
+        nat_win = [x.strip() for x in tds[4].get_text(separator='\n').split('\n') if x.strip()]
+        loc_win = [x.strip() for x in tds[5].get_text(separator='\n').split('\n') if x.strip()]
+        mot = [x.strip() for x in tds[6].get_text(separator='\n').split('\n') if x.strip()]
+        race_data["racelist"][b_no].update({
+            "name": name, "class": rank, "weight": weight,
+            "racer_no": toban,
+            "win_rate_national": extract_float(nat_win[0]) if nat_win else 0.0,
+            "win_rate_local": extract_float(loc_win[0]) if loc_win else 0.0,
+            "motor_no": mot[0] if mot else '-',
+            "motor_2ren": extract_float(mot[1]) if len(mot) > 1 else 30.0,
+            "avg_st": extract_float(st_txt[-1]) if st_txt else 0.15
+        })
+
+
+def _parse_beforeinfo_bs4(html_text, race_data):
+    soup = BeautifulSoup(html_text, 'html.parser')
+    env = race_data["environment"]
+    t_el = soup.select_one('.is-temperature .weather1_bodyUnitLabelData')
+    if t_el: env['temperature'] = extract_float(t_el.text)
+    w_el = soup.select_one('.is-weather .weather1_bodyUnitLabelTitle')
+    if w_el: env['weather'] = w_el.text.strip()
+    ws_el = soup.select_one('.is-wind .weather1_bodyUnitLabelData')
+    if ws_el: env['wind_speed'] = extract_float(ws_el.text)
+    wt_el = soup.select_one('.is-waterTemperature .weather1_bodyUnitLabelData')
+    if wt_el: env['water_temp'] = extract_float(wt_el.text)
+    wh_el = soup.select_one('.is-wave .weather1_bodyUnitLabelData')
+    if wh_el: env['wave_height'] = extract_float(wh_el.text)
+    wd_img = soup.select_one('.is-windDirection .weather1_bodyUnitImage')
+    if wd_img and wd_img.has_attr('class'):
+        for cls in wd_img['class']:
+            if cls.startswith('is-wind') and cls not in ['is-windDirection', 'is-wind']:
+                try:
+                    num = int(cls.replace('is-wind', ''))
+                    env['wind_direction_code'] = num  # [Bug#24] 生コード保存
+                    dm = {i: "追い風" if i in [1,2,3,4,14,15,16] else "横風" if i in [5,13] else "向かい風" for i in range(1,17)}
+                    env['wind_direction'] = dm.get(num, "無風")
+                except ValueError: pass
+    if env.get('wind_speed') == 0.0: env['wind_direction'] = "無風"
+    for tbody in soup.select('.table1 tbody'):
+        trs = tbody.find_all('tr')
+        if not trs: continue
+        tds = trs[0].find_all('td')
+        b_no = None; bi = -1
+        for i, td in enumerate(tds):
+            if td.get('class') and any(c.startswith('is-boatColor') for c in td.get('class')):
+                match = re.search(r'\d+', td.text)
+                if match: b_no = match.group(); bi = i
+                break
+        if b_no and bi != -1 and b_no in race_data["racelist"]:
+            if len(tds) > bi + 4:
+                race_data["racelist"][b_no].update({
+                    "tilt": extract_float(tds[bi + 3].text),
+                    "exhibition_time": extract_float(tds[bi + 4].text)
+                })
+    for ci, div in enumerate(soup.select('.table1_boatImage1'), 1):
+        bn_el = div.select_one('.table1_boatImage1Number')
+        st_el = div.select_one('.table1_boatImage1Time')
+        if bn_el and st_el:
+            m = re.search(r'\d+', bn_el.text)
+            if m:
+                b = m.group()
+                if b in race_data["racelist"]:
+                    race_data["racelist"][b].update({"start_course": ci, "start_exhibition_st": st_el.text.strip()})
+
+
+def _parse_all_odds_bs4(html_dict, race_data):
+    """オッズパーサー（v1から継承。lxml 版の基準実装）"""
+    for otype in ['odds3t', 'odds3f', 'odds2tf']:
+        html = html_dict.get(otype)
+        if not html: continue
+        soup = BeautifulSoup(html, 'html.parser')
+        tbs = soup.select('tbody.is-p3-0')
+        if otype == 'odds3t': key, sep = '3連単', '-'
+        elif otype == 'odds3f': key, sep = '3連複', '='
+        if 'odds3' in otype:
+            tb = tbs[0] if tbs else None
+            if not tb: continue
+            cur_snd, rem_row = [None]*6, [0]*6
+            for row in tb.select('tr'):
+                tds = row.find_all('td'); idx = 0
+                for c in range(6):
+                    if rem_row[c] == 0:
+                        if idx + 2 >= len(tds): break
+                        snd_td, trd_td, o_td = tds[idx], tds[idx+1], tds[idx+2]; idx += 3
+                        cur_snd[c], rem_row[c] = snd_td, int(snd_td.get('rowspan', 1))
+                    else:
+                        if idx + 1 >= len(tds): break
+                        trd_td, o_td = tds[idx], tds[idx+1]; idx += 2; snd_td = cur_snd[c]
+                    rem_row[c] -= 1
+                    if "is-disabled" not in o_td.get('class', []):
+                        race_data["odds"][key][f"{c+1}{sep}{snd_td.text.strip()}{sep}{trd_td.text.strip()}"] = extract_float(o_td.text)
+        else:
+            for i, k in enumerate(["2連単", "2連複"]):
+                if len(tbs) > i:
+                    s = '-' if i == 0 else '='
+                    for row in tbs[i].select('tr'):
+                        tds = row.find_all('td')
+                        for c in range(6):
+                            if c*2+1 < len(tds) and "is-disabled" not in tds[c*2].get('class', []):
+                                race_data["odds"][k][f"{c+1}{s}{tds[c*2].text.strip()}"] = extract_float(tds[c*2+1].text)
+    html_k = html_dict.get('oddsk')
+    if html_k:
+        tbk = BeautifulSoup(html_k, 'html.parser').select_one('tbody.is-p3-0')
+        if tbk:
+            for row in tbk.select('tr'):
+                tds = row.find_all('td')
+                for c in range(6):
+                    if c*2+1 < len(tds) and "is-disabled" not in tds[c*2].get('class', []):
+                        race_data["odds"]["拡連複"][f"{c+1}={tds[c*2].text.strip()}"] = tds[c*2+1].text.strip()
+    html_tf = html_dict.get('oddstf')
+    if html_tf:
+        soup_tf = BeautifulSoup(html_tf, 'html.parser')
+        for unit in soup_tf.select('.grid_unit'):
+            label_el = unit.select_one('.title7_mainLabel')
+            if not label_el: continue
+            lt = label_el.text
+            mode = "単勝" if "単勝" in lt else "複勝" if "複勝" in lt else None
+            if not mode: continue
+            for tr in unit.select('table tbody tr'):
+                tds = tr.select('td')
+                if len(tds) < 3: continue
+                bn = tds[0].text.strip(); val = tds[2].text.strip()
+                if "is-disabled" not in tds[2].get('class', []):
+                    if mode == "単勝": race_data["odds"]["単勝"][bn] = extract_float(val)
+                    else: race_data["odds"]["複勝"][bn] = val
+
+
+def _parse_raceresult_bs4(html_text):
+    """ResultScraper.fetch_result から移動（lxml 版の基準実装）"""
+    soup = BeautifulSoup(html_text, 'html.parser')
+    result = {"1st": 0, "2nd": 0, "3rd": 0, "payouts": {}}
+
+    # 着順取得
+    result_table = soup.select_one('.is-w495')
+    if not result_table:
+        return None
+
+    rows = result_table.select('tbody tr')
+    for row in rows:
+        tds = row.find_all('td')
+        if len(tds) < 2:
+            continue
+        rank_text = tds[0].text.strip()
+        boat_match = re.search(r'[1-6]', tds[1].text)
+        if not boat_match:
+            continue
+        boat_no = int(boat_match.group())
+        if rank_text == '1':
+            result["1st"] = boat_no
+        elif rank_text == '2':
+            result["2nd"] = boat_no
+        elif rank_text == '3':
+            result["3rd"] = boat_no
+
+    # 払戻金取得
+    for table in soup.select('.table1'):
+        _collect_payouts(table.get_text(), [[td.text for td in row.find_all('td')] for row in table.select('tr')], result)
+
+    if result["1st"] == 0:
+        return None
+    return result
+
+
+# [Bug#31修正] 拡連複/複勝は複数行をリストで保存
+# 払戻金テーブルの行は "組番 + 金額" の2セル以上で、
+# 組番は 数字[-=]数字 のパターン（単勝/複勝は1桁数字）
+_COMBO_PATTERN = re.compile(r'^[1-6](?:[-=][1-6]){0,2}$')
+
+
+def _collect_payouts(text, rows, result):
+    """払戻金テーブル1つ分（text: テーブル全体のテキスト、rows: 各行の td テキスト）"""
+    for bet_type in ["3連単", "3連複", "2連単", "2連複", "拡連複", "単勝", "複勝"]:
+        if bet_type in text:
+            for tds in rows:
+                if len(tds) < 2: continue
+                combo_text = tds[0].strip()
+                # 組番が有効なパターンか検証（非払戻テーブルの誤取得を防止）
+                if not _COMBO_PATTERN.match(combo_text):
+                    continue
+                payout_text = tds[-1].strip()
+                payout_match = re.search(r'[\d]+', payout_text.replace(',', '').replace('¥', ''))
+                if payout_match:
+                    try:
+                        payout_val = int(payout_match.group())
+                        entry = {"combo": combo_text, "payout": payout_val}
+                        if bet_type in ("拡連複", "複勝"):
+                            if bet_type not in result["payouts"]:
+                                result["payouts"][bet_type] = []
+                            if isinstance(result["payouts"][bet_type], list):
+                                result["payouts"][bet_type].append(entry)
+                            else:
+                                result["payouts"][bet_type] = [result["payouts"][bet_type], entry]
+                        else:
+                            result["payouts"][bet_type] = entry
+                    except ValueError:
+                        pass
+
+
+# ============================================================
+# lxml パーサー（既定）
+# ============================================================
+# BeautifulSoup（html.parser）は木の構築が遅く、1ページ数十msかかる。
+# lxml.html + XPath で同じ要素を同じ順に辿り、BeautifulSoup 版と同一の race_data を作る。
+# lxml がない環境では BeautifulSoup 版を使う。
+try:
+    import lxml.html
+    import lxml.etree
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+PARSER = "lxml" if HAS_LXML else "html.parser"
+PARSERS = ("lxml", "html.parser") if HAS_LXML else ("html.parser",)
+ODDS_PARSER = "regex"
+ODDS_PARSERS = ("regex",) + PARSERS
+
+
+def _cls(*names):
+    """CSS の .a.b と同じ XPath 条件（class 属性の空白区切りトークン一致）"""
+    return " and ".join(f'contains(concat(" ", normalize-space(@class), " "), " {n} ")' for n in names)
+
+
+def _doc(html_text):
+    try:
+        return lxml.html.document_fromstring(html_text)
+    except lxml.etree.ParserError:  # 空白・コメントだけの文書
+        return None
+    except ValueError:  # エンコーディング宣言付きの str
+        return lxml.html.document_fromstring(html_text.encode('utf-8'), parser=lxml.html.HTMLParser(encoding='utf-8'))
+
+
+def _first(el, xpath):
+    found = el.xpath(xpath)
+    return found[0] if found else None
+
+
+def _strings(el):
+    """BeautifulSoup の get_text() と同じ文字列列（script/style の中身は含めない）"""
+    if el.find('.//script') is None and el.find('.//style') is None:
+        return list(el.itertext())
+    return el.xpath('.//text()[not(ancestor::script or ancestor::style)]')
+
+
+def _text(el):
+    """BeautifulSoup の .text 相当"""
+    if el.find('.//script') is None and el.find('.//style') is None:
+        return el.text_content()
+    return "".join(_strings(el))
+
+
+def _lines(el):
+    """[x.strip() for x in el.get_text(separator='\\n').split('\\n') if x.strip()] 相当"""
+    return [x.strip() for s in _strings(el) for x in s.split('\n') if x.strip()]
+
+
+def _classes(el):
+    return el.get('class', '').split()
+
+
+_RACELIST_XPATH = f'//*[{_cls("table1", "is-tableFixed__3rdadd")}]//tbody[{_cls("is-fs12")}]'
+
+
+def _parse_racelist_lxml(html_text, race_data):
+    doc = _doc(html_text)
+    if doc is None: return
+    for tbody in doc.xpath(_RACELIST_XPATH):
+        trs = tbody.findall('.//tr')
+        if not trs: continue
+        tds = trs[0].findall('.//td')
+        if len(tds) < 8: continue
+        b_no_match = re.search(r'[1-6１-６]', _text(tds[0]).strip())
+        if not b_no_match: continue
+        b_no = str(int(b_no_match.group().translate(str.maketrans('１２３４５６', '123456'))))
+        class_info_div = _first(tbody, f'.//div[{_cls("is-fs11")}]')
+        rank = ""
+        if class_info_div is not None:
+            rank_span = class_info_div.find('.//span')
+            if rank_span is not None: rank = _text(rank_span).strip()
+        name_el = _first(tbody, f'.//*[{_cls("is-fs18", "is-fBold")}]')
+        name = _text(name_el).strip().replace('\u3000', ' ') if name_el is not None else ""
+
+        # [Bug#29修正] 登録番号を抽出（recent_form.pyのinjectに必要）
+        toban = ""
+        toban_link = _first(tbody, './/a[contains(@href, "toban")]')
+        if toban_link is not None:
+            tm = re.search(r'toban=(\d+)', toban_link.get('href', ''))
+            if tm: toban = tm.group(1)
+
+        weight_match = re.search(r'([\d\.]+)kg', _text(tds[2]))
+        weight = float(weight_match.group(1)) if weight_match else 0.0
+        st_txt, nat_win, loc_win, mot = (_lines(td) for td in tds[3:7])
+        race_data["racelist"][b_no].update({
+            "name": name, "class": rank, "weight": weight,
+            "racer_no": toban,
+            "win_rate_national": extract_float(nat_win[0]) if nat_win else 0.0,
+            "win_rate_local": extract_float(loc_win[0]) if loc_win else 0.0,
+            "motor_no": mot[0] if mot else '-',
+            "motor_2ren": extract_float(mot[1]) if len(mot) > 1 else 30.0,
+            "avg_st": extract_float(st_txt[-1]) if st_txt else 0.15
+        })
+
+
+def _weather(doc, unit, label):
+    return _first(doc, f'//*[{_cls(unit)}]//*[{_cls(label)}]')
+
+
+def _parse_beforeinfo_lxml(html_text, race_data):
+    doc = _doc(html_text)
+    if doc is None: return
+    env = race_data["environment"]
+    t_el = _weather(doc, 'is-temperature', 'weather1_bodyUnitLabelData')
+    if t_el is not None: env['temperature'] = extract_float(_text(t_el))
+    w_el = _weather(doc, 'is-weather', 'weather1_bodyUnitLabelTitle')
+    if w_el is not None: env['weather'] = _text(w_el).strip()
+    ws_el = _weather(doc, 'is-wind', 'weather1_bodyUnitLabelData')
+    if ws_el is not None: env['wind_speed'] = extract_float(_text(ws_el))
+    wt_el = _weather(doc, 'is-waterTemperature', 'weather1_bodyUnitLabelData')
+    if wt_el is not None: env['water_temp'] = extract_float(_text(wt_el))
+    wh_el = _weather(doc, 'is-wave', 'weather1_bodyUnitLabelData')
+    if wh_el is not None: env['wave_height'] = extract_float(_text(wh_el))
+    wd_img = _weather(doc, 'is-windDirection', 'weather1_bodyUnitImage')
+    if wd_img is not None:
+        for cls in _classes(wd_img):
+            if cls.startswith('is-wind') and cls not in ['is-windDirection', 'is-wind']:
+                try:
+                    num = int(cls.replace('is-wind', ''))
+                    env['wind_direction_code'] = num  # [Bug#24] 生コード保存
+                    dm = {i: "追い風" if i in [1,2,3,4,14,15,16] else "横風" if i in [5,13] else "向かい風" for i in range(1,17)}
+                    env['wind_direction'] = dm.get(num, "無風")
+                except ValueError: pass
+    if env.get('wind_speed') == 0.0: env['wind_direction'] = "無風"
+    for tbody in doc.xpath(f'//*[{_cls("table1")}]//tbody'):
+        trs = tbody.findall('.//tr')
+        if not trs: continue
+        tds = trs[0].findall('.//td')
+        b_no = None; bi = -1
+        for i, td in enumerate(tds):
+            classes = _classes(td)
+            if classes and any(c.startswith('is-boatColor') for c in classes):
+                match = re.search(r'\d+', _text(td))
+                if match: b_no = match.group(); bi = i
+                break
+        if b_no and bi != -1 and b_no in race_data["racelist"]:
+            if len(tds) > bi + 4:
+                race_data["racelist"][b_no].update({
+                    "tilt": extract_float(_text(tds[bi + 3])),
+                    "exhibition_time": extract_float(_text(tds[bi + 4]))
+                })
+    for ci, div in enumerate(doc.xpath(f'//*[{_cls("table1_boatImage1")}]'), 1):
+        bn_el = _first(div, f'.//*[{_cls("table1_boatImage1Number")}]')
+        st_el = _first(div, f'.//*[{_cls("table1_boatImage1Time")}]')
+        if bn_el is not None and st_el is not None:
+            m = re.search(r'\d+', _text(bn_el))
+            if m:
+                b = m.group()
+                if b in race_data["racelist"]:
+                    race_data["racelist"][b].update({"start_course": ci, "start_exhibition_st": _text(st_el).strip()})
+
+
+_ODDS_TBODY_XPATH = f'//tbody[{_cls("is-p3-0")}]'
+
+
+def _parse_pair_rows(tbody, odds, sep, raw):
+    """2連単/2連複/拡連複の表（1行に [相手, オッズ] × 6列）"""
+    for row in tbody.findall('.//tr'):
+        tds = row.findall('.//td')
+        for c in range(6):
+            if c*2+1 < len(tds) and "is-disabled" not in _classes(tds[c*2]):
+                val = _text(tds[c*2+1])
+                odds[f"{c+1}{sep}{_text(tds[c*2]).strip()}"] = val.strip() if raw else extract_float(val)
+
+
+def _parse_all_odds_lxml(html_dict, race_data):
+    for otype, key, sep in (('odds3t', '3連単', '-'), ('odds3f', '3連複', '=')):
+        html = html_dict.get(otype)
+        if not html: continue
+        doc = _doc(html)
+        tb = _first(doc, _ODDS_TBODY_XPATH) if doc is not None else None
+        if tb is None: continue
+        odds = race_data["odds"][key]
+        cur_snd, rem_row = [None]*6, [0]*6
+        for row in tb.findall('.//tr'):
+            tds = row.findall('.//td'); idx = 0
+            for c in range(6):
+                if rem_row[c] == 0:
+                    if idx + 2 >= len(tds): break
+                    snd_td, trd_td, o_td = tds[idx], tds[idx+1], tds[idx+2]; idx += 3
+                    cur_snd[c], rem_row[c] = snd_td, int(snd_td.get('rowspan', 1))
+                else:
+                    if idx + 1 >= len(tds): break
+                    trd_td, o_td = tds[idx], tds[idx+1]; idx += 2; snd_td = cur_snd[c]
+                rem_row[c] -= 1
+                if "is-disabled" not in _classes(o_td):
+                    odds[f"{c+1}{sep}{_text(snd_td).strip()}{sep}{_text(trd_td).strip()}"] = extract_float(_text(o_td))
+    html = html_dict.get('odds2tf')
+    doc = _doc(html) if html else None
+    if doc is not None:
+        tbs = doc.xpath(_ODDS_TBODY_XPATH)
+        for i, (k, s) in enumerate((("2連単", '-'), ("2連複", '='))):
+            if len(tbs) > i:
+                _parse_pair_rows(tbs[i], race_data["odds"][k], s, raw=False)
+    html_k = html_dict.get('oddsk')
+    doc = _doc(html_k) if html_k else None
+    tbk = _first(doc, _ODDS_TBODY_XPATH) if doc is not None else None
+    if tbk is not None:
+        _parse_pair_rows(tbk, race_data["odds"]["拡連複"], '=', raw=True)
+    html_tf = html_dict.get('oddstf')
+    doc = _doc(html_tf) if html_tf else None
+    if doc is not None:
+        for unit in doc.xpath(f'//*[{_cls("grid_unit")}]'):
+            label_el = _first(unit, f'.//*[{_cls("title7_mainLabel")}]')
+            if label_el is None: continue
+            lt = _text(label_el)
+            mode = "単勝" if "単勝" in lt else "複勝" if "複勝" in lt else None
+            if not mode: continue
+            for tr in unit.xpath('.//table//tbody//tr'):
+                tds = tr.findall('.//td')
+                if len(tds) < 3: continue
+                bn = _text(tds[0]).strip(); val = _text(tds[2]).strip()
+                if "is-disabled" not in _classes(tds[2]):
+                    if mode == "単勝": race_data["odds"]["単勝"][bn] = extract_float(val)
+                    else: race_data["odds"]["複勝"][bn] = val
+
+
+def _parse_raceresult_lxml(html_text):
+    doc = _doc(html_text)
+    result_table = _first(doc, f'//*[{_cls("is-w495")}]') if doc is not None else None
+    if result_table is None:
+        return None
+    result = {"1st": 0, "2nd": 0, "3rd": 0, "payouts": {}}
+    for row in result_table.xpath('.//tbody//tr'):
+        tds = row.findall('.//td')
+        if len(tds) < 2:
+            continue
+        rank_text = _text(tds[0]).strip()
+        boat_match = re.search(r'[1-6]', _text(tds[1]))
+        if not boat_match:
+            continue
+        boat_no = int(boat_match.group())
+        if rank_text == '1':
+            result["1st"] = boat_no
+        elif rank_text == '2':
+            result["2nd"] = boat_no
+        elif rank_text == '3':
+            result["3rd"] = boat_no
+    for table in doc.xpath(f'//*[{_cls("table1")}]'):
+        _collect_payouts(_text(table), [[_text(td) for td in row.findall('.//td')] for row in table.findall('.//tr')], result)
+    if result["1st"] == 0:
+        return None
+    return result
+
+
+# ============================================================
+# DOM を作らないオッズ抽出（オッズページの既定経路）
+# ============================================================
+# オッズ表は固定の格子なので、tbody.is-p3-0（単勝/複勝は .grid_unit）の範囲だけを
+# 正規表現で1回走査し、セルから直接 (組番, オッズ) を取り出す。
+# タグの対応が取れない・script/コメントを含む・入れ子の表・格子が想定と違う、
+# などの構造チェックに1つでも引っかかったページは DOM パーサーで解析し直す。
+class _Fallback(Exception):
+    """構造チェック失敗（このページは DOM パーサーで解析し直す）"""
+
+
+_RAW_DELIMS = ((re.compile(r'<!--'), re.compile(r'-->')),
+               (re.compile(r'<script\b', re.I), re.compile(r'</script\s*>', re.I)),
+               (re.compile(r'<style\b', re.I), re.compile(r'</style\s*>', re.I)))
+_RAW_OPEN_RE = re.compile(r'<!--|<script\b|<style\b', re.I)
+_TBODY_OPEN_RE = re.compile(r'<tbody\b([^>]*)>', re.I)
+_TBODY_CLOSE_RE = re.compile(r'</tbody\s*>', re.I)
+_TABLE_OPEN_RE = re.compile(r'<table\b', re.I)
+_TR_OPEN_RE = re.compile(r'<tr\b', re.I)
+_TD_OPEN_RE = re.compile(r'<td\b', re.I)
+_TR_RE = re.compile(r'<tr\b[^>]*>(.*?)</tr\s*>', re.I | re.S)
+_TD_RE = re.compile(r'<td\b([^>]*)>(.*?)</td\s*>', re.I | re.S)
+_TAG_RE = re.compile(r'<[^>]*>')
+_ATTR_RES = {name: re.compile(r'(?:^|\s)' + name + r'\s*=\s*(?:"([^"]*)"|' + r"'([^']*)'" + r'|([^\s"\'>]+))', re.I)
+             for name in ("class", "rowspan")}
+_TRIFECTA_RE = re.compile(r'^([1-6])([-=])([1-6])\2([1-6])$')
+_PAIR_RE = re.compile(r'^([1-6])[-=]([1-6])$')
+_GRID_UNIT_RE = re.compile(r'<([a-zA-Z][a-zA-Z0-9]*)\b([^>]*grid_unit[^>]*)>')
+_LABEL_RE = re.compile(r'<([a-zA-Z][a-zA-Z0-9]*)\b([^>]*title7_mainLabel[^>]*)>')
+# 1ページの格子のセル数（欠場 is-disabled のセルも含む）
+_GRID_CELLS = {"3連単": 120, "3連複": 20}
+
+
+def _attr(attrs, name):
+    found = _ATTR_RES[name].findall(attrs)
+    if len(found) > 1: raise _Fallback(f"{name} 属性が複数")
+    return "".join(found[0]) if found else None
+
+
+def _has_class(attrs, name):
+    return name in (_attr(attrs, "class") or "").split()
+
+
+def _cell_text(inner):
+    """セル内の .text 相当（タグを除いて文字参照を戻す）"""
+    return html_lib.unescape(_TAG_RE.sub('', inner)) if '<' in inner or '&' in inner else inner
+
+
+def _in_raw(html, pos):
+    """pos がコメント・script・style の中か（中の「タグ」は DOM では要素にならない）"""
+    for opener, closer in _RAW_DELIMS:
+        last = None
+        for last in opener.finditer(html, 0, pos): pass
+        if last:
+            end = closer.search(html, last.end())
+            if not end or end.start() >= pos: return True
+    return False
+
+
+def _tbody_regions(html, cls=None):
+    """tbody（cls 指定時はその class を持つもの）の中身を文書順に"""
+    regions = []
+    for m in _TBODY_OPEN_RE.finditer(html):
+        if cls and not _has_class(m.group(1), cls): continue
+        if _in_raw(html, m.start()): raise _Fallback("コメント/script 内の tbody")
+        end = _TBODY_CLOSE_RE.search(html, m.end())
+        if not end: raise _Fallback("tbody が閉じていない")
+        region = html[m.end():end.start()]
+        if _TABLE_OPEN_RE.search(region) or _TBODY_OPEN_RE.search(region) or _RAW_OPEN_RE.search(region):
+            raise _Fallback("tbody 内に入れ子の表・コメント・script")
+        regions.append(region)
+    return regions
+
+
+def _odds_tbodies(html):
+    """tbody.is-p3-0 の中身（DOM の select('tbody.is-p3-0') と同じ順）"""
+    return _tbody_regions(html, "is-p3-0")
+
+
+def _grid_rows(region):
+    """tbody の中身 → 行ごとのセル [(class トークン, rowspan, テキスト), ...]"""
+    rows = _TR_RE.findall(region)
+    # 終了タグの欠けた tr/td は次の行・セルを飲み込むので、開始タグの数との差で分かる
+    if len(rows) != len(_TR_OPEN_RE.findall(region)):
+        raise _Fallback("tr の開始/終了が対応しない")
+    out, n_cells, attrs = [], 0, {}
+    for row in rows:
+        cells = []
+        for a, t in _TD_RE.findall(row):
+            if a not in attrs:
+                attrs[a] = ((_attr(a, "class") or "").split(), _attr(a, "rowspan"))
+            cells.append(attrs[a] + (_cell_text(t),))
+        n_cells += len(cells)
+        out.append(cells)
+    if n_cells != len(_TD_OPEN_RE.findall(region)):
+        raise _Fallback("td の開始/終了が対応しない")
+    return out
+
+
+def _extract_trifecta(html, key, sep):
+    regions = _odds_tbodies(html)
+    if not regions: raise _Fallback("オッズ表なし")
+    odds, cells = {}, 0
+    cur_snd, rem_row = [None]*6, [0]*6
+    for tds in _grid_rows(regions[0]):
+        idx = 0
+        for c in range(6):
+            if rem_row[c] == 0:
+                if idx + 2 >= len(tds): break
+                snd_td, trd_td, o_td = tds[idx], tds[idx+1], tds[idx+2]; idx += 3
+                cur_snd[c], rem_row[c] = snd_td, int(snd_td[1] or 1)
+            else:
+                if idx + 1 >= len(tds): break
+                trd_td, o_td = tds[idx], tds[idx+1]; idx += 2; snd_td = cur_snd[c]
+            rem_row[c] -= 1
+            cells += 1
+            combo = f"{c+1}{sep}{snd_td[2].strip()}{sep}{trd_td[2].strip()}"
+            m = _TRIFECTA_RE.match(combo)
+            if not m or len({m.group(1), m.group(3), m.group(4)}) != 3:
+                raise _Fallback(f"組番が不正: {combo}")
+            if "is-disabled" not in o_td[0]:
+                odds[combo] = extract_float(o_td[2])
+    if any(rem_row) or cells != _GRID_CELLS[key]:
+        raise _Fallback("格子が想定と違う")
+    return {key: odds}
+
+
+def _extract_pairs(region, sep, raw):
+    odds = {}
+    for tds in _grid_rows(region):
+        for c in range(6):
+            if c*2+1 < len(tds) and "is-disabled" not in tds[c*2][0]:
+                combo = f"{c+1}{sep}{tds[c*2][2].strip()}"
+                m = _PAIR_RE.match(combo)
+                if not m or m.group(1) == m.group(2):
+                    raise _Fallback(f"組番が不正: {combo}")
+                val = tds[c*2+1][2]
+                odds[combo] = val.strip() if raw else extract_float(val)
+    return odds
+
+
+def _extract_odds2tf(html):
+    regions = _odds_tbodies(html)
+    return {k: _extract_pairs(regions[i], s, raw=False)
+            for i, (k, s) in enumerate((("2連単", '-'), ("2連複", '='))) if len(regions) > i}
+
+
+def _extract_oddsk(html):
+    regions = _odds_tbodies(html)
+    return {"拡連複": _extract_pairs(regions[0], '=', raw=True)} if regions else {}
+
+
+def _element_end(html, start, tag):
+    """start にある開始タグ（tag）に対応する終了タグの開始位置"""
+    depth = 0
+    for m in re.compile(rf'<(/?){tag}\b[^>]*>', re.I).finditer(html, start):
+        depth += -1 if m.group(1) else 1
+        if depth == 0: return m.start()
+    raise _Fallback(f"{tag} が閉じていない")
+
+
+def _extract_oddstf(html):
+    out = {"単勝": {}, "複勝": {}}
+    for m in _GRID_UNIT_RE.finditer(html):
+        if not _has_class(m.group(2), "grid_unit"): continue
+        if _in_raw(html, m.start()): raise _Fallback("コメント/script 内の grid_unit")
+        unit = html[m.end():_element_end(html, m.start(), m.group(1))]
+        if _RAW_OPEN_RE.search(unit) or any(_has_class(u.group(2), "grid_unit") for u in _GRID_UNIT_RE.finditer(unit)):
+            raise _Fallback("grid_unit 内にコメント・script・入れ子の grid_unit")
+        label = next((l for l in _LABEL_RE.finditer(unit) if _has_class(l.group(2), "title7_mainLabel")), None)
+        if not label: continue
+        lt = _cell_text(unit[label.end():_element_end(unit, label.start(), label.group(1))])
+        mode = "単勝" if "単勝" in lt else "複勝" if "複勝" in lt else None
+        if not mode: continue
+        regions = _tbody_regions(unit)
+        if regions and not _TABLE_OPEN_RE.search(unit, 0, unit.lower().find('<tbody')):
+            raise _Fallback("table の外に tbody")
+        for region in regions:
+            for tds in _grid_rows(region):
+                if len(tds) < 3: continue
+                bn = tds[0][2].strip(); val = tds[2][2].strip()
+                if "is-disabled" not in tds[2][0]:
+                    out[mode][bn] = extract_float(val) if mode == "単勝" else val
+    return out
+
+
+_ODDS_EXTRACTORS = {
+    "odds3t": lambda h: _extract_trifecta(h, "3連単", '-'),
+    "odds3f": lambda h: _extract_trifecta(h, "3連複", '='),
+    "odds2tf": _extract_odds2tf,
+    "oddsk": _extract_oddsk,
+    "oddstf": _extract_oddstf,
+}
+
+
+def extract_odds(html_dict, race_data, dom_parser=None):
+    """
+    DOM を作らずにオッズを抽出して race_data["odds"] に書き込む。
+    構造チェックに失敗したページは dom_parser（省略時は PARSER）で解析し直す。
+    Returns: DOM パーサーで解析し直したページのキー
+    """
+    fallback = []
+    for page, extractor in _ODDS_EXTRACTORS.items():
+        html = html_dict.get(page)
+        if not html: continue
+        try:
+            found = extractor(html)
+        except (_Fallback, ValueError):
+            fallback.append(page)
+            parse_all_odds({page: html}, race_data, dom_parser or PARSER)
+            continue
+        for key, odds in found.items():
+            race_data["odds"][key].update(odds)
+    return fallback
+
+
+# ============================================================
+# 公開パーサー（parser: "lxml" / "html.parser"。省略時は PARSER、オッズは ODDS_PARSER）
+# ============================================================
+def parse_racelist(html_text, race_data, parser=None):
+    if not html_text: return
+    if (parser or PARSER) == "lxml": _parse_racelist_lxml(html_text, race_data)
+    else: _parse_racelist_bs4(html_text, race_data)
+
+
+def parse_beforeinfo(html_text, race_data, parser=None):
+    if not html_text: return
+    if (parser or PARSER) == "lxml": _parse_beforeinfo_lxml(html_text, race_data)
+    else: _parse_beforeinfo_bs4(html_text, race_data)
+
+
+def parse_all_odds(html_dict, race_data, parser=None):
+    """オッズパーサー（単勝/複勝/2連単/2連複/拡連複/3連単/3連複）。parser="regex" は DOM を作らない抽出"""
+    parser = parser or ODDS_PARSER
+    if parser == "regex": extract_odds(html_dict, race_data)
+    elif parser == "lxml": _parse_all_odds_lxml(html_dict, race_data)
+    else: _parse_all_odds_bs4(html_dict, race_data)
+
+
+def parse_raceresult(html_text, parser=None):
+    """結果ページ → {"1st", "2nd", "3rd", "payouts"}（着順が取れなければ None）"""
+    if not html_text: return None
+    if (parser or PARSER) == "lxml": return _parse_raceresult_lxml(html_text)
+    return _parse_raceresult_bs4(html_text)
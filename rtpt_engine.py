@@ -10,14 +10,23 @@ v7.4からの修正:
   Issue#13: 3連複インデックスを追加
   Issue#14: 級別補正を全場で発火（荒れ場では増幅）
 """
+import copy
+import hashlib
 import math
 import itertools
 import re
 import json
+import marshal
 import os
+import threading
+import time
 from datetime import datetime
 from collections import Counter
 
+import numpy as np
+
+from profiler import stage
+
 DEFAULT_PARAMS = {
     "wall_decay_strong": 1.30, "wall_decay_weak": 1.12,
     "wall_penalty_strong": 0.65, "wall_penalty_weak": 0.88,
@@ -46,13 +55,89 @@ DEFAULT_PARAMS = {
 PARAMS_FILE = "alpha_params.json"
 MIN_BET_YEN = 100
 
+class Params(dict):
+    """
+    凍結済みパラメータ。P["x"] / P.x どちらでも参照でき、変更はできない。
+    上書きは with_overrides() で新しい Params を作る。source は "file" / "default" / "custom"
+    """
+    __slots__ = ("source", "_digest")
+
+    def __init__(self, values, source="default"):
+        super().__init__(values)
+        self.source = source
+        self._digest = None
+
+    def __getattr__(self, key):
+        try: return self[key]
+        except KeyError: raise AttributeError(key) from None
+
+    def _frozen(self, *args, **kwargs):
+        raise TypeError("Params は変更できません（with_overrides() を使う）")
+    __setitem__ = __delitem__ = update = pop = popitem = clear = setdefault = __ior__ = _frozen
+
+    def __reduce__(self):
+        return (Params, (dict(self), self.source))
+
+    def with_overrides(self, override, source="custom"):
+        if not override: return self
+        return Params({**self, **override}, source)
+
+    def digest(self):
+        """値の安定ハッシュ（キャッシュキー用。初回だけ計算）"""
+        if self._digest is None:
+            self._digest = hashlib.sha1(repr(sorted(self.items())).encode('utf-8')).hexdigest()
+        return self._digest
+
+class ParamStore:
+    """
+    alpha_params.json のキャッシュ。ファイルの (mtime, サイズ) が変わった時だけ読み直す。
+    stat も check_interval 秒に1回まで。同じプロセス内で書き換えた直後は invalidate() を呼ぶ
+    """
+
+    def __init__(self, path=PARAMS_FILE, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._params = None
+        self._stamp = None
+        self._checked = 0.
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if self._params is not None and now - self._checked < self.check_interval:
+            return self._params
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+                stamp = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                stamp = None
+            if self._params is None or stamp != self._stamp:
+                self._params = self._load(stamp)
+                self._stamp = stamp
+            self._checked = now
+            return self._params
+
+    def _load(self, stamp):
+        if stamp is not None:
+            try:
+                with open(self.path, 'r') as f:
+                    return Params({**DEFAULT_PARAMS, **json.load(f)}, "file")
+            except (json.JSONDecodeError, IOError): pass
+        return Params(DEFAULT_PARAMS, "default")
+
+    def invalidate(self):
+        self._params = None
+
+PARAM_STORE = ParamStore()
+
+def get_params(params_override=None):
+    """キャッシュ済みの凍結パラメータ（params_override があれば上書きした新しい Params）"""
+    return PARAM_STORE.get().with_overrides(params_override)
+
 def load_params():
-    if os.path.exists(PARAMS_FILE):
-        try:
-            with open(PARAMS_FILE, 'r') as f:
-                return {**DEFAULT_PARAMS, **json.load(f)}
-        except (json.JSONDecodeError, IOError): pass
-    return dict(DEFAULT_PARAMS)
+    """従来互換: 変更可能な dict のコピー"""
+    return dict(PARAM_STORE.get())
 
 VENUE_COURSE_BIAS = {
     "桐生":[.52,.15,.13,.11,.06,.03],"戸田":[.43,.16,.14,.13,.08,.06],
@@ -111,20 +196,19 @@ VENUE_COURSE_HEADING = {
 }
 
 # === Utility ===
-def _parse_exhibition_st(b):
-    if "parsed_st" in b:
-        b["parsed_st"] = float(b["parsed_st"]); return
+def _exhibition_st_value(b):
+    if "parsed_st" in b: return float(b["parsed_st"])
     s = str(b.get("start_exhibition_st", "0.10")).strip()
     try:
         if "F" in s.upper():
             r = re.sub(r'[Ff]', '', s).strip()
-            if not r or r == '.': b["parsed_st"] = -0.05  # フライング（数値なし）はペナルティ
-            elif r.startswith('.'): b["parsed_st"] = -float('0' + r)
-            else: b["parsed_st"] = -float(r)
-        elif "L" in s.upper(): b["parsed_st"] = 0.25
-        elif s.startswith("."): b["parsed_st"] = float("0" + s)
-        else: b["parsed_st"] = float(s)
-    except ValueError: b["parsed_st"] = 0.10
+            if not r or r == '.': return -0.05  # フライング（数値なし）はペナルティ
+            elif r.startswith('.'): return -float('0' + r)
+            else: return -float(r)
+        elif "L" in s.upper(): return 0.25
+        elif s.startswith("."): return float("0" + s)
+        else: return float(s)
+    except ValueError: return 0.10
 
 def _months_since_exchange(venue, ds):
     em = MOTOR_EXCHANGE_MONTH.get(venue)
@@ -139,34 +223,82 @@ def _soft_cap_alpha(a, cap):
     if cap <= 0: return a
     return 1.0 + cap * math.tanh((a - 1.0) / cap)
 
+# === Vectorized Probability Core ===
+# 3連単120通りの順列と各券種への集計行列は固定なので、import時に1回だけ構築する。
+# 確率は全て「…×6」配列で扱い、先頭次元をレース数・試行数としてそのままバッチ化できる。
+PERMS = list(itertools.permutations(range(1, 7), 3))           # 3連単 120通り
+EXACTA_KEYS = list(itertools.permutations(range(1, 7), 2))     # 2連単 30通り
+PAIR_KEYS = list(itertools.combinations(range(1, 7), 2))       # 2連複/拡連複 15通り
+TRIO_KEYS = list(itertools.combinations(range(1, 7), 3))       # 3連複 20通り
+
+_PERM_IDX = np.array(PERMS, dtype=np.intp) - 1                 # (120, 3) 0始まり艇番
+_EXACTA_ORD = {k: i for i, k in enumerate(EXACTA_KEYS)}
+_PAIR_ORD = {frozenset(k): i for i, k in enumerate(PAIR_KEYS)}
+_TRIO_ORD = {frozenset(k): i for i, k in enumerate(TRIO_KEYS)}
+
+def _aggregation_matrix(ordmap, keys_of):
+    m = np.zeros((len(PERMS), len(ordmap)))
+    for pi, perm in enumerate(PERMS):
+        for k in keys_of(perm): m[pi, ordmap[k]] += 1.
+    return m
+
+_EXACTA_MAT = _aggregation_matrix(_EXACTA_ORD, lambda p: [(p[0], p[1])])
+_QUINELLA_MAT = _aggregation_matrix(_PAIR_ORD, lambda p: [frozenset(p[:2])])
+_WIDE_MAT = _aggregation_matrix(_PAIR_ORD, lambda p: [frozenset(p[:2]), frozenset(p[::2]), frozenset(p[1:])])
+_TRIO_MAT = _aggregation_matrix(_TRIO_ORD, lambda p: [frozenset(p)])
+
+# 条件付き依存補正の順列マスク（1着=1号艇×2着内側/外側、1着=1号艇以外）
+_CD_FAV_NEAR = (_PERM_IDX[:, 0] == 0) & (_PERM_IDX[:, 1] <= 2)
+_CD_FAV_FAR = (_PERM_IDX[:, 0] == 0) & (_PERM_IDX[:, 1] >= 4)
+_CD_OUT = _PERM_IDX[:, 0] != 0
+
+def _henery_vec(p, gamma):
+    adj = p ** gamma
+    return adj / adj.sum(axis=-1, keepdims=True)
+
+def _harville_vec(p):
+    """p: (…, 6) → 3連単確率 (…, 120)。列順はPERMS"""
+    pp = p[..., _PERM_IDX]
+    t1 = p.sum(axis=-1, keepdims=True) - pp[..., 0]
+    t2 = t1 - pp[..., 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p2 = np.where(t1 > 0, pp[..., 1] / t1, 0.)
+        p3 = np.where(t2 > 0, pp[..., 2] / t2, 0.)
+    return pp[..., 0] * p2 * p3
+
+def _cond_dep_vec(harv, p, iw):
+    """iw: 場の1コース1着率（スカラー or (…,)）。NaN = バイアス表なし → 補正しない"""
+    iw = np.asarray(iw, dtype=float)[..., None]
+    strong = iw > .50
+    m = np.where(strong & _CD_FAV_NEAR, 1.06, 1.)
+    m = np.where(strong & _CD_FAV_FAR, .94, m)
+    m = np.where(strong & _CD_OUT & (p[..., _PERM_IDX[:, 0]] < .15), 1.04, m)
+    adj = harv * m
+    adj = adj / adj.sum(axis=-1, keepdims=True)
+    return np.where(np.isnan(iw), harv, adj)
+
+def _prob_index_vec(harv):
+    """3連単 (…, 120) → 2連単(30) / 2連複(15) / 拡連複(15) / 3連複(20)"""
+    return harv @ _EXACTA_MAT, harv @ _QUINELLA_MAT, harv @ _WIDE_MAT, harv @ _TRIO_MAT
+
+def _venue_iw(venue):
+    cb = VENUE_COURSE_BIAS.get(venue)
+    return cb[0] if cb else float('nan')
+
+def _boat_vec(d):
+    return np.array([d[k] for k in range(1, 7)], dtype=float)
+
+# --- dict API（従来互換の薄いビュー） ---
 def _henery_prob(probs, gamma):
-    adj = {k: p ** gamma for k, p in probs.items()}
-    t = sum(adj.values())
-    return {k: v / t for k, v in adj.items()}
+    return dict(zip(range(1, 7), _henery_vec(_boat_vec(probs), gamma).tolist()))
 
 def _harville(pd):
-    probs = {}
-    for perm in itertools.permutations(range(1, 7), 3):
-        f, s, t = perm
-        p1 = pd[f]
-        r1 = {k: v for k, v in pd.items() if k != f}; t1 = sum(r1.values())
-        p2 = (r1[s] / t1) if t1 > 0 else 0
-        r2 = {k: v for k, v in r1.items() if k != s}; t2 = sum(r2.values())
-        p3 = (r2[t] / t2) if t2 > 0 else 0
-        probs[perm] = p1 * p2 * p3
-    return probs
+    return dict(zip(PERMS, _harville_vec(_boat_vec(pd)).tolist()))
 
 def _cond_dep_adjust(harv, pd, venue):
-    cb = VENUE_COURSE_BIAS.get(venue)
-    if not cb: return harv
-    iw = cb[0]; adj = {}
-    for perm, p in harv.items():
-        f, s, _ = perm; m = 1.0
-        if f == 1 and iw > .50: m *= 1.06 if s <= 3 else (.94 if s >= 5 else 1.)
-        elif f != 1 and iw > .50 and pd.get(f, 0) < .15: m *= 1.04
-        adj[perm] = p * m
-    tt = sum(adj.values())
-    return {k: v / tt for k, v in adj.items()}
+    if venue not in VENUE_COURSE_BIAS: return harv
+    h = np.array([harv[perm] for perm in PERMS])
+    return dict(zip(PERMS, _cond_dep_vec(h, _boat_vec(pd), _venue_iw(venue)).tolist()))
 
 # [Bug#24修正] 場ごとの風向き分類を実装
 def _classify_wind(venue, raw_wind_dir, wind_speed, wind_code=None):
@@ -265,15 +397,11 @@ def _infer_tide(env):
 
 def _build_prob_index(harv):
     """Harville→全券種インデックス（2連単/2連複/拡連複/3連複）"""
-    exacta = {}; quinella = {}; wide = {}; trifecta_combo = {}
-    for (f, s, t), p in harv.items():
-        ek = (f, s); exacta[ek] = exacta.get(ek, 0) + p
-        qk = frozenset({f, s}); quinella[qk] = quinella.get(qk, 0) + p
-        for pair in [frozenset({f, s}), frozenset({f, t}), frozenset({s, t})]:
-            wide[pair] = wide.get(pair, 0) + p
-        # [Issue#13] 3連複インデックス
-        tk = frozenset({f, s, t}); trifecta_combo[tk] = trifecta_combo.get(tk, 0) + p
-    return exacta, quinella, wide, trifecta_combo
+    h = np.array([harv[perm] for perm in PERMS])
+    ex, qu, wi, tr = (v.tolist() for v in _prob_index_vec(h))
+    pair_keys = [frozenset(k) for k in PAIR_KEYS]
+    return (dict(zip(EXACTA_KEYS, ex)), dict(zip(pair_keys, qu)),
+            dict(zip(pair_keys, wi)), dict(zip((frozenset(k) for k in TRIO_KEYS), tr)))
 
 # [Bug#15修正] HHI計算（複式の重みを0.5に）
 def _hhi_correlation_penalty(targets):
@@ -298,280 +426,521 @@ def _hhi_correlation_penalty(targets):
     return max(0.50, 1.0 - hhi * 0.50)
 
 
-# === Main Analysis ===
-def analyze(race_data, bankroll=1000, params_override=None, ml_model=None):
-    P = load_params()
-    if params_override: P.update(params_override)
+# === Race Packing（パラメータ非依存の特徴量抽出） ===
+# αソース識別子。alpha_adapter.ALPHA_SOURCES と同順（加算順序もこの順で固定）
+ALPHA_SOURCES = ("VoidExploit", "WallDecay", "WallHalf", "ExT", "Mot",
+                 "STRev", "STSlow", "Wt", "Class", "CBias", "Wind")
+TB = -0.5  # チルト基準（α-B）
+_CLASS_CODE = {"B1": 1, "B2": 2, "A1": 3}
+_CLASS_NAME = {1: "B1", 2: "B2"}
+_BET_TYPES = (("2連単", '-', EXACTA_KEYS, _EXACTA_ORD),
+              ("2連複", '=', PAIR_KEYS, _PAIR_ORD),
+              ("拡連複", '=', PAIR_KEYS, _PAIR_ORD),
+              ("3連複", '=', TRIO_KEYS, _TRIO_ORD))
+_NO_POS = 1 << 30
+
+_CANON_ORD = {bt: {sep.join(map(str, k)): i for i, k in enumerate(keys)} for bt, sep, keys, _ in _BET_TYPES}
+
+def _bet_odds(od, bet_type, sep, keys, ordmap):
+    """
+    券種のオッズdictを組番序数順の配列へ。pos は元dictでの出現順（同EV時の並び順を保存）。
+    同じ組番を表す2つ目以降のキー（"1=2" と "2=1"、"1-2" と "01-02"）は従来どおり別の買い目として
+    dups = [(出現順, 序数, キー, オッズ)] に残す
+    """
+    odds = [math.nan] * len(keys); pos = [_NO_POS] * len(keys)
+    combos = {}; dups = []; canon = _CANON_ORD[bet_type]
+    for n, (k, v) in enumerate(od.get(bet_type, {}).items()):
+        i = canon.get(k)
+        if i is None:
+            # 正規形でない組番（"01-02" 等）は従来どおり数値化して照合
+            try: bc = [int(p) for p in k.split(sep)]
+            except ValueError: continue
+            if len(bc) != len(keys[0]): continue
+            i = ordmap.get(tuple(bc) if bet_type == "2連単" else frozenset(bc))
+        if bet_type in ("2連単", "2連複"):
+            o = float(v)  # 従来同様、2連系のオッズ値異常は例外として上げる
+        else:
+            try: o = float(str(v).split('-')[0]) if bet_type == "拡連複" else float(v)
+            except ValueError: continue
+        if i is None: continue
+        if pos[i] != _NO_POS:
+            dups.append((n, i, k, o)); continue
+        if canon.get(k) is None: combos[i] = k  # 正規形でない組番は表示用に元のキーを保持
+        odds[i] = o; pos[i] = n
+    return odds, pos, combos, dups
+
+def _race_features(race_data):
+    """1レース分の特徴量を race_data を変更せずに抽出（単勝なしは error を立てる）"""
+    f = _static_features(race_data)
+    f.update(_odds_features(race_data.get("odds", {})))
+    return f
+
+def _static_features(race_data):
+    """出走表・展示・環境から決まる特徴量（締切前のオッズ更新では変わらない部分）"""
     rl = race_data.get("racelist", {})
     env = race_data.get("environment", {})
-    od = race_data.get("odds", {})
     meta = race_data.get("metadata", {})
     venue = meta.get("stadium", ""); rdate = meta.get("date", "")
+    bs = [rl[str(i)] for i in range(1, 7)]
     warns = []
+    f = {"error": None, "names": [b.get("name", "").strip() for b in bs]}
 
     # 展示データ: 利用可能な艇数をカウント（4艇以上あればα計算を実行）
-    ex_count = sum(
-        1 for i in range(1, 7)
-        if rl[str(i)].get("exhibition_time", 0) > 0
-        and rl[str(i)].get("start_exhibition_st")
-    )
+    ex_count = sum(1 for b in bs if b.get("exhibition_time", 0) > 0 and b.get("start_exhibition_st"))
     has_ex = ex_count >= 4  # 4艇以上あれば展示系αを有効化
-    if has_ex:
-        for b in rl.values(): _parse_exhibition_st(b)
-        if ex_count < 6:
-            warns.append(f"展示データ一部欠損({ex_count}/6艇): 欠損艇はデフォルト値で補完")
-            # 欠損艇にデフォルト値を設定
-            for i in range(1, 7):
-                b = rl[str(i)]
-                if not b.get("exhibition_time") or b.get("exhibition_time", 0) <= 0:
-                    b["exhibition_time"] = 6.80
-                if not b.get("start_exhibition_st"):
-                    b["start_exhibition_st"] = "0.15"
-                _parse_exhibition_st(b)
-    else:
+    if has_ex and ex_count < 6:
+        warns.append(f"展示データ一部欠損({ex_count}/6艇): 欠損艇はデフォルト値で補完")
+    elif not has_ex:
         warns.append(f"展示データ不足({ex_count}/6艇): 展示系αは無効化")
-
-    wo = od.get("単勝", {})
-    if not wo:
-        return {"error": "単勝オッズなし", "boats": [], "targets": [], "summary": {}, "warnings": []}
-
-    # [Issue#11] 動的Shrinkage (V7.5_fixed: removed high shrinkage to prevent artificial EV explosion on longshots)
-    tmp, n_sources = _multi_market_tmp(od)
-    shrinkage = max(0.00, P["shrinkage_base"] - (n_sources - 1) * P["shrinkage_per_source"])
-    # Hard clamp shrinkage as 0.20 base was destroying all EV calculations
-    shrinkage = min(shrinkage, 0.05) 
-    u = 1. / 6.
-    tmp = {k: (1 - shrinkage) * tmp[k] + shrinkage * u for k in tmp}
-    tt = sum(tmp.values()); tmp = {k: v / tt for k, v in tmp.items()}
-
-    # [Issue#12] α計算を加法ベースに変更
-    # 旧: alpha *= multiplier （順序依存、指数爆発）
-    # 新: alpha_additive += (multiplier - 1.0) → 最後に 1.0 + sum を乗数に変換
-    # これで全αが対等に加算され、順序依存性が消える
-    alpha_add = {i: 0.0 for i in range(1, 7)}
-    rsn = {i: [] for i in range(1, 7)}
-    wd = {i: 12. for i in range(1, 7)}
-
-    # α-A: Wall Decay
-    if has_ex:
-        for i in range(1, 6):
-            inn = rl[str(i)].get("parsed_st", .1); out = rl[str(i+1)].get("parsed_st", .1)
-            d = inn - out
-            if d >= .08:
-                wd[i] = 0.
-                alpha_add[i+1] += P["wall_decay_strong"] - 1.0
-                alpha_add[i] += P["wall_penalty_strong"] - 1.0
-                rsn[i+1].append(f"VoidExploit(ΔST={d:.2f}→+{P['wall_decay_strong']-1:.2f})")
-                rsn[i].append(f"WallDecay(ΔST={d:.2f}→{P['wall_penalty_strong']-1:+.2f})")
-            elif d >= .04:
-                wd[i] *= .5
-                alpha_add[i+1] += P["wall_decay_weak"] - 1.0
-                alpha_add[i] += P["wall_penalty_weak"] - 1.0
-                rsn[i+1].append(f"VoidExploit(ΔST={d:.2f}→+{P['wall_decay_weak']-1:.2f})")
-                rsn[i].append(f"WallHalf(ΔST={d:.2f}→{P['wall_penalty_weak']-1:+.2f})")
-
-    # α-B: ExTime × Tilt
-    TB = -0.5
+    f["has_ex"] = has_ex
+    st = [_exhibition_st_value(b) for b in bs] if has_ex else [.1] * 6
+
+    # α-A: Wall Decay（隣接艇の展示ST差）
+    d = [st[i] - st[i + 1] for i in range(5)]
+    strong = [has_ex and x >= .08 for x in d]
+    weak = [has_ex and not s and x >= .04 for x, s in zip(d, strong)]
+    f["void_strong"] = [False] + strong; f["void_weak"] = [False] + weak
+    f["wall_strong"] = strong + [False]; f["wall_weak"] = weak + [False]
+    f["dst_out"] = [0.] + d; f["dst_in"] = d + [0.]
+    f["wd"] = [0. if s else (6. if w else 12.) for s, w in zip(strong, weak)] + [12.]
+
+    # α-B: ExTime × Tilt（欠損艇は 6.80 で補完した上で z 値化）
+    z = [0.] * 6
     if has_ex:
-        aet = {}
-        for k, b in rl.items():
-            et = b.get("exhibition_time", 0); tl = b.get("tilt", TB)
-            aet[int(k)] = (et + (tl - TB) * .02) if et > 0 else 6.80
-        if len(aet) == 6:
-            av = sum(aet.values()) / 6
-            sd = max(.01, (sum((v - av) ** 2 for v in aet.values()) / 5) ** .5)  # 標本標準偏差(N-1=5)
-            for bn, et in aet.items():
-                z = (av - et) / sd
-                if abs(z) >= P["ex_time_min_z"]:
-                    delta = _clamp(z * P["ex_time_coeff"], -.20, .20)
-                    alpha_add[bn] += delta
-                    rsn[bn].append(f"ExT(z={z:+.2f}→{delta:+.3f})")
+        aet = []
+        for b in bs:
+            et = b.get("exhibition_time", 0)
+            if not et or et <= 0: et = 6.80
+            aet.append(et + (b.get("tilt", TB) - TB) * .02)
+        av = sum(aet) / 6
+        sd = max(.01, (sum((v - av) ** 2 for v in aet) / 5) ** .5)  # 標本標準偏差(N-1=5)
+        z = [(av - et) / sd for et in aet]
+    f["z"] = z
 
     # α-C: Motor
-    mo = _months_since_exchange(venue, rdate); mt = min(1., mo / 3.)
-    for bn in range(1, 7):
-        m2 = rl[str(bn)].get("motor_2ren", 30.); dv = (m2 - 30.) / 30.
-        if abs(dv) > P["motor_min_deviation"]:
-            delta = _clamp(dv * P["motor_coeff"] * mt, -.12, .12)
-            alpha_add[bn] += delta
-            rsn[bn].append(f"Mot({m2:.0f}%→{delta:+.3f})")
+    f["m2"] = [b.get("motor_2ren", 30.) for b in bs]
+    f["dv"] = [(m2 - 30.) / 30. for m2 in f["m2"]]
+    f["mt"] = min(1., _months_since_exchange(venue, rdate) / 3.)
 
-    # α-D: ST Reversion
+    # α-D: ST Reversion（パラメータ非依存なのでδまで確定）
+    f["g"] = [0.] * 6; f["st_delta"] = [0.] * 6
+    f["strev"] = [False] * 6; f["stslow"] = [False] * 6
     if has_ex:
-        for bn in range(1, 7):
-            b = rl[str(bn)]; ast = b.get("avg_st", .15); est = b.get("parsed_st", .10)
+        for i, b in enumerate(bs):
+            ast = b.get("avg_st", .15); est = st[i]
             if ast > 0 and est > 0:
-                g = ast - est
-                if g > .04:
-                    delta = _clamp(-g * 1.2, -.12, 0.)
-                    alpha_add[bn] += delta
-                    rsn[bn].append(f"STRev({g:.2f}→{delta:+.3f})")
-                elif g < -.03:
-                    delta = _clamp(g * .8, -.08, 0.)
-                    alpha_add[bn] += delta
-                    rsn[bn].append(f"STSlow({g:.2f}→{delta:+.3f})")
+                g = ast - est; f["g"][i] = g
+                if g > .04: f["strev"][i] = True; f["st_delta"][i] = _clamp(-g * 1.2, -.12, 0.)
+                elif g < -.03: f["stslow"][i] = True; f["st_delta"][i] = _clamp(g * .8, -.08, 0.)
 
     # α-E: Weight
-    wts = {int(k): b.get("weight", 0) for k, b in rl.items() if b.get("weight", 0) > 0}
-    if len(wts) >= 4:
-        aw = sum(wts.values()) / len(wts)
-        for bn, w in wts.items():
-            d = aw - w
-            if abs(d) >= P["weight_min_diff"]:
-                delta = _clamp(d * P["weight_coeff"], -.04, .04)
-                alpha_add[bn] += delta
-                rsn[bn].append(f"Wt({w:.0f}kg→{delta:+.3f})")
-
-    # [Issue#14] α-F: 級別補正（全場で発火、荒れ場で増幅）
-    vol = VENUE_VOLATILITY.get(venue, .5)
-    vol_amp = 1.0 + vol * P["volatile_amplify"]  # 荒れ場で増幅
-    for bn in range(1, 7):
-        rc = rl[str(bn)].get("class", "")
-        if rc in ("B1", "B2"):
-            delta = P["class_b_boost"] * vol_amp
-            alpha_add[bn] += delta
-            rsn[bn].append(f"Class({rc}→{delta:+.3f})")
-        elif rc == "A1" and tmp.get(bn, 0) > .30:
-            delta = -P["class_a1_penalty"] * vol_amp
-            alpha_add[bn] += delta
-            rsn[bn].append(f"Class(A1fav→{delta:+.3f})")
-
-    # α-G: Course Bias
+    f["weight"] = [b.get("weight", 0) for b in bs]
+    wts = [w for w in f["weight"] if w > 0]
+    aw = sum(wts) / len(wts) if len(wts) >= 4 else 0.
+    f["wt_ok"] = [len(wts) >= 4 and w > 0 for w in f["weight"]]
+    f["wdiff"] = [aw - w if ok else 0. for w, ok in zip(f["weight"], f["wt_ok"])]
+
+    # α-F: 級別
+    f["cls"] = [_CLASS_CODE.get(b.get("class", ""), 0) for b in bs]
+    f["vol"] = VENUE_VOLATILITY.get(venue, .5)
+
+    # α-G: Course Bias（進入6艇が揃った場合のみ）
     cb = VENUE_COURSE_BIAS.get(venue); c2b = {}
     for k, b in rl.items():
         sc = b.get("start_course")
         if sc: c2b[int(sc)] = int(k)
+    f["course"] = [0] * 6; f["cb_r"] = [1.] * 6; f["cb_fire"] = [False] * 6
     if cb and len(c2b) == 6:
         ab = 1. / 6.
         for ci, bn in c2b.items():
             if 1 <= ci <= 6:
                 r = cb[ci - 1] / ab
-                if abs(r - 1.) > .15:
-                    delta = _clamp((r - 1.) * P["course_bias_coeff"], -.15, .15)
-                    alpha_add[bn] += delta
-                    rsn[bn].append(f"CBias(C{ci}→{delta:+.3f})")
+                f["course"][bn - 1] = ci; f["cb_r"][bn - 1] = r; f["cb_fire"][bn - 1] = abs(r - 1.) > .15
+    f["iw"] = _venue_iw(venue)
 
-    # α-H: Wind × Tide
+    # α-H: Wind × Tide（複合ルールの乗数は固定値なのでδまで確定）
     wdir = _classify_wind(venue, env.get("wind_direction", "無風"),
                           env.get("wind_speed", 0), env.get("wind_direction_code"))
     wspd = env.get("wind_speed", 0)
     tide = _infer_tide(env)
-    if venue in TIDAL_VENUES and tide == "any":
-        warns.append(f"{venue}は潮汐の影響大。tide_data.pyで自動注入推奨")
     applied = None
     for (v, wd_rule, mw, tc), adjs in VENUE_COMPOUND_RULES.items():
         if venue == v and wdir == wd_rule and wspd >= mw:
             if tc == tide: applied = adjs; break
             elif tc == "any" and applied is None: applied = adjs
-    if applied:
-        for cno, mult in applied.items():
-            tgt = c2b.get(cno, cno) if c2b else cno
-            if 1 <= tgt <= 6:
-                delta = mult - 1.0
-                alpha_add[tgt] += delta
-                rsn[tgt].append(f"Wind×Tide({venue}/{wdir}/{wspd}m/{tide}→C{cno}{delta:+.2f})")
-
-    # [Issue#12] 加法αを乗法αに変換 + ソフトキャップ
-    cap = P["alpha_soft_cap"]
-    al = {}
-    for bn in range(1, 7):
-        # 荒れ場増幅: 全αの合計乖離を増幅
-        raw_deviation = alpha_add[bn]
-        if vol >= 0.7 and abs(raw_deviation) > 0.03:
-            raw_deviation *= (1.0 + vol * 0.20)
-        al[bn] = _soft_cap_alpha(1.0 + raw_deviation, cap)
+    f["wind"] = [0.] * 6; f["wind_rules"] = []
+    for cno, mult in (applied or {}).items():
+        tgt = c2b.get(cno, cno) if c2b else cno
+        if 1 <= tgt <= 6:
+            f["wind"][tgt - 1] += mult - 1.0
+            f["wind_rules"].append((tgt, cno, mult - 1.0))
+    f["wind_label"] = f"{venue}/{wdir}/{wspd}m/{tide}"
+    f["tide"] = tide
 
-    # Step 3: Posterior → Henery
-    pr = {k: tmp.get(k, 1/6) * max(.05, al[k]) for k in range(1, 7)}
-    tp = sum(pr.values()); pr = {k: v / tp for k, v in pr.items()}
-    pd = _henery_prob(pr, gamma=P["henery_gamma"])
+    if venue in TIDAL_VENUES and tide == "any":
+        warns.append(f"{venue}は潮汐の影響大。tide_data.pyで自動注入推奨")
+    f["warnings"] = warns
+    return f
+
+def _odds_features(od):
+    """オッズから決まる特徴量: Multi-Market TMP + 各券種の配列化（単勝なしは error）"""
+    f = {"error": None}
+    if not od.get("単勝", {}):
+        f["error"] = "単勝オッズなし"
+        f["tmp_raw"], f["n_sources"] = [1. / 6.] * 6, 1
+    else:
+        tmp, f["n_sources"] = _multi_market_tmp(od)
+        f["tmp_raw"] = [tmp[k] for k in range(1, 7)]
+    f["nc"] = sum(len(od.get(t, {})) for t in ["2連単","2連複","拡連複","3連単","3連複"])
+    f["odds"] = [_bet_odds(od, *bt) for bt in _BET_TYPES]
+    return f
+
+_PER_BOAT = ("void_strong", "void_weak", "wall_strong", "wall_weak", "dst_out", "dst_in", "wd",
+             "z", "m2", "dv", "g", "st_delta", "strev", "stslow", "weight", "wt_ok", "wdiff",
+             "cls", "course", "cb_r", "cb_fire", "wind", "tmp_raw")
+_PER_RACE = ("has_ex", "mt", "vol", "iw", "n_sources", "nc")
+_PER_RACE_INFO = ("error", "names", "warnings", "wind_rules", "wind_label", "tide")
+# 配列の型は明示する（空バッチでも発火マスクが bool、級別・進入が int のまま演算できるように）
+_BOAT_DTYPE = dict.fromkeys(_PER_BOAT, float)
+_BOAT_DTYPE.update(dict.fromkeys(("void_strong", "void_weak", "wall_strong", "wall_weak",
+                                  "strev", "stslow", "wt_ok", "cb_fire"), bool))
+_BOAT_DTYPE.update(cls=np.int64, course=np.int64)
+
+class RaceBatch:
+    """
+    N レース分の特徴量を (N×6) 配列に詰めたもの。
+    パラメータに依存しない処理（ST/オッズのパース、進入マッピング、風分類、複合ルール照合）は
+    pack_races() で1回だけ行い、_score() はこの配列とパラメータだけで全レースを一括計算する。
+    """
 
-    # [ML Override] MLモデルが提供されている場合、確率をMLの予測で上書き
-    if ml_model is not None:
-        ml_probs = ml_model.predict_proba(race_data)
-        if ml_probs:
-            # MLの確率とHarvilleの確率をブレンド (ML 70%, Harville 30%)
-            for k in range(1, 7):
-                pd[k] = ml_probs.get(k, 1/6) * 0.7 + pd[k] * 0.3
-            tp = sum(pd.values())
-            pd = {k: v / tp for k, v in pd.items()}
-
-    boats = [{"boat": k, "name": rl[str(k)].get("name", "").strip(),
-              "tmp": tmp.get(k, 0), "alpha": al[k], "post_prob": pd[k],
-              "wd": wd[k], "reasons": rsn[k]} for k in range(1, 7)]
-
-    # Step 4: Harville + Cond Dep
-    harv = _cond_dep_adjust(_harville(pd), pd, venue)
-
-    # インデックス構築（2連単/2連複/拡連複/3連複全対応）
-    exacta_idx, quinella_idx, wide_idx, trifecta_combo_idx = _build_prob_index(harv)
-
-    # Step 5: Bet extraction
-    nc = sum(len(od.get(t, {})) for t in ["2連単","2連複","拡連複","3連単","3連複"])
-    th2 = _adj_ev_th(P["ev_threshold_2ren"], nc, P)
-    th3 = _adj_ev_th(P["ev_threshold_3ren"], nc, P)
-    thw = _adj_ev_th(P["ev_threshold_wide"], nc, P)
-    targets = []
-
-    max_odds = P.get("max_odds", 80.0)
-    max_ev = P.get("max_ev", 8.0)
-
-    for k, odds in od.get("2連単", {}).items():
-        pts = k.split('-')
-        if len(pts) != 2: continue
-        try: f, s = int(pts[0]), int(pts[1])
-        except ValueError: continue
-        o = float(odds)
-        if o > max_odds: continue
-        ep = exacta_idx.get((f, s), 0)
-        ev = ep * o
-        if ev >= th2 and ev <= max_ev and ep > .05:
-            targets.append({"type":"2連単","combo":k,"prob":ep,"odds":o,"ev":ev})
-
-    for k, odds in od.get("2連複", {}).items():
-        pts = k.split('=')
-        if len(pts) != 2: continue
-        try: f, s = int(pts[0]), int(pts[1])
-        except ValueError: continue
-        o = float(odds)
-        if o > max_odds: continue
-        ep = quinella_idx.get(frozenset({f, s}), 0)
-        ev = ep * o
-        if ev >= th2 and ev <= max_ev and ep > .05:
-            targets.append({"type":"2連複","combo":k,"prob":ep,"odds":o,"ev":ev})
-
-    for k, os_str in od.get("拡連複", {}).items():
-        pts = k.split('=')
-        if len(pts) != 2: continue
-        try:
-            f, s = int(pts[0]), int(pts[1])
-            ep = wide_idx.get(frozenset({f, s}), 0)
-            mo = float(str(os_str).split('-')[0])
-            if mo > max_odds: continue
-            ev = ep * mo
-            if ev >= thw and ev <= max_ev and ep > .15:
-                targets.append({"type":"拡連複","combo":k,"prob":ep,"odds":mo,"ev":ev})
-        except (ValueError, IndexError): pass
-
-    # [v7.5_fixed] 3連単を除外: 90日間のバックテストで41件全て不的中(ROI -100%)
-    # for k, odds in od.get("3連単", {}).items(): ... removed
-
-    # [Issue#13] 3連複: インデックスから直接取得
-    for k, odds in od.get("3連複", {}).items():
+    def __init__(self, feats):
+        self.n = len(feats)
+        for k in _PER_BOAT:
+            setattr(self, k, np.array([f[k] for f in feats], dtype=_BOAT_DTYPE[k]).reshape(self.n, 6))
+        for k in _PER_RACE:
+            setattr(self, k, np.array([f[k] for f in feats], dtype=float).reshape(self.n, 1))
+        self.has_ex = self.has_ex.astype(bool)
+        for k in _PER_RACE_INFO:
+            setattr(self, k, [f[k] for f in feats])
+        self._pack_bets(feats)
+
+    def _pack_bets(self, feats):
+        widths = [len(bt[2]) for bt in _BET_TYPES]
+        self.bet_odds = [np.array([f["odds"][t][0] for f in feats], dtype=float).reshape(self.n, w)
+                         for t, w in enumerate(widths)]
+        self.bet_pos = [np.array([f["odds"][t][1] for f in feats], dtype=np.int64).reshape(self.n, w)
+                        for t, w in enumerate(widths)]
+        self.bet_combo = [[dict(f["odds"][t][2]) for f in feats] for t in range(len(widths))]
+        self.bet_dups = [[f["odds"][t][3] for f in feats] for t in range(len(widths))]
+
+    def __len__(self):
+        return self.n
+
+    def with_odds(self, odds_feats):
+        """オッズ由来の配列（_odds_features の戻り値のリスト）だけを差し替えたコピー。他の配列は共有"""
+        out = copy.copy(self)
+        out.tmp_raw = np.array([f["tmp_raw"] for f in odds_feats], dtype=float).reshape(self.n, 6)
+        for k in ("n_sources", "nc"):
+            setattr(out, k, np.array([f[k] for f in odds_feats], dtype=float).reshape(self.n, 1))
+        out.error = [f["error"] for f in odds_feats]
+        out._pack_bets(odds_feats)
+        return out
+
+    @classmethod
+    def concat(cls, batches):
+        """複数の RaceBatch をレース方向に連結（日単位でパックした配列をウィンドウ単位にまとめる用）"""
+        batches = [b for b in batches if len(b)]
+        if not batches: return cls([])
+        out = cls.__new__(cls)
+        out.n = sum(len(b) for b in batches)
+        for k in _PER_BOAT + _PER_RACE:
+            setattr(out, k, np.concatenate([getattr(b, k) for b in batches]))
+        for k in _PER_RACE_INFO:
+            setattr(out, k, [x for b in batches for x in getattr(b, k)])
+        out.bet_odds = [np.concatenate([b.bet_odds[t] for b in batches]) for t in range(len(_BET_TYPES))]
+        out.bet_pos = [np.concatenate([b.bet_pos[t] for b in batches]) for t in range(len(_BET_TYPES))]
+        out.bet_combo = [[x for b in batches for x in b.bet_combo[t]] for t in range(len(_BET_TYPES))]
+        out.bet_dups = [[x for b in batches for x in b.bet_dups[t]] for t in range(len(_BET_TYPES))]
+        return out
+
+    def columns(self):
+        """
+        保存用に分解 → (配列 dict, JSON 化できるレース単位の情報 dict)。from_columns() で復元できる。
+        bet_combo は (序数, 組番) の対のリストになる（JSON のキーは文字列になるため）
+        """
+        arrays = {k: getattr(self, k) for k in _PER_BOAT + _PER_RACE}
+        for t in range(len(_BET_TYPES)):
+            arrays[f"bet_odds_{t}"] = self.bet_odds[t]
+            arrays[f"bet_pos_{t}"] = self.bet_pos[t]
+        info = {k: list(getattr(self, k)) for k in _PER_RACE_INFO}
+        info["bet_combo"] = [[sorted(c.items()) for c in self.bet_combo[t]] for t in range(len(_BET_TYPES))]
+        info["bet_dups"] = [list(self.bet_dups[t]) for t in range(len(_BET_TYPES))]
+        return arrays, info
+
+    @classmethod
+    def from_columns(cls, arrays, info, rows=None):
+        """
+        columns() の戻り値（配列は mmap でもよい）から組み立てる。特徴量の再抽出はしない。
+        rows: 取り出すレース行（None なら全行）。配列は rows で切り出したコピーになる
+        """
+        out = cls.__new__(cls)
+        idx = np.arange(len(info["error"])) if rows is None else np.asarray(rows, dtype=np.int64)
+        out.n = len(idx)
+        for k in _PER_BOAT + _PER_RACE:
+            setattr(out, k, np.asarray(arrays[k])[idx])
+        for k in _PER_RACE_INFO:
+            setattr(out, k, [_freeze(info[k][i]) for i in idx])
+        out.bet_odds = [np.asarray(arrays[f"bet_odds_{t}"])[idx] for t in range(len(_BET_TYPES))]
+        out.bet_pos = [np.asarray(arrays[f"bet_pos_{t}"])[idx] for t in range(len(_BET_TYPES))]
+        out.bet_combo = [[dict(info["bet_combo"][t][i]) for i in idx] for t in range(len(_BET_TYPES))]
+        out.bet_dups = [[_freeze(info["bet_dups"][t][i]) for i in idx] for t in range(len(_BET_TYPES))]
+        return out
+
+_INPUT_FIELDS = _PER_BOAT + _PER_RACE + _PER_RACE_INFO + ("odds",)
+
+def _freeze(v):
+    if isinstance(v, (list, tuple)):
+        if v and isinstance(v[0], (list, tuple, dict)): return tuple(_freeze(x) for x in v)
+        return tuple(v)
+    if isinstance(v, dict): return tuple(sorted(v.items()))
+    return v
+
+class RaceInput:
+    """
+    1レース分の凍結済み入力（6艇ぶんの特徴量を tuple で保持。パース・進入マッピング・風分類は作成時に完了）。
+    freeze_race() で race_data から1回だけ作り、analyze / analyze_batch / RaceSession に何度でも渡せる。
+    変更不可なので試行間・スレッド間で共有してよい。race_data は ML モデル用に参照だけ保持し、変更しない
+    """
+    __slots__ = _INPUT_FIELDS + ("race_data",)
+
+    def __init__(self, features, race_data=None):
+        for k in _INPUT_FIELDS:
+            object.__setattr__(self, k, _freeze(features[k]))
+        object.__setattr__(self, "race_data", race_data)
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("RaceInput は変更できません")
+
+    def __reduce__(self):
+        return (RaceInput, ({k: getattr(self, k) for k in _INPUT_FIELDS}, self.race_data))
+
+    def digest(self):
+        """入力内容の安定ハッシュ（キャッシュキー用。race_data の参照は含まない）"""
+        # marshal v2 は参照を使わないので、同じ内容なら同じバイト列になる
+        return hashlib.sha1(marshal.dumps(tuple(getattr(self, k) for k in _INPUT_FIELDS), 2)).hexdigest()
+
+def freeze_race(race_data):
+    """race_data → RaceInput（RaceInput はそのまま返す）。入力不正は例外"""
+    if isinstance(race_data, RaceInput): return race_data
+    return RaceInput(_race_features(race_data), race_data)
+
+def pack_races(races):
+    """race_data（または RaceInput）のリストを RaceBatch に変換。入力不正のレースは error 付きで保持する"""
+    feats = []
+    for rd in races:
         try:
-            bc = list(map(int, k.split('=')))
-            if len(bc) != 3: continue
-            o = float(odds)
-            if o > max_odds: continue
-            ep = trifecta_combo_idx.get(frozenset(bc), 0)
-            ev = ep * o
-            if ev >= th3 and ev <= max_ev and ep >= P["trifecta_min_prob_combo"]:
-                targets.append({"type":"3連複","combo":k,"prob":ep,"odds":o,"ev":ev})
-        except (ValueError, KeyError): pass
+            feats.append(freeze_race(rd))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            f = _race_features(_EMPTY_RACE)
+            f["error"] = f"入力データ不正: {e!r}"; f["warnings"] = []
+            feats.append(RaceInput(f, rd))
+    return RaceBatch(feats)
+
+_EMPTY_RACE = {"racelist": {str(i): {} for i in range(1, 7)}, "odds": {}}
+
+# === Scoring（パラメータ依存部分: α → ソフトキャップ → Henery → Harville → EV） ===
+_CLASS_IDX = ALPHA_SOURCES.index("Class")
+
+def _static_components(b, P):
+    """
+    tmp に依存しないαソースの (寄与, 発火マスク) を ALPHA_SOURCES 順で返す（Class の位置は None）。
+    P の値は (T,1,1) 配列でもよく、その場合は試行次元付きで一括計算される。
+    """
+    def fire(mask, delta):
+        return np.where(mask, delta, 0.), mask
+
+    hx = b.has_ex
+    ext_fire = hx & (np.abs(b.z) >= P["ex_time_min_z"])
+    mot_fire = np.abs(b.dv) > P["motor_min_deviation"]
+    wt_fire = b.wt_ok & (np.abs(b.wdiff) >= P["weight_min_diff"])
+    return [
+        fire(b.void_strong | b.void_weak,
+             np.where(b.void_strong, P["wall_decay_strong"] - 1.0, P["wall_decay_weak"] - 1.0)),
+        fire(b.wall_strong, P["wall_penalty_strong"] - 1.0),
+        fire(b.wall_weak, P["wall_penalty_weak"] - 1.0),
+        fire(ext_fire, np.clip(b.z * P["ex_time_coeff"], -.20, .20)),
+        fire(mot_fire, np.clip(b.dv * P["motor_coeff"] * b.mt, -.12, .12)),
+        fire(b.strev, b.st_delta),
+        fire(b.stslow, b.st_delta),
+        fire(wt_fire, np.clip(b.wdiff * P["weight_coeff"], -.04, .04)),
+        None,
+        fire(b.cb_fire, np.clip((b.cb_r - 1.) * P["course_bias_coeff"], -.15, .15)),
+        fire(b.wind != 0, b.wind),
+    ]
+
+def _class_component(b, P, tmp):
+    """α-F 級別: A1 の人気過剰ペナルティは tmp > .30 のときだけ発火するのでオッズ更新ごとに再計算"""
+    vol_amp = 1.0 + b.vol * P["volatile_amplify"]  # 荒れ場で増幅
+    cls_delta = np.where(b.cls == 3, -P["class_a1_penalty"] * vol_amp, P["class_b_boost"] * vol_amp)
+    cls_fire = (b.cls == 1) | (b.cls == 2) | ((b.cls == 3) & (tmp > .30))
+    return np.where(cls_fire, cls_delta, 0.), cls_fire
+
+def _alpha_components(b, P, tmp, static=None):
+    """
+    各αソースの加法寄与と発火マスクを ALPHA_SOURCES 順で返す。
+    static: _static_components(b, P) の計算済みの値（オッズだけ変わった再解析で使い回す）
+    """
+    comps = list(static if static is not None else _static_components(b, P))
+    comps[_CLASS_IDX] = _class_component(b, P, tmp)
+    return comps
+
+def _score(b, P, with_bets=True, ml_probs=None, static=None):
+    # [Issue#11] 動的Shrinkage (V7.5_fixed: removed high shrinkage to prevent artificial EV explosion on longshots)
+    with stage("engine.tmp"):
+        shrinkage = np.maximum(0.00, P["shrinkage_base"] - (b.n_sources - 1) * P["shrinkage_per_source"])
+        # Hard clamp shrinkage as 0.20 base was destroying all EV calculations
+        shrinkage = np.minimum(shrinkage, 0.05)
+        tmp = (1 - shrinkage) * b.tmp_raw + shrinkage * (1. / 6.)
+        tmp = tmp / tmp.sum(axis=-1, keepdims=True)
+
+    # [Issue#12] 加法α: 全ソースの寄与を固定順で合算 → 乗法αに変換 + ソフトキャップ
+    with stage("engine.alpha"):
+        comps = _alpha_components(b, P, tmp, static)
+        raw = 0.0
+        for delta, _ in comps: raw = raw + delta
+        # 荒れ場増幅: 全αの合計乖離を増幅
+        raw = np.where((b.vol >= 0.7) & (np.abs(raw) > 0.03), raw * (1.0 + b.vol * 0.20), raw)
+        a = 1.0 + raw; cap = P["alpha_soft_cap"]
+        # cap はスイープ時に (T,1,1) 配列になるので三項演算子ではなく np.where（cap <= 0 は上限なし）
+        al = np.where(cap > 0, 1.0 + cap * np.tanh((a - 1.0) / np.where(cap > 0, cap, 1.0)), a)
+
+    # Step 3: Posterior → Henery
+    with stage("engine.henery"):
+        pr = tmp * np.maximum(.05, al)
+        pd = _henery_vec(pr / pr.sum(axis=-1, keepdims=True), P["henery_gamma"])
+
+    # [ML Override] MLモデルの確率とブレンド (ML 70%, Harville 30%)
+    if ml_probs:
+        pd = pd.copy()
+        for i, mp in ml_probs.items():
+            pd[i] = np.array([mp.get(k, 1/6) for k in range(1, 7)]) * 0.7 + pd[i] * 0.3
+            pd[i] = pd[i] / pd[i].sum()
+
+    out = {"shrinkage": shrinkage, "tmp": tmp, "comps": comps, "alpha": al, "pd": pd}
+    if not with_bets: return out
+
+    # Step 4: Harville + Cond Dep → 全券種インデックス（2連単/2連複/拡連複/3連複）
+    with stage("engine.harville"):
+        harv = _cond_dep_vec(_harville_vec(pd), pd, b.iw[:, 0])
+    with stage("engine.index"):
+        probs = _prob_index_vec(harv)
+
+    # Step 5: EV 判定（閾値は候補数ごとに Selection Bias 補正）
+    with stage("engine.ev"):
+        evs, masks, ths = _ev_masks(b, P, probs)
+    out.update({"probs": probs, "ev": evs, "ev_mask": masks, "thresholds": ths})
+    return out
+
+def _ev_masks(b, P, probs):
+    """券種ごとの EV と購入可否マスク → (evs, masks, 閾値 (N×3))"""
+    th = {}
+    for nc in set(b.nc[:, 0].tolist()):
+        th[nc] = (_adj_ev_th(P["ev_threshold_2ren"], nc, P), _adj_ev_th(P["ev_threshold_3ren"], nc, P),
+                  _adj_ev_th(P["ev_threshold_wide"], nc, P))
+    ths = np.array([th[nc] for nc in b.nc[:, 0].tolist()]).reshape(len(b), 3)
+    ev_th = _ev_thresholds(ths[:, 0:1], ths[:, 1:2], ths[:, 2:3])
+    evs, masks = [], []
+    with np.errstate(invalid='ignore'):
+        for t, (ep, o) in enumerate(zip(probs, b.bet_odds)):
+            ev, ok = _ev_ok(t, ep, o, ev_th[t], P)
+            evs.append(ev); masks.append(ok)
+    return evs, masks, ths
+
+def _ev_thresholds(th2, th3, thw):
+    """_BET_TYPES 順（2連単/2連複/拡連複/3連複）の EV 閾値"""
+    return (th2, th2, thw, th3)
+
+def _ev_ok(t, ep, o, ev_th, P):
+    """券種 t の (EV, 購入可否)。配列でもスカラーでもよい"""
+    ev = ep * o
+    ok = (o <= P.get("max_odds", 80.0)) & (ev >= ev_th) & (ev <= P.get("max_ev", 8.0))
+    ok &= (ep >= P["trifecta_min_prob_combo"]) if t == 3 else (ep > (.05, .05, .15)[t])
+    return ev, ok
 
+# === Main Analysis ===
+def _reasons(b, i, P, s):
+    """発火したαソースを UI 表示用の文字列へ（順序は従来の加算順）"""
+    fired = [m[i].tolist() for _, m in s["comps"]]
+    delta = [d[i].tolist() for d, _ in s["comps"]]
+    rsn = [[] for _ in range(6)]
+    for j in range(6):
+        r = rsn[j]
+        if fired[0][j]:
+            up = P['wall_decay_strong'] if b.void_strong[i, j] else P['wall_decay_weak']
+            r.append(f"VoidExploit(ΔST={b.dst_out[i, j]:.2f}→+{up-1:.2f})")
+        if fired[1][j]: r.append(f"WallDecay(ΔST={b.dst_in[i, j]:.2f}→{P['wall_penalty_strong']-1:+.2f})")
+        if fired[2][j]: r.append(f"WallHalf(ΔST={b.dst_in[i, j]:.2f}→{P['wall_penalty_weak']-1:+.2f})")
+        if fired[3][j]: r.append(f"ExT(z={b.z[i, j]:+.2f}→{delta[3][j]:+.3f})")
+        if fired[4][j]: r.append(f"Mot({b.m2[i, j]:.0f}%→{delta[4][j]:+.3f})")
+        if fired[5][j]: r.append(f"STRev({b.g[i, j]:.2f}→{delta[5][j]:+.3f})")
+        if fired[6][j]: r.append(f"STSlow({b.g[i, j]:.2f}→{delta[6][j]:+.3f})")
+        if fired[7][j]: r.append(f"Wt({b.weight[i, j]:.0f}kg→{delta[7][j]:+.3f})")
+        if fired[8][j]:
+            rc = _CLASS_NAME.get(int(b.cls[i, j]), "A1fav")
+            r.append(f"Class({rc}→{delta[8][j]:+.3f})")
+        if fired[9][j]: r.append(f"CBias(C{int(b.course[i, j])}→{delta[9][j]:+.3f})")
+    for tgt, cno, dl in b.wind_rules[i]:
+        rsn[tgt - 1].append(f"Wind×Tide({b.wind_label[i]}→C{cno}{dl:+.2f})")
+    return rsn
+
+def _targets(b, i, s, P):
+    cands = []
+    ev_th = _ev_thresholds(*s["thresholds"][i].tolist())
+    for t, (bet_type, sep, keys, _) in enumerate(_BET_TYPES):
+        for j in np.flatnonzero(s["ev_mask"][t][i]).tolist():
+            combo = b.bet_combo[t][i].get(j) or sep.join(map(str, keys[j]))
+            cands.append((t, int(b.bet_pos[t][i, j]),
+                          {"type": bet_type, "combo": combo, "prob": float(s["probs"][t][i, j]),
+                           "odds": float(b.bet_odds[t][i, j]), "ev": float(s["ev"][t][i, j])}))
+        # 同じ組番の別表記キーも従来どおりそれぞれ1つの買い目として判定
+        for n, j, combo, o in b.bet_dups[t][i]:
+            ep = float(s["probs"][t][i, j])
+            ev, ok = _ev_ok(t, ep, o, ev_th[t], P)
+            if ok:
+                cands.append((t, n, {"type": bet_type, "combo": combo, "prob": ep, "odds": o, "ev": ev}))
+    cands.sort(key=lambda c: (c[0], c[1]))  # 元dictの出現順 → EV降順（安定ソート）
+    targets = [c[2] for c in cands]
     targets.sort(key=lambda x: x["ev"], reverse=True)
-    targets = targets[:P["max_targets"]]
+    return targets
+
+def _assemble(b, i, s, P, bankroll, params_source):
+    if b.error[i]:
+        return {"error": b.error[i], "boats": [], "targets": [], "summary": {}, "warnings": [], "alpha_matrix": []}
+    with stage("engine.bets"):
+        tmp = s["tmp"][i].tolist(); al = s["alpha"][i].tolist(); pd = s["pd"][i].tolist()
+        rsn = _reasons(b, i, P, s); wd = b.wd[i].tolist()
+        boats = [{"boat": k + 1, "name": b.names[i][k],
+                  "tmp": tmp[k], "alpha": al[k], "post_prob": pd[k],
+                  "wd": wd[k], "reasons": rsn[k]} for k in range(6)]
+        targets = _targets(b, i, s, P)[:P["max_targets"]]
+        am = _alpha_matrix(i, s)
+    with stage("engine.kelly"):
+        result = _kelly(b, i, s, P, bankroll, params_source, boats, targets)
+    result["alpha_matrix"] = am
+    return result
+
+def _alpha_matrix(i, s):
+    """
+    艇 × αソースの加法寄与（6 × len(ALPHA_SOURCES)、列は ALPHA_SOURCES 順、未発火は 0）。
+    alpha_adapter が reasons の文字列を解析せずに発火・方向を読むためのもの（reasons は UI 表示用）
+    """
+    return np.stack([d[i] for d, _ in s["comps"]], axis=-1).tolist()
 
+def _kelly(b, i, s, P, bankroll, params_source, boats, targets):
+    """買い目の Kelly 比率 → 推奨金額（個別/合計キャップ）→ summary"""
     # === [Bug#11修正] Kelly: 正規化なし。kelly_quarterをそのまま比率として使用 ===
     corr_f = _hhi_correlation_penalty(targets)
 
@@ -606,13 +975,15 @@ def analyze(race_data, bankroll=1000, params_override=None, ml_model=None):
         for t in targets:
             t["recommended_yen"] = max(MIN_BET_YEN, round(t["recommended_yen"] * sc / 100) * 100)
 
+    nc = int(b.nc[i, 0]); th2, th3, thw = s["thresholds"][i].tolist()
+    vol = float(b.vol[i, 0]); mt = float(b.mt[i, 0]); tide = b.tide[i]
     cal = {"n_candidates": nc,
            "ev_thresholds": {"2連": round(th2, 3), "3連": round(th3, 3), "拡連複": round(thw, 3)},
            "selection_bias_applied": nc > P["selection_bias_base"],
-           "params_source": "custom" if params_override else ("file" if os.path.exists(PARAMS_FILE) else "default"),
+           "params_source": params_source,
            "correlation_penalty": round(corr_f, 3),
-           "shrinkage_used": round(shrinkage, 3),
-           "n_market_sources": n_sources}
+           "shrinkage_used": round(float(s["shrinkage"][i, 0]), 3),
+           "n_market_sources": int(b.n_sources[i, 0])}
 
     if targets:
         summary = {"count": len(targets), "avg_ev": sum(t["ev"] for t in targets) / len(targets),
@@ -620,7 +991,7 @@ def analyze(race_data, bankroll=1000, params_override=None, ml_model=None):
                    "total_investment": sum(t["recommended_yen"] for t in targets),
                    "verdict": "投資実行", "concentration_mode": False, "top_kelly_ratio": 0,
                    "venue_volatility": vol, "motor_trust": mt, "correlation_factor": corr_f,
-                   "tide_condition": tide, "alpha_sources_active": sum(1 for b in boats if b["reasons"]),
+                   "tide_condition": tide, "alpha_sources_active": sum(1 for x in boats if x["reasons"]),
                    "calibration": cal}
     else:
         summary = {"count": 0, "avg_ev": 0, "max_ev": 0, "max_ev_combo": "",
@@ -629,4 +1000,109 @@ def analyze(race_data, bankroll=1000, params_override=None, ml_model=None):
                    "correlation_factor": 1., "tide_condition": tide, "alpha_sources_active": 0,
                    "calibration": cal}
 
-    return {"error": None, "boats": boats, "targets": targets, "summary": summary, "warnings": warns}
+    return {"error": None, "boats": boats, "targets": targets, "summary": summary, "warnings": list(b.warnings[i])}
+
+def analyze(race_data, bankroll=1000, params_override=None, ml_model=None):
+    """
+    1レースを解析。race_data は dict でも freeze_race() 済みの RaceInput でもよい。
+    入力は変更しない（同じ入力を試行間・スレッド間で使い回せる）
+    """
+    P = get_params(params_override)
+    with stage("engine.features"):
+        inp = freeze_race(race_data)
+        b = RaceBatch([inp])
+    if b.error[0]:
+        return _assemble(b, 0, None, P, bankroll, None)
+    ml_probs = None
+    if ml_model is not None:
+        mp = ml_model.predict_proba(inp.race_data)
+        if mp: ml_probs = {0: mp}
+    s = _score(b, P, ml_probs=ml_probs)
+    return _assemble(b, 0, s, P, bankroll, P.source)
+
+def analyze_batch(races, params_override=None, bankroll=1000, ml_model=None):
+    """
+    複数レースを1回のベクトル演算で解析。戻り値は analyze() と同じ形式の dict のリスト。
+    races: race_data / RaceInput のリスト、または pack_races() 済みの RaceBatch（ML併用時は RaceBatch 不可）
+    """
+    P = get_params(params_override)
+    if isinstance(races, RaceBatch):
+        if ml_model is not None: raise ValueError("ml_model には race_data のリストが必要です")
+        b = races
+    else:
+        with stage("engine.features"):
+            b = pack_races(races)
+    ml_probs = {}
+    if ml_model is not None:
+        for i, rd in enumerate(races):
+            if b.error[i]: continue
+            mp = ml_model.predict_proba(rd.race_data if isinstance(rd, RaceInput) else rd)
+            if mp: ml_probs[i] = mp
+    s = _score(b, P, ml_probs=ml_probs)
+    return [_assemble(b, i, s, P, bankroll, P.source) for i in range(len(b))]
+
+class RaceSession:
+    """
+    締切前のオッズ更新ごとに同じレースを再解析するためのセッション。
+    出走表・展示・環境の特徴量とαの tmp 非依存成分（Class 以外の全ソース）を初回に確定して保持し、
+    update(odds) では TMP → Class(A1) → 事後確率 → Henery/Harville → EV 抽出だけを再計算する。
+    結果は analyze(race_data に同じ odds を入れたもの) と一致する。race_data（dict / RaceInput）は変更しない。
+
+      session = RaceSession(race_data, bankroll=10000)
+      result = session.update(new_odds)
+    """
+
+    def __init__(self, race_data, bankroll=1000, params_override=None, ml_model=None):
+        self.P = get_params(params_override)
+        inp = freeze_race(race_data)
+        self.race_data = inp.race_data
+        self.bankroll = bankroll
+        self.ml_model = ml_model
+        self.source = self.P.source
+        self._base = RaceBatch([inp])
+        self._static = None
+        self.result = None
+
+    def update(self, odds=None):
+        """odds（race_data["odds"] と同じ形式）で再解析。省略時は race_data の odds"""
+        if odds is None: odds = self.race_data.get("odds", {})
+        b = self._base.with_odds([_odds_features(odds)])
+        if b.error[0]:
+            self.result = _assemble(b, 0, None, self.P, self.bankroll, None)
+            return self.result
+        if self._static is None:
+            self._static = _static_components(b, self.P)
+        ml_probs = None
+        if self.ml_model is not None:
+            mp = self.ml_model.predict_proba({**self.race_data, "odds": odds})
+            if mp: ml_probs = {0: mp}
+        s = _score(b, self.P, ml_probs=ml_probs, static=self._static)
+        self.result = _assemble(b, 0, s, self.P, self.bankroll, self.source)
+        return self.result
+
+def sweep_brier(batch, winners, grid):
+    """
+    パラメータグリッドの単勝Brier Scoreを一括計算（αソース → ソフトキャップ → Henery のみ再計算）。
+    batch: pack_races() 済みの RaceBatch（パース等のパラメータ非依存処理は済んでいる）
+    winners: 各レースの1着艇番（長さN）
+    grid: {パラメータ名: 長さTの値列}。指定外のパラメータは get_params() の値を使う
+    Returns: 長さTの Brier Score 配列（error のレースは除外）
+    """
+    T = len(next(iter(grid.values())))
+    P = get_params({k: np.asarray(v, dtype=float).reshape(T, 1, 1) for k, v in grid.items()})
+    pd = _score(batch, P, with_bets=False)["pd"]
+    valid = np.array([e is None for e in batch.error])
+    outcome = np.arange(1, 7) == np.asarray(winners).reshape(-1, 1)
+    sq = ((pd - outcome) ** 2).sum(axis=-1) * valid
+    return np.broadcast_to(sq.sum(axis=-1) / max(valid.sum() * 6, 1), (T,))
+
+def alpha_matrices(batch, params_override=None):
+    """
+    レースごとの艇 × αソースの加法寄与を一括計算（analyze() の alpha_matrix と同じ値。EV・買い目は計算しない）。
+    batch: pack_races() 済みの RaceBatch
+    Returns: (N, 6, len(ALPHA_SOURCES)) 配列（error のレースは 0）
+    """
+    s = _score(batch, get_params(params_override), with_bets=False)
+    m = np.stack([d for d, _ in s["comps"]], axis=-1)
+    m[np.array([e is not None for e in batch.error], dtype=bool)] = 0.
+    return m